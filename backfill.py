@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+回補多個月份的報表：月份範圍分配到多個 worker 同時處理
+每個 worker (本地 process 或 Cloud Run Job task) 各自查詢 BigQuery、整合資料並查詢 NetSuite
+寫入 Report_{year} 前取得該年度的 lease，寫入同一份工作表的 worker 依序執行，不會錯置列號
+用法:
+    python backfill.py --start 202301 --end 202412 --workers 4
+Cloud Run Job (每個 task 依 CLOUD_RUN_TASK_INDEX / CLOUD_RUN_TASK_COUNT 處理自己的月份，LEASE_DIR 需為 gs:// 路徑):
+    gcloud run jobs create referral-backfill --image gcr.io/cloudmile-referral-report/referral-reporter \\
+        --tasks 8 --parallelism 8 --command python --args backfill.py,--start,202301,--end,202412 \\
+        --set-env-vars LEASE_DIR=gs://BUCKET/leases,CHECKPOINT_DIR=gs://BUCKET/checkpoints
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from utils.pipeline import PipelineStopped
+
+# 未設定 LEASE_DIR 時的本地 lease 目錄 (只能排序同一台機器上的 worker)
+DEFAULT_LEASE_DIR = "leases"
+
+def month_range(start: int, end: int) -> list:
+    """
+    start 到 end (含) 的月份 (YYYYMM)
+    """
+    if start > end:
+        raise ValueError(f"Start month {start} is after end month {end}")
+    months = []
+    year, month = divmod(start, 100)
+    while year * 100 + month <= end:
+        months.append(year * 100 + month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def shard_months(months: list, index: int, count: int) -> list:
+    """
+    第 index 個 worker (共 count 個) 負責的月份
+    各年份的月份先交錯排列 (第一年第一個月、第二年第一個月、...) 再輪流分配：
+    同一時間各 worker 處理不同年份，worker 數不超過年份數時寫入不同的 Report_{year}，不需等待 lease
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} out of range for {count} shards")
+    by_year = {}
+    for month in sorted(months):
+        by_year.setdefault(month // 100, []).append(month)
+    ordered = [month for group in itertools.zip_longest(*by_year.values()) for month in group if month]
+    return ordered[index::count]
+
+def task_shard() -> tuple:
+    """
+    Cloud Run Job task 的 (index, count)，本地執行時為 (0, 1)
+    """
+    return int(os.environ.get("CLOUD_RUN_TASK_INDEX", "0")), int(os.environ.get("CLOUD_RUN_TASK_COUNT", "1"))
+
+def run_shard(months: list, force: bool = False, resume: bool = False, lease_dir: str = None,
+              services: dict = None, label: str = "") -> list:
+    """
+    依序處理一個 worker 的月份 (服務只建立一次)，單一月份失敗時繼續下一個月份
+    Returns: [{'month', 'status', 'written', 'rows', 'seconds', 'error'}]
+    """
+    import main
+    from server import WarmServices
+
+    lease_manager = main.create_lease_manager(lease_dir or Config.LEASE_DIR or DEFAULT_LEASE_DIR)
+    warm_services = WarmServices(services, lease_manager=lease_manager)
+    results = []
+
+    for month in months:
+        print(f"\n{label}Backfilling month {month}...", flush=True)
+        started = time.perf_counter()
+        result = {'month': month, 'status': "succeeded", 'written': False, 'rows': 0, 'error': None}
+
+        try:
+            outputs = main.run_pipeline(
+                force=force, resume=resume, data_month=month, services=warm_services.get(),
+                lease_manager=lease_manager, backfill=True
+            )
+            integrated_data = outputs.get('integrated_data')
+            result['written'] = bool(outputs.get('write'))
+            result['rows'] = 0 if integrated_data is None else len(integrated_data)
+        except PipelineStopped as e:
+            result.update(status="stopped", error=str(e))
+        except Exception as e:
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+            print(f"{label}Month {month} failed: {e}", flush=True)
+
+        result['seconds'] = round(time.perf_counter() - started, 2)
+        results.append(result)
+
+    return results
+
+def backfill_shard(index: int, count: int, months: list, force: bool = False,
+                   resume: bool = False, lease_dir: str = None) -> list:
+    """
+    ProcessPoolExecutor 的 worker：處理第 index 個 shard
+    """
+    shard = shard_months(months, index, count)
+    print(f"Shard {index + 1}/{count}: {', '.join(map(str, shard)) or 'no months'}", flush=True)
+    return run_shard(shard, force, resume, lease_dir, label=f"[shard {index + 1}/{count}] ")
+
+def run_backfill(months: list, workers: int = 1, task_index: int = 0, task_count: int = 1,
+                 force: bool = False, resume: bool = False, lease_dir: str = None) -> list:
+    """
+    本 task 的月份再分配給 workers 個本地 process (共 task_count * workers 個 shard)
+    Returns: 各月份的結果 (依月份排序)
+    """
+    count = task_count * workers
+    indexes = [task_index * workers + worker for worker in range(workers)]
+
+    if workers == 1:
+        results = backfill_shard(indexes[0], count, months, force, resume, lease_dir)
+    else:
+        # spawn：每個 process 各自建立 client (gRPC / HTTP 連線不可跨 fork 共用)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(backfill_shard, index, count, months, force, resume, lease_dir)
+                for index in indexes
+            ]
+            results = [result for future in futures for result in future.result()]
+
+    return sorted(results, key=lambda result: result['month'])
+
+def print_summary(results: list, elapsed: float):
+    print("\nBackfill summary:")
+    print(f"  {'month':<8} {'status':<10} {'written':<8} {'rows':>8} {'seconds':>8}")
+    for result in results:
+        print(f"  {result['month']:<8} {result['status']:<10} {str(result['written']):<8} "
+              f"{result['rows']:>8} {result['seconds']:>8.2f}")
+        if result['error']:
+            print(f"    {result['error']}")
+    failed = sum(result['status'] == "failed" for result in results)
+    print(f"  {len(results)} months in {elapsed:.2f}s ({failed} failed)")
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backfill referral reports for a range of months")
+    parser.add_argument('--start', type=int, required=True, help="first month (YYYYMM)")
+    parser.add_argument('--end', type=int, required=True, help="last month (YYYYMM)")
+    parser.add_argument('--workers', type=int, default=1, help="local worker processes per task")
+    parser.add_argument('--force', action='store_true', help="rewrite months whose fingerprint is unchanged")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip stages already checkpointed for each month (requires CHECKPOINT_DIR)")
+    parser.add_argument('--lease-dir', default=None, help="lease directory or gs:// path (default LEASE_DIR)")
+    return parser.parse_args(argv)
+
+def main(argv: list = None):
+    args = parse_args(argv)
+    if args.workers < 1:
+        raise SystemExit("--workers must be at least 1")
+
+    months = month_range(args.start, args.end)
+    task_index, task_count = task_shard()
+    lease_dir = args.lease_dir or Config.LEASE_DIR or DEFAULT_LEASE_DIR
+    if task_count > 1 and not lease_dir.startswith("gs://"):
+        print(f"Warning: lease directory {lease_dir} is local; tasks on other machines are not serialized")
+
+    print(f"Backfilling {len(months)} months ({months[0]}-{months[-1]}): "
+          f"task {task_index + 1}/{task_count}, {args.workers} worker(s), leases in {lease_dir}")
+
+    started = time.perf_counter()
+    # Cloud Run 重試時 main.create_checkpoint_store 會自動 resume
+    results = run_backfill(months, args.workers, task_index, task_count, args.force, args.resume, lease_dir)
+    print_summary(results, time.perf_counter() - started)
+
+    if any(result['status'] == "failed" for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
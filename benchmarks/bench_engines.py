@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+比較 DataProcessor.integrate_data 的 pandas / arrow 引擎效能
+用法: python -m benchmarks.bench_engines --sizes 1000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from benchmarks.synthetic_data import (
+    generate_billing_aggregated,
+    generate_customer_profile,
+    generate_payment_status
+)
+from utils.data_processor import DataProcessor
+
+ENGINES = ["pandas", "arrow"]
+
+def run_engine_benchmark(account_count: int, repeat: int = 3) -> dict:
+    """
+    以 account_count 個帳號測量各引擎的執行時間 (取最佳值)
+    約 10% 帳號只存在於 customer_profile，10% 只存在於 billing_data
+    """
+    overlap_offset = account_count // 10
+    customer_profile = generate_customer_profile(account_count)
+    billing_data = generate_billing_aggregated(account_count, offset=overlap_offset)
+    payment_status = generate_payment_status(customer_profile['billing_account_id'].tolist())
+
+    result = {'accounts': account_count}
+
+    for engine in ENGINES:
+        timings = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            output = DataProcessor.integrate_data(
+                billing_data, customer_profile, payment_status, engine=engine
+            )
+            timings.append(time.perf_counter() - start_time)
+
+        result[engine] = {
+            'best_seconds': round(min(timings), 4),
+            'mean_seconds': round(sum(timings) / len(timings), 4),
+            'output_rows': len(output)
+        }
+
+    result['speedup'] = round(result['pandas']['best_seconds'] / result['arrow']['best_seconds'], 2)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark integrate_data engines")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help="JSON result path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'accounts':>10} {'pandas (s)':>12} {'arrow (s)':>12} {'speedup':>8}")
+
+    for size in args.sizes:
+        result = run_engine_benchmark(size, args.repeat)
+        results.append(result)
+        print(f"{size:>10,} {result['pandas']['best_seconds']:>12.4f} "
+              f"{result['arrow']['best_seconds']:>12.4f} {result['speedup']:>7.2f}x")
+
+    if args.output:
+        report = {
+            'benchmark': 'integrate_data_engines',
+            'timestamp': datetime.now().isoformat(),
+            'cpu_count': os.cpu_count(),
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
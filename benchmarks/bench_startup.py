@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark：在新的 Python process 以 -X importtime 測量進入點的 import 時間
+另外測量服務 client 第一次建立時需要的 import (google.cloud.bigquery / gspread)
+用法: python -m benchmarks.bench_startup --repeat 5 --top 10 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from benchmarks.run_benchmarks import git_revision
+
+TARGETS = {
+    'main': "import main",
+    'check_payment': "import check_payment",
+    'main --help': None,
+    'bigquery client': "import services.clients; import google.cloud.bigquery",
+    'sheets client': "import services.clients; import gspread"
+}
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def repo_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_importtime(stderr: str) -> list:
+    """
+    解析 -X importtime 輸出
+    Returns: [{'module', 'self_us', 'cumulative_us', 'depth'}]
+    """
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': len(match.group(3)) // 2
+            })
+    return modules
+
+def measure(name: str, code: str) -> dict:
+    """
+    在新的 process 執行一次並測量 wall time 與 import 時間
+    """
+    if code is None:
+        command = [sys.executable, "-X", "importtime", "main.py", "--help"]
+    else:
+        command = [sys.executable, "-X", "importtime", "-c", code]
+
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=repo_root(), capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed: {completed.stderr[-500:]}")
+
+    modules = parse_importtime(completed.stderr)
+    return {
+        'seconds': seconds,
+        'import_seconds': sum(m['self_us'] for m in modules) / 1e6,
+        'modules': modules
+    }
+
+def run_target(name: str, code: str, repeat: int, top: int) -> dict:
+    runs = [measure(name, code) for _ in range(repeat)]
+    fastest = min(runs, key=lambda run: run['seconds'])
+    top_modules = sorted(
+        (m for m in fastest['modules'] if m['depth'] <= 1),
+        key=lambda m: m['cumulative_us'], reverse=True
+    )[:top]
+    return {
+        'target': name,
+        'seconds_median': statistics.median(run['seconds'] for run in runs),
+        'seconds_min': fastest['seconds'],
+        'import_seconds': fastest['import_seconds'],
+        'module_count': len(fastest['modules']),
+        'top_modules': [
+            {'module': m['module'], 'cumulative_ms': m['cumulative_us'] / 1000} for m in top_modules
+        ]
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Cold start import-time benchmark")
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="slowest top-level imports to list per target")
+    parser.add_argument('--output', default=None, help="JSON result path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'target':>16} {'median (s)':>11} {'min (s)':>9} {'imports (s)':>12} {'modules':>8}")
+    for name in args.targets:
+        result = run_target(name, TARGETS[name], args.repeat, args.top)
+        results.append(result)
+        print(f"{name:>16} {result['seconds_median']:>11.3f} {result['seconds_min']:>9.3f} "
+              f"{result['import_seconds']:>12.3f} {result['module_count']:>8,}")
+        for module in result['top_modules']:
+            print(f"{'':>18}{module['cumulative_ms']:>9.1f} ms  {module['module']}")
+
+    if args.output:
+        report = {
+            'benchmark': 'startup',
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,618 @@
+"""
+BigQuery client / NetSuite RESTlet / gspread 的 in-memory 替代品
+用於離線 benchmark 與 API 呼叫次數測試，每個 fake 都會記錄呼叫次數
+"""
+
+import json
+import re
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+import gspread
+import pandas as pd
+from config import Config
+from services import clients
+
+# ---------------------------------------------------------------------------
+# BigQuery
+# ---------------------------------------------------------------------------
+
+class FakeRow(dict):
+    """
+    BigQuery Row：可用屬性或 key 取值
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class FakeRowIterator:
+    def __init__(self, df: pd.DataFrame, page_size: int = None):
+        self._df = df
+        self._page_size = page_size or max(len(df), 1)
+        self.total_rows = len(df)
+
+    def __iter__(self):
+        for record in self._df.to_dict('records'):
+            yield FakeRow(record)
+
+    def to_dataframe(self, *args, **kwargs) -> pd.DataFrame:
+        return self._df.copy()
+
+    def to_dataframe_iterable(self, *args, **kwargs):
+        for start in range(0, len(self._df), self._page_size):
+            yield self._df.iloc[start:start + self._page_size].reset_index(drop=True)
+
+class FakeQueryJob:
+    def __init__(self, df: pd.DataFrame, dry_run: bool = False):
+        self._df = df
+        self.state = 'DONE'
+        self.job_id = uuid.uuid4().hex
+        self.cache_hit = False
+        self.total_bytes_processed = int(df.memory_usage(deep=False).sum()) if not df.empty else 0
+
+    def reload(self):
+        pass
+
+    def result(self, timeout=None, page_size=None, **kwargs) -> FakeRowIterator:
+        return FakeRowIterator(self._df, page_size)
+
+# pandas dtype.kind 對應的 BigQuery 欄位型別
+FIELD_TYPES = {'i': "INTEGER", 'u': "INTEGER", 'f': "FLOAT", 'b': "BOOLEAN"}
+
+class FakeTable:
+    def __init__(self, table_id: str, df: pd.DataFrame, partitioned: bool = False):
+        self.table_id = table_id.split('.')[-1]
+        self.full_table_id = table_id
+        self.num_rows = len(df)
+        self.num_bytes = int(df.memory_usage(deep=True).sum()) if not df.empty else 0
+        self.modified = datetime(2025, 6, 5, tzinfo=timezone.utc)
+        self.schema = [
+            SimpleNamespace(name=column, field_type=FIELD_TYPES.get(df[column].dtype.kind, "STRING"))
+            for column in df.columns
+        ]
+        self.time_partitioning = None
+        self.range_partitioning = SimpleNamespace(field="month") if partitioned else None
+        self.clustering_fields = ["billing_account_id"] if partitioned else None
+
+class FakeBigQueryClient:
+    """
+    依 SQL 內容回傳 billing_data / customer_profile 的查詢結果
+    billing_raw: 原始 billing_data (串流模式使用)，未提供時由聚合資料推得
+    partitioned: 依 month 分區的表格 (分區 metadata 依月份回傳，dry run 只計算該月份)；
+        未分區的表格 dry run 計算整個表格，以 ALTER TABLE {table}_partitioned RENAME TO {table} 換上分區表
+    """
+
+    def __init__(self, billing_aggregated: pd.DataFrame, customer_profile: pd.DataFrame,
+                 billing_raw: pd.DataFrame = None,
+                 partitioned: tuple = (Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE)):
+        self.billing_aggregated = billing_aggregated
+        self.customer_profile = customer_profile
+        self.billing_raw = billing_raw
+        self.partitioned = set(partitioned)
+        self.calls = Counter()
+        self.queries = []
+
+    def query(self, query: str, job_config=None, **kwargs) -> FakeQueryJob:
+        self.calls['query'] += 1
+        self.queries.append(query)
+        dry_run = bool(getattr(job_config, 'dry_run', False))
+        job = FakeQueryJob(self._answer(query), dry_run)
+
+        table_name = self._table_name(query)
+        if dry_run and table_name not in self.partitioned:
+            job.total_bytes_processed = self._bytes(self._table(table_name))
+        return job
+
+    def get_table(self, table_ref) -> FakeTable:
+        self.calls['get_table'] += 1
+        table_id = str(table_ref)
+        table_name = self._table_name(table_id)
+        partitioned = table_name in self.partitioned or table_id.endswith("_partitioned")
+        return FakeTable(table_id, self._table(table_name), partitioned)
+
+    @staticmethod
+    def _table_name(text: str) -> str:
+        return Config.CUSTOMER_PROFILE_TABLE if Config.CUSTOMER_PROFILE_TABLE in text else Config.BILLING_DATA_TABLE
+
+    def _table(self, table_name: str) -> pd.DataFrame:
+        return self.customer_profile if table_name == Config.CUSTOMER_PROFILE_TABLE else self._billing_rows()
+
+    @staticmethod
+    def _bytes(df: pd.DataFrame) -> int:
+        return int(df.memory_usage(deep=False).sum()) if not df.empty else 0
+
+    def _billing_rows(self) -> pd.DataFrame:
+        return self.billing_raw if self.billing_raw is not None else self.billing_aggregated
+
+    def _answer(self, query: str) -> pd.DataFrame:
+        month_match = re.search(r'month\s*=\s*(\d{6})', query)
+        month = int(month_match.group(1)) if month_match else None
+        is_customer = Config.CUSTOMER_PROFILE_TABLE in query
+
+        if query.lstrip().startswith(('CREATE', 'ALTER', 'DROP')):
+            return self._run_ddl(query)
+
+        if 'INFORMATION_SCHEMA.PARTITIONS' in query:
+            return self._partitions(self._table_name(query), 'latest_month' in query)
+
+        if 'MAX(month)' in query:
+            source = self.customer_profile if is_customer else self._billing_rows()
+            latest = source['month'].max() if not source.empty else None
+            return pd.DataFrame({'latest_month': [latest]})
+
+        if 'as row_count' in query:
+            return pd.DataFrame({'row_count': [len(self._billing_rows())]})
+
+        if 'COUNT(*) as count' in query:
+            source = self.customer_profile if is_customer else self._billing_rows()
+            return pd.DataFrame({'count': [int((source['month'] == month).sum()) if not source.empty else 0]})
+
+        if is_customer:
+            return self._filter_month(self.customer_profile, month)
+
+        if 'SUM(cost)' in query:
+            return self._filter_month(self.billing_aggregated, month)
+
+        if 'credits' in query and self.billing_raw is not None:
+            return self._filter_month(self.billing_raw, month)
+
+        return self._filter_month(self.billing_aggregated, month)
+
+    def _partitions(self, table_name: str, latest: bool) -> pd.DataFrame:
+        """
+        INFORMATION_SCHEMA.PARTITIONS：分區表每個月份一列，未分區的表格只有一個 NULL 分區
+        """
+        df = self._table(table_name)
+        if table_name not in self.partitioned or df.empty:
+            partitions = pd.DataFrame({
+                'partition_id': [None], 'total_rows': [len(df)], 'total_logical_bytes': [self._bytes(df)]
+            })
+        else:
+            months = sorted(df['month'].unique())
+            partitions = pd.DataFrame({
+                'partition_id': [str(month) for month in months],
+                'total_rows': [int((df['month'] == month).sum()) for month in months],
+                'total_logical_bytes': [self._bytes(self._filter_month(df, month)) for month in months]
+            })
+
+        if latest:
+            ids = pd.to_numeric(partitions['partition_id'], errors='coerce')
+            return pd.DataFrame({'latest_month': [ids.max() if ids.notna().any() else None]})
+        return partitions
+
+    def _run_ddl(self, query: str) -> pd.DataFrame:
+        # ALTER TABLE `...{table}_partitioned` RENAME TO `{table}`：換上分區表
+        rename = re.search(r'(\w+)_partitioned`\s+RENAME TO\s+`?(\w+)`?', query)
+        if rename and rename.group(1) == rename.group(2):
+            self.partitioned.add(rename.group(2))
+        return pd.DataFrame()
+
+    @staticmethod
+    def _filter_month(df: pd.DataFrame, month: int) -> pd.DataFrame:
+        if df.empty or month is None:
+            return df
+        return df[df['month'] == month].reset_index(drop=True)
+
+# ---------------------------------------------------------------------------
+# NetSuite RESTlet
+# ---------------------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, payload: dict, status_code: int = 200):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode()
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakeNetSuiteTransport:
+    """
+    取代 requests.Session.get：依 billing_account_ids 回傳 data[] 格式的發票資料
+    statuses: {billing_account_id: NetSuite payment_status ("Open" / "Paid In Full")}
+    """
+
+    def __init__(self, statuses: dict, invoice_size: int = 5):
+        self.statuses = statuses
+        self.invoice_size = invoice_size
+        self.calls = 0
+        self.requested_ids = 0
+
+    def __call__(self, url, params=None, **kwargs) -> FakeResponse:
+        self.calls += 1
+        ids = [i for i in (params or {}).get('billing_account_ids', '').split(',') if i]
+        self.requested_ids += len(ids)
+
+        # 同一狀態的帳號每 invoice_size 個合併為一張發票
+        by_status = {}
+        for billing_account_id in ids:
+            status = self.statuses.get(billing_account_id)
+            if status is not None:
+                by_status.setdefault(status, []).append(billing_account_id)
+
+        invoices = []
+        for status, status_ids in by_status.items():
+            for start in range(0, len(status_ids), self.invoice_size):
+                invoices.append({
+                    'invoice_number': f"IV-{len(invoices) + 1:09d}",
+                    'invoice_date': datetime.now().strftime('%Y/%m/%d'),
+                    'payment_status': status,
+                    'items': status_ids[start:start + self.invoice_size]
+                })
+
+        return FakeResponse({'data': invoices})
+
+    # requests.Session 介面
+    def get(self, url, params=None, **kwargs) -> FakeResponse:
+        return self(url, params=params, **kwargs)
+
+# ---------------------------------------------------------------------------
+# gspread
+# ---------------------------------------------------------------------------
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter.upper()) - 64)
+    return index
+
+def parse_a1_range(a1: str) -> tuple:
+    """
+    解析 A1 範圍 ('A2:J10'、'D5'、'A:J'、'Sheet!A1:B2')
+    Returns: (start_row, start_col, end_row, end_col)，欄/列皆從 1 開始，None 代表不限
+    """
+    if '!' in a1:
+        a1 = a1.split('!', 1)[1]
+    parts = a1.split(':')
+
+    def parse(part):
+        match = re.match(r'^([A-Za-z]*)(\d*)$', part)
+        letters, digits = match.groups()
+        return (int(digits) if digits else None, _column_index(letters) if letters else None)
+
+    start_row, start_col = parse(parts[0])
+    end_row, end_col = parse(parts[-1])
+    return start_row, start_col, end_row, end_col
+
+class FakeWorksheet:
+    """
+    gspread.Worksheet 的 in-memory 版本，calls 記錄每個 API 方法的呼叫次數
+    """
+
+    def __init__(self, spreadsheet, title: str, sheet_id: int, rows: list = None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = [list(row) for row in (rows or [])]
+        self.formats = []
+        self.calls = Counter()
+
+    def _count(self, method: str):
+        self.calls[method] += 1
+        self.spreadsheet.calls[f"worksheet.{method}"] += 1
+
+    @staticmethod
+    def _store(value):
+        # USER_ENTERED 的前置單引號只代表文字格式
+        if isinstance(value, str) and value.startswith("'"):
+            return value[1:]
+        return value
+
+    @staticmethod
+    def _render(value, unformatted: bool):
+        if unformatted:
+            return value
+        return '' if value is None else str(value)
+
+    def _ensure_size(self, row_count: int, col_count: int = 0):
+        while len(self.rows) < row_count:
+            self.rows.append([])
+        # 只補齊最後一列的欄數 (寫入時逐列補齊，避免每次掃描整張工作表)
+        if col_count and row_count and len(self.rows[row_count - 1]) < col_count:
+            self.rows[row_count - 1].extend([''] * (col_count - len(self.rows[row_count - 1])))
+
+    def _write(self, a1: str, values: list):
+        start_row, start_col, _, _ = parse_a1_range(a1)
+        start_row = start_row or 1
+        start_col = start_col or 1
+        for r, row_values in enumerate(values):
+            row_index = start_row + r
+            self._ensure_size(row_index, start_col + len(row_values) - 1)
+            for c, value in enumerate(row_values):
+                self.rows[row_index - 1][start_col - 1 + c] = self._store(value)
+
+    def _trim(self, row: list) -> list:
+        row = list(row)
+        while row and row[-1] in ('', None):
+            row.pop()
+        return row
+
+    # 讀取 -------------------------------------------------------------------
+
+    def get_all_values(self, range_name=None, value_render_option=None, **kwargs) -> list:
+        self._count('get_all_values')
+        return self._values(value_render_option)
+
+    def get_values(self, range_name=None, value_render_option=None, **kwargs) -> list:
+        self._count('get_values')
+        return self._values(value_render_option)
+
+    def _values(self, value_render_option=None) -> list:
+        unformatted = str(value_render_option).upper().endswith('UNFORMATTED_VALUE')
+        width = max((len(self._trim(row)) for row in self.rows), default=0)
+        last = len(self.rows)
+        while last > 0 and not self._trim(self.rows[last - 1]):
+            last -= 1
+        return [
+            [self._render(v, unformatted) for v in (row + [''] * (width - len(row)))[:width]]
+            for row in self.rows[:last]
+        ]
+
+    def row_values(self, row: int, **kwargs) -> list:
+        self._count('row_values')
+        if row > len(self.rows):
+            return []
+        return [self._render(v, False) for v in self._trim(self.rows[row - 1])]
+
+    # 寫入 -------------------------------------------------------------------
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self._count('update')
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self._write(range_name or 'A1', values)
+        return {}
+
+    def batch_update(self, data, **kwargs):
+        self._count('batch_update')
+        for entry in data:
+            self._write(entry['range'], entry['values'])
+        return {}
+
+    def insert_row(self, values, index: int = 1, **kwargs):
+        self._count('insert_row')
+        self._ensure_size(index - 1)
+        self.rows.insert(index - 1, [self._store(v) for v in values])
+        return {}
+
+    def insert_rows(self, values, row: int = 1, **kwargs):
+        self._count('insert_rows')
+        self._ensure_size(row - 1)
+        for offset, row_values in enumerate(values):
+            self.rows.insert(row - 1 + offset, [self._store(v) for v in row_values])
+        return {}
+
+    def append_rows(self, values, **kwargs):
+        self._count('append_rows')
+        for row_values in values:
+            self.rows.append([self._store(v) for v in row_values])
+        return {}
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        self._count('delete_rows')
+        end_index = end_index or start_index
+        del self.rows[start_index - 1:end_index]
+        return {}
+
+    def format(self, ranges, format):
+        self._count('format')
+        self.formats.append((ranges, format))
+        return {}
+
+    def batch_format(self, formats):
+        self._count('batch_format')
+        self.formats.extend((f['range'], f['format']) for f in formats)
+        return {}
+
+class FakeSpreadsheet:
+    """
+    gspread.Spreadsheet 的 in-memory 版本
+    calls 記錄整份試算表 (含所有工作表) 的 API 呼叫次數
+    """
+
+    def __init__(self, spreadsheet_id: str = None, title: str = "Referral report"):
+        self.id = spreadsheet_id or Config.SHEETS_FILE_ID
+        self.title = title
+        self.calls = Counter()
+        self.developer_metadata = {}
+        self.batch_requests = []
+        self._worksheets = []
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+        self.batch_requests.clear()
+        for worksheet in self._worksheets:
+            worksheet.calls.clear()
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.calls['worksheet'] += 1
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.WorksheetNotFound(title)
+
+    def worksheets(self, *args, **kwargs) -> list:
+        self.calls['worksheets'] += 1
+        return list(self._worksheets)
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, index: int = None) -> FakeWorksheet:
+        self.calls['add_worksheet'] += 1
+        return self.create_worksheet(title)
+
+    def create_worksheet(self, title: str, rows: list = None) -> FakeWorksheet:
+        """
+        建立工作表 (測試資料準備用，不計入 API 呼叫)
+        """
+        worksheet = FakeWorksheet(self, title, len(self._worksheets) + 1, rows)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    def update_title(self, title: str):
+        self.calls['update_title'] += 1
+        self.title = title
+
+    def fetch_sheet_metadata(self, params=None) -> dict:
+        self.calls['fetch_sheet_metadata'] += 1
+        return {
+            'properties': {'title': self.title},
+            'sheets': [
+                {'properties': {'sheetId': ws.id, 'title': ws.title,
+                                'gridProperties': {'rowCount': len(ws.rows)}}}
+                for ws in self._worksheets
+            ],
+            'developerMetadata': [
+                {'metadataKey': key, 'metadataValue': value}
+                for key, value in self.developer_metadata.items()
+            ]
+        }
+
+    def values_batch_get(self, ranges, params=None) -> dict:
+        self.calls['values_batch_get'] += 1
+        unformatted = (params or {}).get('valueRenderOption') == 'UNFORMATTED_VALUE'
+        value_ranges = []
+        for a1 in ranges:
+            title = a1.split('!', 1)[0].strip("'")
+            worksheet = next(ws for ws in self._worksheets if ws.title == title)
+            value_ranges.append({
+                'range': a1,
+                'values': worksheet._values('UNFORMATTED_VALUE' if unformatted else None)
+            })
+        return {'valueRanges': value_ranges}
+
+    def values_batch_update(self, body=None) -> dict:
+        self.calls['values_batch_update'] += 1
+        for entry in (body or {}).get('data', []):
+            title = entry['range'].split('!', 1)[0].strip("'")
+            worksheet = next(ws for ws in self._worksheets if ws.title == title)
+            worksheet._write(entry['range'], entry['values'])
+        return {}
+
+    def batch_update(self, body) -> dict:
+        """
+        支援 deleteDimension / insertDimension / updateCells / repeatCell 與 developer metadata 請求
+        """
+        self.calls['batch_update'] += 1
+        for request in body.get('requests', []):
+            self.batch_requests.append(request)
+            self._apply_request(request)
+        return {'replies': []}
+
+    def _sheet_by_id(self, sheet_id: int) -> FakeWorksheet:
+        return next(ws for ws in self._worksheets if ws.id == sheet_id)
+
+    def _apply_request(self, request: dict):
+        if 'deleteDimension' in request:
+            grid = request['deleteDimension']['range']
+            worksheet = self._sheet_by_id(grid['sheetId'])
+            del worksheet.rows[grid['startIndex']:grid['endIndex']]
+
+        elif 'insertDimension' in request:
+            grid = request['insertDimension']['range']
+            worksheet = self._sheet_by_id(grid['sheetId'])
+            worksheet._ensure_size(grid['startIndex'])
+            for _ in range(grid['endIndex'] - grid['startIndex']):
+                worksheet.rows.insert(grid['startIndex'], [])
+
+        elif 'updateCells' in request:
+            update = request['updateCells']
+            start = update['start']
+            worksheet = self._sheet_by_id(start['sheetId'])
+            for r, row in enumerate(update.get('rows', [])):
+                values = [self._cell_value(cell) for cell in row.get('values', [])]
+                row_index = start['rowIndex'] + r
+                worksheet._ensure_size(row_index + 1, start.get('columnIndex', 0) + len(values))
+                for c, value in enumerate(values):
+                    if value is not _SKIP:
+                        worksheet.rows[row_index][start.get('columnIndex', 0) + c] = value
+
+        elif 'repeatCell' in request:
+            grid = request['repeatCell']['range']
+            worksheet = self._sheet_by_id(grid['sheetId'])
+            worksheet.formats.append((grid, request['repeatCell'].get('cell', {})))
+
+        elif 'createDeveloperMetadata' in request:
+            metadata = request['createDeveloperMetadata']['developerMetadata']
+            self.developer_metadata[metadata['metadataKey']] = metadata['metadataValue']
+
+        elif 'deleteDeveloperMetadata' in request:
+            lookup = request['deleteDeveloperMetadata']['dataFilter']['developerMetadataLookup']
+            self.developer_metadata.pop(lookup.get('metadataKey'), None)
+
+    @staticmethod
+    def _cell_value(cell: dict):
+        value = cell.get('userEnteredValue')
+        if value is None:
+            return _SKIP if 'userEnteredFormat' in cell and len(cell) == 1 else ''
+        if 'numberValue' in value:
+            return value['numberValue']
+        if 'boolValue' in value:
+            return value['boolValue']
+        return value.get('stringValue', '')
+
+_SKIP = object()
+
+class FakeGspreadClient:
+    def __init__(self, spreadsheets: dict):
+        self.spreadsheets = spreadsheets
+        self.calls = Counter()
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.calls['open_by_key'] += 1
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(key)
+        return self.spreadsheets[key]
+
+# ---------------------------------------------------------------------------
+# 以 fake 取代外部服務
+# ---------------------------------------------------------------------------
+
+class FakeEnvironment:
+    """
+    集合所有 fake，供 benchmark 與測試檢查呼叫次數
+    """
+
+    def __init__(self, bigquery_client: FakeBigQueryClient, netsuite: FakeNetSuiteTransport,
+                 spreadsheet: FakeSpreadsheet = None):
+        self.bigquery = bigquery_client
+        self.netsuite = netsuite
+        self.spreadsheet = spreadsheet or FakeSpreadsheet()
+        self.gspread_client = FakeGspreadClient({self.spreadsheet.id: self.spreadsheet})
+        # credentials 讀取、BigQuery client 與 gspread authorize 的建立次數
+        self.connections = Counter()
+
+    def connect(self, kind: str, client=None):
+        """
+        回傳計數用的 side_effect：每次建立 kind 時加 1 並回傳 client
+        """
+        def create(*args, **kwargs):
+            self.connections[kind] += 1
+            return client if client is not None else mock.MagicMock()
+        return create
+
+@contextmanager
+def fake_services(environment: FakeEnvironment):
+    """
+    在 context 內以 fake 取代 BigQuery client、gspread 與 NetSuite HTTP 呼叫
+    """
+    # client 由 services.clients 共用，進出 context 時清除以免 fake 洩漏到其他測試
+    clients.reset()
+    try:
+        with mock.patch('google.oauth2.service_account.Credentials.from_service_account_file',
+                        side_effect=environment.connect('credentials')), \
+                mock.patch('google.cloud.bigquery.Client',
+                           side_effect=environment.connect('bigquery', environment.bigquery)), \
+                mock.patch('gspread.authorize', side_effect=environment.connect('gspread', environment.gspread_client)), \
+                mock.patch('requests.Session.get', side_effect=environment.netsuite):
+            yield environment
+    finally:
+        clients.reset()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+離線端對端 benchmark：以 in-memory fake 取代 BigQuery / NetSuite / Google Sheets
+測量 main.main() 與 check_payment.check_and_update_payment_status 的執行時間與 API 呼叫次數
+用法: python -m benchmarks.run_benchmarks --sizes 100 10000 100000 --output results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+from unittest import mock
+import pandas as pd
+from benchmarks.fakes import (
+    FakeBigQueryClient,
+    FakeEnvironment,
+    FakeNetSuiteTransport,
+    FakeSpreadsheet,
+    fake_services
+)
+from benchmarks.synthetic_data import (
+    generate_billing_aggregated,
+    generate_billing_raw,
+    generate_customer_profile,
+    generate_netsuite_statuses,
+    generate_report_rows
+)
+from config import Config
+from utils.telemetry import telemetry
+import check_payment
+import main
+
+DATA_MONTH = 202506
+
+def build_environment(account_count: int, history_months: int = 2, billing_mode: str = "aggregated",
+                      month: int = DATA_MONTH) -> FakeEnvironment:
+    """
+    建立 account_count 個帳號的 fake 環境
+    工作表已有前 history_months 個月份的報表 (約半數為 "waiting")
+    """
+    months = [month - offset for offset in range(history_months, -1, -1)]
+    overlap_offset = account_count // 10
+
+    customer_profile = pd.concat(
+        [generate_customer_profile(account_count, m, seed=m) for m in months],
+        ignore_index=True
+    )
+    billing_aggregated = generate_billing_aggregated(account_count, month, offset=overlap_offset)
+    billing_raw = None
+    if billing_mode == "streaming":
+        billing_raw = generate_billing_raw(account_count, month=month, offset=overlap_offset)
+
+    history = customer_profile[customer_profile['month'] != month]
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet(
+        Config.SHEET_NAME_FORMAT.format(year=month // 100),
+        generate_report_rows(history)
+    )
+
+    ids = customer_profile['billing_account_id'].unique().tolist()
+    return FakeEnvironment(
+        FakeBigQueryClient(billing_aggregated, customer_profile, billing_raw),
+        FakeNetSuiteTransport(generate_netsuite_statuses(ids)),
+        spreadsheet
+    )
+
+def api_calls(environment: FakeEnvironment) -> dict:
+    return {
+        'bigquery': sum(environment.bigquery.calls.values()),
+        'netsuite': environment.netsuite.calls,
+        'sheets': environment.spreadsheet.total_calls,
+        'sheets_by_method': dict(environment.spreadsheet.calls)
+    }
+
+def time_run(environment: FakeEnvironment, func, *args) -> dict:
+    """
+    在 fake 環境中執行 func，記錄時間、API 呼叫次數與各 span 的彙總
+    """
+    telemetry.spans.clear()
+    output = io.StringIO()
+
+    with fake_services(environment), contextlib.redirect_stdout(output):
+        start_time = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start_time
+
+    return {
+        'seconds': round(elapsed, 4),
+        'api_calls': api_calls(environment),
+        'spans': [
+            {key: span[key] for key in ('name', 'count', 'total_ms')}
+            for span in telemetry.summary()[:10]
+        ]
+    }
+
+def run_size(account_count: int, history_months: int, billing_mode: str) -> dict:
+    """
+    對一個帳號數量分別測量每月報表與付款狀態檢查 (各自使用新的 fake 環境)
+    """
+    result = {'accounts': account_count}
+
+    environment = build_environment(account_count, history_months, billing_mode)
+    result['main'] = time_run(environment, main.main, [])
+
+    environment = build_environment(account_count, history_months, billing_mode)
+    result['check_payment'] = time_run(
+        environment, check_payment.check_and_update_payment_status, DATA_MONTH // 100
+    )
+    return result
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--history-months', type=int, default=2,
+                        help="months already in the sheet before the run")
+    parser.add_argument('--billing-mode', choices=["aggregated", "streaming"], default="aggregated")
+    parser.add_argument('--output', default=None, help="JSON result path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'accounts':>10} {'main (s)':>10} {'check (s)':>10} {'sheets calls':>13} {'netsuite calls':>15}")
+
+    # 不寫 checkpoint / run report，不輸出每個 span 的 log
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'RUN_REPORT_PATH', ''), \
+            mock.patch.object(Config, 'BILLING_MODE', args.billing_mode), \
+            mock.patch.object(telemetry, 'log_spans', False):
+        for size in args.sizes:
+            result = run_size(size, args.history_months, args.billing_mode)
+            results.append(result)
+            sheets_calls = result['main']['api_calls']['sheets'] + result['check_payment']['api_calls']['sheets']
+            netsuite_calls = result['main']['api_calls']['netsuite'] + result['check_payment']['api_calls']['netsuite']
+            print(f"{size:>10,} {result['main']['seconds']:>10.3f} {result['check_payment']['seconds']:>10.3f} "
+                  f"{sheets_calls:>13,} {netsuite_calls:>15,}")
+
+    if args.output:
+        report = {
+            'benchmark': 'end_to_end',
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'billing_mode': args.billing_mode,
+            'history_months': args.history_months,
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main_cli()
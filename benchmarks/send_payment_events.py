@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+本地事件產生器：產生發票狀態變更事件並送到 server.py 的 POST /payment-events
+用法: python -m benchmarks.send_payment_events --url http://127.0.0.1:8080 --accounts 1000 --months 202504 202505
+"""
+
+import argparse
+import json
+import time
+import urllib.request
+import pandas as pd
+from benchmarks.synthetic_data import generate_customer_profile, generate_payment_events
+from config import Config
+
+def post_events(url: str, payload: dict, token: str = "") -> dict:
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/payment-events",
+        data=json.dumps(payload).encode(),
+        headers={'Content-Type': 'application/json', 'X-Push-Token': token},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Send synthetic invoice status change events")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{Config.SERVER_PORT}")
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--months', type=int, nargs='+', default=[202505])
+    parser.add_argument('--change-ratio', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=20, help="invoices per request")
+    parser.add_argument('--token', default=Config.PUSH_SHARED_SECRET)
+    args = parser.parse_args()
+
+    customer_profile = pd.concat(
+        [generate_customer_profile(args.accounts, month, seed=month) for month in args.months],
+        ignore_index=True
+    )
+    invoices = generate_payment_events(customer_profile, args.change_ratio)['data']
+
+    summary = {}
+    start = time.perf_counter()
+    for offset in range(0, len(invoices), args.batch_size):
+        summary = post_events(args.url, {'data': invoices[offset:offset + args.batch_size]}, args.token)
+    elapsed = time.perf_counter() - start
+
+    print(f"Sent {len(invoices)} invoices in {elapsed:.2f}s; last response: {summary}")
+
+if __name__ == "__main__":
+    main_cli()
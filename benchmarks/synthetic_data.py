@@ -0,0 +1,176 @@
+"""
+產生與 BigQuery billing_data / customer_profile 相同結構的測試資料
+"""
+
+import numpy as np
+import pandas as pd
+from config import Config
+
+def billing_account_id(index: int) -> str:
+    """
+    產生 billing_account_id (XXXXXX-XXXXXX-XXXXXX 格式)
+    """
+    return f"{index:06X}-{(index * 7919) % 0xFFFFFF:06X}-{(index * 104729) % 0xFFFFFF:06X}"
+
+def generate_customer_profile(account_count: int, month: int = 202506,
+                              seed: int = 0, missing_ratio: float = 0.05) -> pd.DataFrame:
+    """
+    產生 customer_profile
+    missing_ratio: 部分欄位為 null 的比例
+    """
+    rng = np.random.default_rng(seed)
+    ids = [billing_account_id(i) for i in range(account_count)]
+
+    rates = rng.choice([0.05, 0.1, 0.15, 0.2], size=account_count)
+    rates = np.where(rng.random(account_count) < missing_ratio, np.nan, rates)
+
+    salesrep = rng.choice(['Alice', 'Bob', 'Carol', 'Dave'], size=account_count).astype(object)
+    salesrep[rng.random(account_count) < missing_ratio] = None
+
+    edp_type = rng.choice(['EDP', 'Non-EDP'], size=account_count).astype(object)
+    edp_type[rng.random(account_count) < 0.5] = None
+
+    return pd.DataFrame({
+        'customer': [f"Customer {i}" for i in range(account_count)],
+        'service_set': rng.choice(['GCP', 'GWS'], size=account_count),
+        'salesrep': salesrep,
+        'commission': rng.choice([0.0, 0.01, 0.02], size=account_count),
+        'billing_account_id': ids,
+        'billing_account_name': [f"Account-{i}" for i in range(account_count)],
+        'referral_company': rng.choice(['Partner A', 'Partner B', 'Partner C'], size=account_count),
+        'referral_share_rate': rates,
+        'month': np.full(account_count, month, dtype=np.int64),
+        'edp_type': edp_type
+    })
+
+def generate_billing_aggregated(account_count: int, month: int = 202506, seed: int = 1,
+                                offset: int = 0) -> pd.DataFrame:
+    """
+    產生 BigQueryService.get_billing_data_optimized 格式的聚合 billing_data
+    offset: billing_account_id 起始編號 (用來製造只存在於一邊的帳號)
+    """
+    rng = np.random.default_rng(seed)
+    total_cost = np.round(rng.gamma(2.0, 500.0, size=account_count), 2)
+    total_credits = -np.round(total_cost * rng.choice([0.0, 0.05, 0.1], size=account_count), 2)
+
+    return pd.DataFrame({
+        'billing_account_id': [billing_account_id(i) for i in range(offset, offset + account_count)],
+        'currency': rng.choice(['USD', 'TWD'], size=account_count),
+        'total_cost': total_cost,
+        'total_credits': total_credits,
+        'month': np.full(account_count, month, dtype=np.int64),
+        'record_count': rng.integers(1, 500, size=account_count),
+        'spending': total_cost + total_credits
+    })
+
+def generate_billing_raw(account_count: int, rows_per_account: int = 10, month: int = 202506,
+                         seed: int = 2, offset: int = 0) -> pd.DataFrame:
+    """
+    產生原始 (未聚合) billing_data，credits 為 list<struct<name, amount>>
+    """
+    rng = np.random.default_rng(seed)
+    row_count = account_count * rows_per_account
+    account_index = np.repeat(np.arange(offset, offset + account_count), rows_per_account)
+    ids = np.array([billing_account_id(i) for i in range(offset, offset + account_count)], dtype=object)
+    currencies = rng.choice(['USD', 'TWD'], size=account_count)
+
+    cost = np.round(rng.gamma(1.5, 20.0, size=row_count), 4)
+    credit_counts = rng.integers(0, 3, size=row_count)
+    credits = [
+        [{'name': 'promotion', 'amount': -round(c * 0.1, 4)}] * int(n)
+        for c, n in zip(cost, credit_counts)
+    ]
+
+    return pd.DataFrame({
+        'billing_account_id': ids[account_index - offset],
+        'currency': currencies[account_index - offset],
+        'cost': cost,
+        'credits': credits,
+        'month': np.full(row_count, month, dtype=np.int64)
+    })
+
+def generate_payment_status(billing_account_ids: list, seed: int = 3) -> dict:
+    """
+    產生 NetSuiteService.get_invoice_payment_status 格式的付款狀態
+    """
+    rng = np.random.default_rng(seed)
+    statuses = [
+        Config.PAYMENT_STATUS_MAPPING["Open"],
+        Config.PAYMENT_STATUS_MAPPING["Paid In Full"],
+        Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"]
+    ]
+    choices = rng.choice(len(statuses), size=len(billing_account_ids), p=[0.5, 0.4, 0.1])
+    return {bid: statuses[c] for bid, c in zip(billing_account_ids, choices)}
+
+def generate_netsuite_statuses(billing_account_ids: list, seed: int = 4) -> dict:
+    """
+    產生 NetSuite RESTlet 原始付款狀態 (FakeNetSuiteTransport 使用)
+    約 10% 帳號查無發票 (不在回傳結果中)
+    """
+    rng = np.random.default_rng(seed)
+    choices = rng.choice(3, size=len(billing_account_ids), p=[0.5, 0.4, 0.1])
+    statuses = ["Open", "Paid In Full", None]
+    return {
+        bid: statuses[c] for bid, c in zip(billing_account_ids, choices)
+        if statuses[c] is not None
+    }
+
+def generate_report_rows(customer_profile: pd.DataFrame, waiting_ratio: float = 0.5,
+                         seed: int = 5) -> list:
+    """
+    產生 Report_{year} 工作表內容 (含表頭)，供 check_payment 讀取 "waiting" 記錄
+    每個月份之間以空白列分隔，與 SheetsService.write_monthly_data 相同
+    """
+    rng = np.random.default_rng(seed)
+    rows = [list(Config.OUTPUT_COLUMNS)]
+
+    for month, month_profile in customer_profile.groupby('month', sort=True):
+        if len(rows) > 1:
+            rows.append([''] * len(Config.OUTPUT_COLUMNS))
+
+        count = len(month_profile)
+        spending = np.round(rng.gamma(2.0, 500.0, size=count), 2)
+        rates = month_profile['referral_share_rate'].fillna(0).to_numpy()
+        waiting = rng.random(count) < waiting_ratio
+
+        for i, profile in enumerate(month_profile.itertuples(index=False)):
+            rows.append([
+                str(month),
+                profile.billing_account_name,
+                'USD',
+                float(spending[i]),
+                float(rates[i]),
+                round(float(spending[i] * rates[i]), 2),
+                profile.referral_company,
+                'waiting' if waiting[i] else 'Clear',
+                '' if pd.isna(profile.salesrep) else profile.salesrep,
+                '' if pd.isna(profile.edp_type) else profile.edp_type
+            ])
+
+    return rows
+
+def generate_payment_events(customer_profile: pd.DataFrame, change_ratio: float = 0.1,
+                            invoice_size: int = 5, seed: int = 6) -> dict:
+    """
+    產生 NetSuite 發票狀態變更事件 (data[] 格式，POST /payment-events 使用)
+    每個月份約 change_ratio 的帳號變為 Paid In Full，每 invoice_size 個帳號一張發票
+    invoice_date 為報表月份的次月 (發票開立日)
+    """
+    rng = np.random.default_rng(seed)
+    invoices = []
+
+    for month, month_profile in customer_profile.groupby('month', sort=True):
+        ids = month_profile['billing_account_id'].tolist()
+        changed = [bid for bid, paid in zip(ids, rng.random(len(ids)) < change_ratio) if paid]
+        year, month_number = divmod(int(month), 100)
+        year, month_number = (year + 1, 1) if month_number == 12 else (year, month_number + 1)
+
+        for start in range(0, len(changed), invoice_size):
+            invoices.append({
+                'invoice_number': f"IV-{int(month)}{len(invoices) + 1:07d}",
+                'invoice_date': f"{year}/{month_number:02d}/03",
+                'payment_status': "Paid In Full",
+                'items': changed[start:start + invoice_size]
+            })
+
+    return {'data': invoices}
@@ -3,98 +3,210 @@
 檢查過去月份的 Customer<>CM 欄位，更新 "waiting" 狀態的記錄
 """
 
-from services.sheets_service import SheetsService
-from services.netsuite_service import NetSuiteService
+from datetime import datetime
+from typing import TYPE_CHECKING
 from config import Config
-from collections import defaultdict
+from utils.profiling import add_profile_arguments, profiler
+from utils.telemetry import telemetry
+from utils.waiting_records import WaitingRecordIndex
 
-def check_and_update_payment_status(year: int):
+if TYPE_CHECKING:
+    from services.netsuite_service import NetSuiteService
+    from services.report_sink import ReportSink
+
+def check_and_update_payment_status(year: int, report_sink: 'ReportSink' = None,
+                                    netsuite_service: 'NetSuiteService' = None, lookback_months: int = 0):
     """
     檢查並更新指定年份的歷史付款狀態
         year: 要檢查的年份
+        report_sink / netsuite_service: 已連線的服務 (未指定時建立新的)
+        lookback_months: 大於 0 時改為檢查 year 最後一個月 (或本月) 往回的月份，可跨年度
+    Returns:
+        dict: {year: 已更新的記錄清單}
     """
-    print(f"Starting payment status check for {year}...")
+    months = None
+    if lookback_months > 0:
+        end_month = min(year * 100 + 12, int(datetime.now().strftime('%Y%m')))
+        months = lookback_window(end_month, lookback_months)
+        print(f"Starting payment status check for {months[0]}-{months[-1]}...")
+    else:
+        print(f"Starting payment status check for {year}...")
     
-    # 初始化服務
-    sheets_service = SheetsService()
-    netsuite_service = NetSuiteService()
+    # 初始化服務 (服務模組在此才 import，main 匯入本模組時不需載入)
+    if report_sink is None:
+        from services.report_sink import create_report_sink
+        report_sink = create_report_sink()
+    if netsuite_service is None:
+        from services.netsuite_service import NetSuiteService
+        netsuite_service = NetSuiteService()
     
-    # 1. 取得所有 "waiting" 狀態的記錄
-    waiting_records = sheets_service.get_waiting_records(year)
+    with profiler.stage("collect_payment_updates"):
+        all_updates = collect_payment_updates(report_sink, netsuite_service, year, months=months)
     
-    if not waiting_records:
-        print("No waiting records found")
-        return
+    with profiler.stage("apply_payment_updates"):
+        apply_payment_updates(report_sink, all_updates)
+    
+    return all_updates
+
+def lookback_window(end_month: int, lookback_months: int) -> list:
+    """
+    end_month (含) 往回 lookback_months 個月的月份清單
+    Returns:
+        list: 由舊到新的 YYYYMM，例如 lookback_window(202502, 3) -> [202412, 202501, 202502]
+    """
+    index = (end_month // 100) * 12 + end_month % 100 - 1
+    return [(i // 12) * 100 + i % 12 + 1 for i in range(index - lookback_months + 1, index + 1)]
+
+def collect_payment_updates(report_sink: 'ReportSink', netsuite_service: 'NetSuiteService',
+                            year: int, skip_months: tuple = (), months: list = None) -> dict:
+    """
+    讀取 "waiting" 記錄並查詢付款狀態，不寫入報表
+        skip_months: 不檢查的月份 (例如本次執行剛寫入的月份)
+        months: 只檢查這些月份 (YYYYMM，可跨年度)，None 時檢查 year 整年
+    Returns:
+        dict: {year: 需要更新的記錄清單}
+    """
+    indexes = read_waiting_indexes(report_sink, year, skip_months, months)
+    statuses = query_payment_statuses(netsuite_service, indexes)
+    return {year: updates for year, updates in _updates_by_year(indexes, statuses).items() if updates}
+
+def collect_payment_statuses(report_sink: 'ReportSink', netsuite_service: 'NetSuiteService',
+                             year: int, skip_months: tuple = (), months: list = None) -> dict:
+    """
+    與 collect_payment_updates 相同，但只保留需要更新的 (月份, billing_account_name)，不保留列號
+    查詢與報表寫入同時進行時使用：寫入會刪除/附加列，套用前以 resolve_payment_updates 重新對應列號
+    Returns:
+        dict: {year: {month: {billing_account_name: new_status}}}
+    """
+    return query_payment_statuses(netsuite_service, read_waiting_indexes(report_sink, year, skip_months, months))
+
+def resolve_payment_updates(report_sink: 'ReportSink', statuses: dict) -> dict:
+    """
+    重新讀取 waiting 記錄，將 collect_payment_statuses 的結果對應到目前的列號
+    應在持有相關年度的 lease 時呼叫，並在同一個 lease 內以 apply_payment_updates 寫入
+    Returns:
+        dict: {year: 需要更新的記錄清單}
+    """
+    if not statuses:
+        return {}
+    
+    records_by_year = report_sink.get_waiting_records_by_year(sorted(statuses))
+    indexes = {
+        year: WaitingRecordIndex(records_by_year.get(year, []), only_months=list(statuses[year]))
+        for year in statuses
+    }
+    return {year: updates for year, updates in _updates_by_year(indexes, statuses).items() if updates}
+
+def read_waiting_indexes(report_sink: 'ReportSink', year: int, skip_months: tuple = (), months: list = None) -> dict:
+    """
+    讀取 "waiting" 記錄 (涵蓋的年度工作表一次批次讀取)，依 (月份, billing_account_name) 建立列號索引
+    Returns:
+        dict: {year: WaitingRecordIndex} (列號屬於各自的工作表，因此每個年度一個索引)
+    """
+    years = sorted({month // 100 for month in months}) if months else [year]
+    
+    records_by_year = report_sink.get_waiting_records_by_year(years)
+    record_count = sum(len(records) for records in records_by_year.values())
     
-    print(f"Found {len(waiting_records)} waiting records")
+    if not record_count:
+        print("No waiting records found")
+        return {}
     
-    # 2. 按月分組，批次查詢
-    records_by_month = defaultdict(list)
-    for record in waiting_records:
-        month = record['month']
-        if month:  
-            records_by_month[month].append(record)
+    print(f"Found {record_count} waiting records in {len(years)} report(s)")
     
-    print(f"Grouped into {len(records_by_month)} months")
+    indexes = {
+        year: WaitingRecordIndex(records, skip_months, months)
+        for year, records in records_by_year.items()
+    }
     
-    # 3. 批次查詢每個月份的付款狀態
-    all_updates = []
+    print(f"Grouped into {sum(len(index) for index in indexes.values())} months")
+    return indexes
+
+def query_payment_statuses(netsuite_service: 'NetSuiteService', indexes: dict) -> dict:
+    """
+    每個月份一次批次查詢付款狀態
+    Returns:
+        dict: {year: {month: {billing_account_name: new_status}}} (只含需要更新的名稱)
+    """
+    all_statuses = {}
     
-    for month, records in records_by_month.items():
-        print(f"\nProcessing month {month} ({len(records)} records)...")
-        
-        try:
-            # 該月份需要查詢的資料
-            month_updates = process_month_records(netsuite_service, month, records)
-            all_updates.extend(month_updates)
+    for year, index in indexes.items():
+        for month in index.months:
+            print(f"\nProcessing month {month} ({index.month_record_count(month)} records)...")
+            
+            try:
+                month_statuses = process_month_statuses(netsuite_service, month, index.month_rows(month))
+            except Exception as e:
+                print(f"Error processing month {month}: {e}")
+                continue
             
-        except Exception as e:
-            print(f"Error processing month {month}: {e}")
-            continue
-    
-    # 4. 批次更新 Google Sheets
-    if all_updates:
-        print(f"\nUpdating {len(all_updates)} records in Google Sheets...")
-        sheets_service.update_payment_status(year, all_updates)
+            if month_statuses:
+                all_statuses.setdefault(year, {})[month] = month_statuses
+    
+    return all_statuses
+
+def _updates_by_year(indexes: dict, statuses: dict) -> dict:
+    """
+    依索引中的列號展開付款狀態
+    """
+    return {
+        year: [
+            {'row_number': row_number, 'new_status': new_status}
+            for month, month_statuses in statuses.get(year, {}).items()
+            for name, new_status in month_statuses.items()
+            for row_number in index.rows(month, name)
+        ]
+        for year, index in indexes.items()
+    }
+
+def apply_payment_updates(report_sink: 'ReportSink', all_updates: dict):
+    """
+    批次更新報表的付款狀態 (每個年度工作表一個批次)
+        all_updates: {year: 需要更新的記錄清單} (collect_payment_updates 的結果)
+    """
+    update_count = sum(len(updates) for updates in all_updates.values())
+    if update_count:
+        print(f"\nUpdating {update_count} records in {len(all_updates)} report(s)...")
+        report_sink.update_payment_status_by_year(all_updates)
         print("Payment status update completed")
     else:
         print("No updates needed")
 
-def process_month_records(netsuite_service: NetSuiteService, month: str, records: list) -> list:
+def process_month_records(netsuite_service: 'NetSuiteService', month: str, rows_by_name: dict) -> list:
     """
     處理單一月份的記錄  
+        rows_by_name: {billing_account_name: [row_number, ...]} (WaitingRecordIndex.month_rows)
     Returns:
         list: 需要更新的記錄清單
     """
-    updates = []
-    # 透過 billing_account_name 查詢，取得對應關係
+    statuses = process_month_statuses(netsuite_service, month, rows_by_name)
+    return [
+        {'row_number': row_number, 'new_status': new_status}
+        for billing_account_name, new_status in statuses.items()
+        for row_number in rows_by_name[billing_account_name]
+    ]
+
+def process_month_statuses(netsuite_service: 'NetSuiteService', month: str, rows_by_name: dict) -> dict:
+    """
+    查詢單一月份的付款狀態
+        rows_by_name: {billing_account_name: [row_number, ...]} (WaitingRecordIndex.month_rows)
+    Returns:
+        dict: {billing_account_name: new_status} (只含需要更新的名稱)
+    """
+    changed = {}
+    print(f"  Unique billing account names: {len(rows_by_name)}")
     
-    unique_names = list(set(record['billing_account_name'] for record in records))
-    print(f"  Unique billing account names: {len(unique_names)}")
+    # 整個月份的 billing_account_name 一次批次查詢
+    statuses = netsuite_service.get_payment_status_by_names(month, list(rows_by_name))
     
-    # 查詢每個 billing_account_name 的付款狀態
-    for billing_account_name in unique_names:
-        try:
-            new_status = netsuite_service.get_payment_status_by_name(
-                month, billing_account_name
-            )
-            
-            # 檢查是否需要更新
-            if should_update_status(new_status):
-                # 找到所有需要更新的記錄
-                for record in records:
-                    if record['billing_account_name'] == billing_account_name:
-                        updates.append({
-                            'row_number': record['row_number'],
-                            'new_status': new_status
-                        })
-                        print(f"    {billing_account_name}: waiting -> {new_status}")
-            
-        except Exception as e:
-            print(f"  Error querying {billing_account_name}: {e}")
-            continue
+    for billing_account_name, new_status in statuses.items():
+        # 檢查是否需要更新
+        if should_update_status(new_status):
+            changed[billing_account_name] = new_status
+            rows = rows_by_name[billing_account_name]
+            print(f"    {billing_account_name}: waiting -> {new_status} ({len(rows)} rows)")
     
-    return updates
+    return changed
 
 def should_update_status(new_status: str) -> bool:
     """
@@ -114,7 +226,22 @@ def should_update_status(new_status: str) -> bool:
     return True  # 其他情況都更新
 
 if __name__ == "__main__":
-    # 測試用 - 檢查當前年份
-    from datetime import datetime
-    current_year = datetime.now().year
-    check_and_update_payment_status(current_year)
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Recheck waiting payment status")
+    # 預設檢查當前年份
+    parser.add_argument('--year', type=int, default=datetime.now().year)
+    parser.add_argument(
+        '--lookback-months', type=int, default=0,
+        help="check the last N months up to the end of --year instead of the whole year (crosses years)"
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler.configure(args.profile, args.profile_dir)
+    
+    try:
+        check_and_update_payment_status(args.year, lookback_months=args.lookback_months)
+    finally:
+        profiler.write_summary()
+        if Config.RUN_REPORT_PATH:
+            telemetry.write_report(Config.RUN_REPORT_PATH)
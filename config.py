@@ -9,6 +9,100 @@ class Config:
     BILLING_DATA_TABLE = "billing_data"
     CUSTOMER_PROFILE_TABLE = "customer_profile"
     
+    # billing_data 讀取模式: aggregated (BigQuery 端聚合) / streaming (逐頁讀取原始資料) / auto (依執行計畫選擇)
+    BILLING_MODE = os.environ.get("BILLING_MODE", "auto")
+    # 串流模式的頁大小上限 (執行計畫依記憶體預算縮小)
+    BILLING_PAGE_SIZE = int(os.environ.get("BILLING_PAGE_SIZE", "50000"))
+    # 串流模式改讀本地匯出檔 (Parquet/CSV 檔案或目錄)
+    BILLING_EXPORT_PATH = os.environ.get("BILLING_EXPORT_PATH", "")
+    
+    # DataProcessor.integrate_data 運算引擎: pandas / arrow / auto (預估用量超過記憶體預算時使用 arrow)
+    DATA_ENGINE = os.environ.get("DATA_ENGINE", "auto")
+    
+    # 執行計畫的記憶體上限 (MB)，0 時讀取容器的 cgroup 限制；資料可使用其中 MEMORY_BUDGET_RATIO
+    MEMORY_LIMIT_MB = int(os.environ.get("MEMORY_LIMIT_MB", "0"))
+    MEMORY_BUDGET_RATIO = float(os.environ.get("MEMORY_BUDGET_RATIO", "0.6"))
+    
+    # main.py pipeline 同時執行的 stage 數量
+    PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "4"))
+    
+    # stage 輸出 checkpoint 目錄 (本地路徑或 gs://bucket/path)，預設空字串停用 (本地執行可用 main.py --checkpoint-dir)
+    # Cloud Run Job 重試時只有 gs:// 的 checkpoint 會自動 resume (deploy_cloudrunjobs.sh 設定 CHECKPOINT_BUCKET)
+    CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "")
+    
+    # 執行結束時輸出的 JSON 報告 (各 stage / 外部呼叫的時間、列數、位元組數)，空字串停用
+    RUN_REPORT_PATH = os.environ.get("RUN_REPORT_PATH", "run_report.json")
+    
+    # profiling: off / cprofile / sample，dump 輸出到 PROFILE_DIR
+    PROFILE_MODE = os.environ.get("PROFILE", "off")
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+    
+    # 報表輸出: sheets (Google Sheets) / bigquery (報表表) / parquet / csv / xlsx (寫入 REPORT_OUTPUT_DIR)
+    REPORT_SINK = os.environ.get("REPORT_SINK", "sheets")
+    REPORT_OUTPUT_DIR = os.environ.get("REPORT_OUTPUT_DIR", "reports")
+    REPORT_DATASET_ID = os.environ.get("REPORT_DATASET_ID", DATASET_ID)
+    REPORT_TABLE = os.environ.get("REPORT_TABLE", "referral_report")
+    
+    # 多目標報表：同一份資料依欄位篩選後寫入多個報表 (JSON 清單或 JSON 檔案路徑)，空字串時只寫入上述單一報表
+    # 例: [{"name": "partner_a", "spreadsheet_id": "...", "filters": {"Referral Company": ["Partner A"]}},
+    #      {"name": "apac", "sink": "parquet", "filters": {"Sales": ["Alice", "Bob"]}}]
+    REPORT_TARGETS = os.environ.get("REPORT_TARGETS", "")
+    # 同時寫入的目標數
+    REPORT_TARGET_WORKERS = int(os.environ.get("REPORT_TARGET_WORKERS", "4"))
+    
+    # 歷史付款狀態檢查往回的月份數 (含本月，可跨 Report_{year} 工作表)，預設 0 只檢查本年度
+    # Cloud Run Job 由 deploy_cloudrunjobs.sh 的 PAYMENT_LOOKBACK_MONTHS 設定
+    PAYMENT_LOOKBACK_MONTHS = int(os.environ.get("PAYMENT_LOOKBACK_MONTHS", "0"))
+    
+    # status_refresh.py：waiting 發票的檢查間隔 (依發票年齡與檢查次數在兩者之間調整)
+    REFRESH_MIN_INTERVAL_HOURS = float(os.environ.get("REFRESH_MIN_INTERVAL_HOURS", "1"))
+    REFRESH_MAX_INTERVAL_HOURS = float(os.environ.get("REFRESH_MAX_INTERVAL_HOURS", "168"))
+    # 重新讀取報表 (發現新的 waiting 列) 的最長間隔，與佇列狀態檔 (空字串不保存)
+    REFRESH_RESYNC_MINUTES = float(os.environ.get("REFRESH_RESYNC_MINUTES", "60"))
+    REFRESH_STATE_PATH = os.environ.get("REFRESH_STATE_PATH", "refresh_state.json")
+    
+    # server.py：HTTP 服務位址 (預設只監聽本機，Cloud Run 以 SERVER_HOST=0.0.0.0 與 PORT 指定)、worker 數與等待中工作的上限
+    # 寫入報表的工作依序執行 (single-writer)，SERVER_WORKERS 大於 1 不會加快報表工作
+    SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.environ.get("PORT", "8080"))
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+    SERVER_MAX_QUEUED = int(os.environ.get("SERVER_MAX_QUEUED", "20"))
+    # POST /reports、/payment-status 需帶 Authorization: Bearer {SERVER_TOKEN} header，未設定時拒絕請求
+    SERVER_TOKEN = os.environ.get("SERVER_TOKEN", "")
+    
+    # server.py POST /payment-events：事件累積後每 PUSH_FLUSH_SECONDS 秒 (或達 PUSH_MAX_BUFFERED 筆) 寫回報表
+    # 請求需帶 X-Push-Token: {PUSH_SHARED_SECRET} header，PUSH_SHARED_SECRET 未設定時拒絕請求
+    # customer_profile 尚無對應帳號的變更保留在 buffer 中重試，超過 PUSH_UNMATCHED_TTL_SECONDS 秒後捨棄
+    PUSH_FLUSH_SECONDS = float(os.environ.get("PUSH_FLUSH_SECONDS", "30"))
+    PUSH_MAX_BUFFERED = int(os.environ.get("PUSH_MAX_BUFFERED", "500"))
+    PUSH_SHARED_SECRET = os.environ.get("PUSH_SHARED_SECRET", "")
+    PUSH_UNMATCHED_TTL_SECONDS = float(os.environ.get("PUSH_UNMATCHED_TTL_SECONDS", "3600"))
+    
+    # Report_{year} 寫入 lease (本地目錄或 gs://bucket/path)，多個 process / Cloud Run task 依序寫入同一份報表
+    # 空字串時不加鎖 (backfill.py 未設定時使用本地的 leases 目錄)
+    LEASE_DIR = os.environ.get("LEASE_DIR", "")
+    LEASE_TTL_SECONDS = float(os.environ.get("LEASE_TTL_SECONDS", "900"))
+    LEASE_POLL_SECONDS = float(os.environ.get("LEASE_POLL_SECONDS", "2"))
+    LEASE_TIMEOUT_SECONDS = float(os.environ.get("LEASE_TIMEOUT_SECONDS", "3600"))
+    
+    # NetSuite HTTP 連線池大小 (keep-alive 連線重複使用)
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+    # 每月報表的 NetSuite 查詢分批：每批帳號數 (0 時依 NETSUITE_MAX_QUERY_BYTES 計算) 與同時請求數上限
+    NETSUITE_CHUNK_SIZE = int(os.environ.get("NETSUITE_CHUNK_SIZE", "0"))
+    NETSUITE_MAX_QUERY_BYTES = int(os.environ.get("NETSUITE_MAX_QUERY_BYTES", "6000"))
+    NETSUITE_MAX_WORKERS = int(os.environ.get("NETSUITE_MAX_WORKERS", "4"))
+    
+    # Google Sheets 重新寫入月份的方式: replace (刪除後重新附加) / reconcile (只送出差異)
+    SHEETS_WRITE_MODE = os.environ.get("SHEETS_WRITE_MODE", "replace")
+    
+    # 已結清月份 (沒有 waiting 列) 的封存: off / worksheet (同一份試算表的 Archive_{year}) / spreadsheet (ARCHIVE_SPREADSHEET_ID)
+    # Report_{year} 只保留未結清的月份與本月，REPORT_INDEX_SHEET 記錄每個月份所在的位置
+    SHEETS_ARCHIVE_MODE = os.environ.get("SHEETS_ARCHIVE_MODE", "off")
+    ARCHIVE_SHEET_NAME_FORMAT = os.environ.get("ARCHIVE_SHEET_NAME_FORMAT", "Archive_{year}")
+    ARCHIVE_SPREADSHEET_ID = os.environ.get("ARCHIVE_SPREADSHEET_ID", "")
+    REPORT_INDEX_SHEET = os.environ.get("REPORT_INDEX_SHEET", "Report_Index")
+    
     # Google Sheets 
     SHEETS_FILE_ID = "1Ha6wnvhm4M9fV1B0Z3mYHMFt5t8IefFw24z06ga2us4"
     DRIVE_FOLDER_ID = "16UH39yl2WaawLRadUB1CMnz72jjWjhBG"
@@ -5,6 +5,10 @@ JOB_NAME="referral-reporter"
 REGION="asia-east1"
 IMAGE_NAME="gcr.io/${PROJECT_ID}/${JOB_NAME}"
 SERVICE_ACCOUNT="auto-reporter@${PROJECT_ID}.iam.gserviceaccount.com"
+# 失敗重試時從 checkpoint 繼續 (重試的 task 在新的 container 執行，checkpoint 需存放在 GCS)
+CHECKPOINT_BUCKET="${PROJECT_ID}-checkpoints"
+# 歷史付款狀態檢查往回的月份數 (含本月，可跨 Report_{year} 工作表)，0 只檢查本年度 (預設)
+PAYMENT_LOOKBACK_MONTHS="${PAYMENT_LOOKBACK_MONTHS:-0}"
 
 echo "部署開始..."
 
@@ -32,11 +36,22 @@ docker build -t $IMAGE_NAME .
 echo "推送映像..."
 docker push $IMAGE_NAME
 
-# 6. 刪除舊的 Job (如果存在)
+# 6. 建立 checkpoint bucket (如果不存在)，7 天後自動刪除
+echo "確認 checkpoint bucket..."
+if ! gcloud storage buckets describe gs://$CHECKPOINT_BUCKET > /dev/null 2>&1; then
+    gcloud storage buckets create gs://$CHECKPOINT_BUCKET --location $REGION --uniform-bucket-level-access
+    echo '{"rule": [{"action": {"type": "Delete"}, "condition": {"age": 7}}]}' > /tmp/checkpoint-lifecycle.json
+    gcloud storage buckets update gs://$CHECKPOINT_BUCKET --lifecycle-file=/tmp/checkpoint-lifecycle.json
+fi
+gcloud storage buckets add-iam-policy-binding gs://$CHECKPOINT_BUCKET \
+  --member "serviceAccount:$SERVICE_ACCOUNT" \
+  --role roles/storage.objectAdmin > /dev/null
+
+# 7. 刪除舊的 Job (如果存在)
 echo "清理舊的 Job..."
 gcloud run jobs delete $JOB_NAME --region $REGION --quiet 2>/dev/null || true
 
-# 7. 建立新的 Job (修正參數)
+# 8. 建立新的 Job (修正參數)
 echo "建立 Cloud Run Job..."
 gcloud run jobs create $JOB_NAME \
   --image $IMAGE_NAME \
@@ -47,7 +62,7 @@ gcloud run jobs create $JOB_NAME \
   --parallelism 1 \
   --task-timeout 3600 \
   --service-account $SERVICE_ACCOUNT \
-  --set-env-vars GOOGLE_CLOUD_PROJECT=$PROJECT_ID
+  --set-env-vars GOOGLE_CLOUD_PROJECT=$PROJECT_ID,CHECKPOINT_DIR=gs://$CHECKPOINT_BUCKET/checkpoints,PAYMENT_LOOKBACK_MONTHS=$PAYMENT_LOOKBACK_MONTHS
 
 if [ $? -eq 0 ]; then
     echo "✅ Cloud Run Job 建立成功！"
@@ -57,6 +72,8 @@ if [ $? -eq 0 ]; then
     echo "Job Name: $JOB_NAME"
     echo "Region: $REGION"
     echo "Service Account: $SERVICE_ACCOUNT"
+    echo "Checkpoints: gs://$CHECKPOINT_BUCKET/checkpoints"
+    echo "Payment lookback months: $PAYMENT_LOOKBACK_MONTHS"
 else
     echo "Cloud Run Job 建立失敗"
     exit 1
@@ -3,114 +3,380 @@
 CloudMile Referral Auto Reporter Auto 每月10號自動執行
 """
 
+import argparse
+import contextlib
 import os
 import sys
 from datetime import datetime, timedelta
-from services.bigquery_service import BigQueryService
-from services.netsuite_service import NetSuiteService
-from services.sheets_service import SheetsService
-from utils.data_processor import DataProcessor
+from utils.checkpoint import CheckpointStore
+from utils.lease import LeaseManager, report_lease
+from utils.pipeline import Pipeline, PipelineStopped
+from utils.profiling import add_profile_arguments, profiler
+from utils.telemetry import telemetry
 from config import Config
-import check_payment
 
-def get_api_month() -> str:
+# BigQuery / gspread / pandas 等重量級套件在使用它們的 stage 內才 import：
+# --help 與參數錯誤不需等待，三個服務的 stage 同時執行時 import 與連線也會重疊
+
+def get_api_month(data_month: int = None) -> str:
     """
     取得 NetSuite API 查詢當月份（當月開立上月發票)
+    data_month: 回補過去月份時指定，回傳其次月 (該月份發票的開立月份)
     Returns:
         str: API 查詢月份 (YYYYMM)
     """
+    if data_month is not None:
+        year, month = divmod(int(data_month), 100)
+        return f"{year + month // 12}{month % 12 + 1:02d}"
+    
     current_date = datetime.now()
     return current_date.strftime('%Y%m')
 
-def main():
-    print("=" * 50)
-    print("CloudMile Referral Report Generator Started")
-    print(f"Execution Time: {datetime.now()}")
-    print("=" * 50)
+def build_pipeline(checkpoint_store: CheckpointStore = None, force: bool = False,
+                   data_month: int = None, services: dict = None,
+                   lease_manager: LeaseManager = None, backfill: bool = False) -> Pipeline:
+    """
+    建立每月報表的 stage DAG，每個 stage 宣告它需要的輸入
+    彼此獨立的 stage (例如 Sheets 工作表準備與 BigQuery 查詢) 會同時執行
+    checkpoint_store: 保存 BigQuery / NetSuite 結果、整合資料與寫入進度，供 resume 使用
+    force: 內容 fingerprint 未改變時仍重新寫入
+    data_month: 指定報表月份 (YYYYMM)，None 時使用 BigQuery 最新月份
+    services: 已連線的服務 {'bq_service', 'netsuite_service', 'report_sink'} (server.py 常駐時重複使用)
+    lease_manager: 寫入 Report_{year} 前取得該年度的 lease (多個 process 同時寫入同一份報表時使用)
+    backfill: 回補模式，只寫入該月份 (不更新檔案名稱、不檢查歷史付款狀態)
+    """
+    pipeline = Pipeline(max_workers=Config.PIPELINE_WORKERS, checkpoint_store=checkpoint_store)
+    services = services or {}
     
-    try:
-        # 1. 初始化服務
-        bq_service = BigQueryService()
+    # 1. 初始化服務，並測試 BigQuery 連線 (已注入的服務直接使用)
+    def init_bigquery():
+        if 'bq_service' in services:
+            return services['bq_service']
         
-        # 2. 測試 BigQuery 連線
+        from services.bigquery_service import BigQueryService
+        bq_service = BigQueryService()
         print("\nTesting BigQuery connection...")
         if not bq_service.test_connection():
-            print("BigQuery connection failed. Please check permissions.")
-            return
-        
-        netsuite_service = NetSuiteService()
-        sheets_service = SheetsService()
-        
-        # 3. 取得最新月份的資料
-        print(f"\nFetching latest month data from BigQuery...")
-        billing_data, customer_profile, data_month = bq_service.get_latest_month_data()
+            raise PipelineStopped("BigQuery connection failed. Please check permissions.")
+        return bq_service
+    
+    pipeline.add_stage("bq_service", init_bigquery)
+    
+    def init_netsuite(bq_service):
+        if 'netsuite_service' in services:
+            return services['netsuite_service']
         
-        if data_month is None:
-            print("No data found in BigQuery tables")
-            return
+        from services.netsuite_service import NetSuiteService
+        return NetSuiteService(bq_service=bq_service)
+    
+    def init_report_sink():
+        if 'report_sink' in services:
+            return services['report_sink']
         
-        year = data_month // 100
-        api_month = get_api_month()
+        from services.report_sink import create_report_sink
+        return create_report_sink(lease_manager=lease_manager)
+    
+    pipeline.add_stage("netsuite_service", init_netsuite, ("bq_service",))
+    pipeline.add_stage("report_sink", init_report_sink)
+    
+    # 2. 取得最新月份 (或指定的月份)
+    requested_month = data_month
+    
+    def find_data_month(bq_service):
+        if requested_month is not None:
+            data_month = int(requested_month)
+        else:
+            print(f"\nFetching latest month from BigQuery...")
+            data_month = bq_service.get_latest_month()
+            if data_month is None:
+                raise PipelineStopped("No data found in BigQuery tables")
         
         print(f"Processing data for month: {data_month}")
-        print(f"NetSuite API query month: {api_month}")
-        print(f"Target year: {year}")
+        print(f"NetSuite API query month: {get_api_month(data_month if backfill else None)}")
+        print(f"Target year: {data_month // 100}")
+        
+        if checkpoint_store is not None:
+            checkpoint_store.bind(data_month)
+        return data_month
+    
+    pipeline.add_stage("data_month", find_data_month, ("bq_service",))
+    
+    # 3. 取得該月份的資料 (billing_data / customer_profile 同時查詢)
+    def count_records(bq_service, data_month):
+        billing_count = bq_service._get_month_record_count(Config.BILLING_DATA_TABLE, data_month)
+        customer_count = bq_service._get_month_record_count(Config.CUSTOMER_PROFILE_TABLE, data_month)
+        print(f"Expected records - Billing: {billing_count:,}, Customer: {customer_count:,}")
+        return billing_count, customer_count
+    
+    # 執行計畫：依預期列數與表格 metadata 選擇 billing 讀取模式、整合引擎與 NetSuite 分批 (記憶體不超過預算)
+    def create_plan(bq_service, record_counts):
+        from utils.execution_planner import plan_execution
+        from utils.telemetry import current_span
+        execution_plan = plan_execution(record_counts, bq_service.get_table_stats())
+        print(f"Execution plan: {execution_plan.describe()}")
+        if not execution_plan.fits:
+            print("Warning: estimated memory exceeds the budget, consider a larger MEMORY_LIMIT_MB")
+        current_span().set(plan=execution_plan.to_dict())
+        return execution_plan
+    
+    def fetch_billing_data(bq_service, data_month, plan):
+        if plan.streaming:
+            print(f"Billing mode: streaming (page size {plan.page_size:,})")
+        billing_data = bq_service.get_billing_data(
+            data_month, plan.streaming, Config.BILLING_EXPORT_PATH or None, plan.page_size
+        )
         print(f"Billing data records: {len(billing_data)}")
+        return billing_data
+    
+    def fetch_customer_profile(bq_service, data_month):
+        customer_profile = bq_service.get_customer_profile(data_month)
         print(f"Customer profile records: {len(customer_profile)}")
+        return customer_profile
+    
+    pipeline.add_stage("record_counts", count_records, ("bq_service", "data_month"))
+    pipeline.add_stage("plan", create_plan, ("bq_service", "record_counts"))
+    pipeline.add_stage("billing_data", fetch_billing_data, ("bq_service", "data_month", "plan"), checkpoint=True)
+    pipeline.add_stage("customer_profile", fetch_customer_profile, ("bq_service", "data_month"), checkpoint=True)
+    
+    # 4. 準備工作表 (不需等待 BigQuery 資料)
+    def prepare_worksheet(report_sink, data_month):
+        with report_lease(lease_manager, data_month // 100):
+            return report_sink.prepare_worksheet(data_month // 100)
+    
+    pipeline.add_stage("worksheet", prepare_worksheet, ("report_sink", "data_month"))
+    
+    # 5. 查詢 NetSuite 發票付款狀態 (billing_account_ids 取自已查詢的 customer_profile)
+    def query_payment_status(netsuite_service, customer_profile, data_month, plan):
+        if customer_profile.empty:
+            raise PipelineStopped("Warning: No billing account IDs found")
         
-        if billing_data.empty and customer_profile.empty:
-            print("Warning: No data found in BigQuery for the specified month")
-            return
-        
-        # 4. 取得所有需要查詢的 billing_account_ids
-        billing_account_ids = bq_service.get_billing_account_ids(data_month)
+        billing_account_ids = customer_profile['billing_account_id'].unique().tolist()
         print(f"Total billing account IDs: {len(billing_account_ids)}")
         
-        if not billing_account_ids:
-            print("Warning: No billing account IDs found")
-            return
-        
-        # 5. 查詢 NetSuite 發票付款狀態
         print(f"\nQuerying NetSuite API for payment status...")
         payment_status = netsuite_service.get_invoice_payment_status(
-            api_month, billing_account_ids
+            get_api_month(data_month if backfill else None), billing_account_ids,
+            chunk_size=plan.netsuite_chunk_size, max_workers=plan.netsuite_workers
         )
         print(f"Payment status results: {len(payment_status)}")
-        
-        # 6. 整合資料
+        return payment_status
+    
+    pipeline.add_stage("payment_status", query_payment_status,
+                       ("netsuite_service", "customer_profile", "data_month", "plan"), checkpoint=True)
+    
+    # 6. 整合資料
+    def integrate(billing_data, customer_profile, payment_status, plan):
+        from utils.data_processor import DataProcessor
         integrated_data = DataProcessor.integrate_data(
-            billing_data, customer_profile, payment_status
+            billing_data, customer_profile, payment_status, engine=plan.engine
         )
         print(f"Integrated data records: {len(integrated_data)}")
         
         if integrated_data.empty:
-            print("Warning: No data to write after integration")
-            return
+            raise PipelineStopped("Warning: No data to write after integration")
+        return integrated_data
+    
+    pipeline.add_stage(
+        "integrated_data", integrate, ("billing_data", "customer_profile", "payment_status", "plan"), checkpoint=True
+    )
+    
+    # 7. 內容 fingerprint：來源表修改時間、列數、整合資料與付款狀態都未改變時不重新寫入
+    def compute_report_fingerprint(bq_service, report_sink, worksheet, data_month,
+                                   record_counts, integrated_data, payment_status):
+        from utils.fingerprint import compute_fingerprint
+        fingerprint = compute_fingerprint(
+            bq_service.get_table_modified_times(), record_counts, integrated_data, payment_status
+        )
+        stored = report_sink.get_fingerprint(data_month)
+        unchanged = stored == fingerprint and not force
+        print(f"\nReport fingerprint: {fingerprint} (stored: {stored or 'none'})")
+        return {'value': fingerprint, 'unchanged': unchanged}
+    
+    pipeline.add_stage(
+        "fingerprint", compute_report_fingerprint,
+        ("bq_service", "report_sink", "worksheet", "data_month", "record_counts", "integrated_data", "payment_status")
+    )
+    
+    # 8. 寫入報表 (Google Sheets 或 REPORT_SINK 指定的本地檔案)，完成後保存 fingerprint
+    def write_report(report_sink, worksheet, integrated_data, data_month, fingerprint):
+        if fingerprint['unchanged']:
+            print(f"\nMonth {data_month} unchanged since last write, skipping report write")
+            return False
         
-        # 7. 寫入 Google Sheets
-        print(f"\nWriting data to Google Sheets...")
-        sheets_service.write_monthly_data(integrated_data, year, data_month)
+        print(f"\nWriting data to report ({Config.REPORT_SINK})...")
+        with report_lease(lease_manager, data_month // 100):
+            report_sink.write_monthly_data(integrated_data, data_month // 100, data_month)
+            report_sink.set_fingerprint(data_month, fingerprint['value'])
         print("Data written successfully")
+        return True
+    
+    pipeline.add_stage(
+        "write", write_report,
+        ("report_sink", "worksheet", "integrated_data", "data_month", "fingerprint"), checkpoint=True
+    )
+    
+    if backfill:
+        return pipeline
+    
+    # 9. 更新檔案名稱
+    def update_title(report_sink, data_month, write):
+        if not write:
+            return False
         
-        # 8. 更新檔案名稱
         print(f"\nUpdating spreadsheet title...")
-        sheets_service.update_spreadsheet_title(data_month)
-        
-        # 9. 檢查歷史資料付款狀態
+        report_sink.update_spreadsheet_title(data_month)
+        return True
+    
+    pipeline.add_stage("title", update_title, ("report_sink", "data_month", "write"), checkpoint=True)
+    
+    # 10. 檢查歷史資料付款狀態：NetSuite 查詢與本月寫入同時進行，只保留 (月份, 名稱) 的新狀態
+    #    本月寫入會刪除/附加列，歷史列的列號可能改變：寫入完成後在 lease 內重新讀取 waiting 列號再更新
+    #    PAYMENT_LOOKBACK_MONTHS > 0 時往回檢查 N 個月，一月執行時也會檢查去年的工作表
+    def collect_historical_statuses(report_sink, netsuite_service, data_month, worksheet):
+        import check_payment
         print(f"\nChecking historical payment status...")
-        check_payment.check_and_update_payment_status(year)
+        months = None
+        if Config.PAYMENT_LOOKBACK_MONTHS > 0:
+            months = check_payment.lookback_window(data_month, Config.PAYMENT_LOOKBACK_MONTHS)
+        return check_payment.collect_payment_statuses(
+            report_sink, netsuite_service, data_month // 100, skip_months=(data_month,), months=months
+        )
+    
+    def apply_historical_updates(report_sink, data_month, payment_updates, write):
+        import check_payment
+        # 依年份順序取得 lease (多個 process 以相同順序取得，不會互相等待)
+        # 讀取列號與寫入在同一個 lease 內，其他 process 無法在兩者之間移動列
+        with contextlib.ExitStack() as stack:
+            for year in sorted(payment_updates):
+                stack.enter_context(report_lease(lease_manager, year))
+            updates = check_payment.resolve_payment_updates(report_sink, payment_updates)
+            check_payment.apply_payment_updates(report_sink, updates)
         print("All payment status check completed")
+        return True
+    
+    pipeline.add_stage(
+        "payment_updates", collect_historical_statuses,
+        ("report_sink", "netsuite_service", "data_month", "worksheet"), checkpoint=True
+    )
+    pipeline.add_stage(
+        "payment_check", apply_historical_updates,
+        ("report_sink", "data_month", "payment_updates", "write"), checkpoint=True
+    )
+    
+    # 11. 封存已結清的月份 (SHEETS_ARCHIVE_MODE)：付款狀態更新後，報表只保留仍有 waiting 的月份與本月
+    #    之後的讀取 (waiting 記錄、月份重新寫入) 只涵蓋未結清的列，不隨歷史資料增加
+    def archive_settled(report_sink, data_month, payment_check):
+        if Config.SHEETS_ARCHIVE_MODE == "off":
+            return []
+        
+        import check_payment
+        months = check_payment.lookback_window(data_month, max(Config.PAYMENT_LOOKBACK_MONTHS, 1))
+        archived = []
+        for year in sorted({month // 100 for month in months} | {data_month // 100}):
+            with report_lease(lease_manager, year):
+                archived.extend(report_sink.archive_settled_months(year, keep_months=(data_month,)))
+        print(f"Archived months: {', '.join(archived) or 'none'}")
+        return archived
+    
+    pipeline.add_stage(
+        "archive", archive_settled, ("report_sink", "data_month", "payment_check"), checkpoint=True
+    )
+    
+    return pipeline
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CloudMile Referral Report Generator")
+    parser.add_argument(
+        '--resume', action='store_true',
+        help="skip stages already completed for the data month (automatic on Cloud Run retries)"
+    )
+    parser.add_argument(
+        '--force', action='store_true',
+        help="rewrite the report even if the month's content fingerprint is unchanged"
+    )
+    parser.add_argument(
+        '--month', type=int, default=None,
+        help="report month (YYYYMM) to generate instead of the latest month in BigQuery"
+    )
+    parser.add_argument(
+        '--checkpoint-dir', default=None,
+        help="stage checkpoint directory or gs:// path (default CHECKPOINT_DIR, checkpoints off when unset)"
+    )
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
+def create_checkpoint_store(resume: bool, checkpoint_dir: str = None) -> CheckpointStore:
+    """
+    建立 checkpoint store，checkpoint_dir 與 CHECKPOINT_DIR 都為空時停用
+    Cloud Run Job 重試 (CLOUD_RUN_TASK_ATTEMPT > 0) 時自動 resume，只限 gs:// 的 CHECKPOINT_DIR
+    (重試的 task 在新的 container 執行，本地目錄的 checkpoint 已不存在)
+    """
+    checkpoint_dir = checkpoint_dir or Config.CHECKPOINT_DIR
+    if not checkpoint_dir:
+        if resume:
+            print("Warning: --resume ignored, checkpoints are disabled (set --checkpoint-dir or CHECKPOINT_DIR)")
+        return None
+    
+    if not resume and int(os.environ.get("CLOUD_RUN_TASK_ATTEMPT", "0")) > 0:
+        if checkpoint_dir.startswith("gs://"):
+            resume = True
+        else:
+            print(f"Warning: CHECKPOINT_DIR={checkpoint_dir} is local to the failed task, "
+                  f"auto-resume disabled (set CHECKPOINT_DIR=gs://bucket/path)")
+    print(f"Checkpoint directory: {checkpoint_dir} (resume: {resume})")
+    return CheckpointStore(checkpoint_dir, resume=resume)
+
+def create_lease_manager(lease_dir: str = None) -> LeaseManager:
+    """
+    建立 Report_{year} 寫入 lease，LEASE_DIR 為空時不加鎖
+    """
+    lease_dir = lease_dir or Config.LEASE_DIR
+    return LeaseManager(lease_dir) if lease_dir else None
+
+def run_pipeline(force: bool = False, resume: bool = False, data_month: int = None,
+                 services: dict = None, lease_manager: LeaseManager = None, backfill: bool = False,
+                 checkpoint_dir: str = None) -> dict:
+    """
+    執行每月報表 pipeline (main、server.py 與 backfill.py 共用)
+    Returns: {stage_name: output}
+    """
+    checkpoint_store = create_checkpoint_store(resume, checkpoint_dir)
+    lease_manager = lease_manager or create_lease_manager()
+    return build_pipeline(
+        checkpoint_store, force=force, data_month=data_month, services=services,
+        lease_manager=lease_manager, backfill=backfill
+    ).run()
+
+def main(argv: list = None):
+    args = parse_args(argv)
+    profiler.configure(args.profile, args.profile_dir)
+    
+    print("=" * 50)
+    print("CloudMile Referral Report Generator Started")
+    print(f"Execution Time: {datetime.now()}")
+    print("=" * 50)
+    
+    try:
+        run_pipeline(force=args.force, resume=args.resume, data_month=args.month, checkpoint_dir=args.checkpoint_dir)
         
         print("\n" + "=" * 50)
         print("Process completed successfully!")
         print("=" * 50)
         
+    except PipelineStopped as e:
+        print(str(e))
+        
     except Exception as e:
         print(f"\nError occurred: {str(e)}")
         print("Process failed!")
         import traceback
         traceback.print_exc()
         sys.exit(1)
+        
+    finally:
+        profiler.write_summary()
+        if Config.RUN_REPORT_PATH:
+            telemetry.write_report(Config.RUN_REPORT_PATH)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
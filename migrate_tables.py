@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+billing_data / customer_profile 的分區與分群遷移
+每月報表的查詢都以 month = 篩選、以 billing_account_id 對應：表格依 month 整數範圍分區並以 billing_account_id 分群後，
+每次執行只掃描該月份的分區，掃描量不隨歷史月份增加
+用法:
+    python migrate_tables.py                  # 檢查表格並以 dry run 確認報表查詢只掃描一個分區 (不修改表格)
+    python migrate_tables.py --apply          # 建立分區 + 分群的副本並換上 (原表保留為 {table}_unpartitioned_{YYYYMMDD})
+    python migrate_tables.py --month 202505   # 以指定月份 dry run (預設為最新月份)
+換表期間不應有其他寫入：副本與原表列數不同時不換表
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from google.cloud import bigquery
+from config import Config
+from services.bigquery_service import (
+    CLUSTERING_FIELDS,
+    MONTH_PARTITION_END,
+    MONTH_PARTITION_START,
+    BigQueryService
+)
+
+TABLES = (Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE)
+MB = 1024 * 1024
+
+def table_ref(table_name: str) -> str:
+    return f"{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}"
+
+def inspect_table(client, table_name: str) -> dict:
+    """
+    表格的分區與分群設定
+    Returns: {'table', 'rows', 'bytes', 'month_type', 'partitioned', 'clustered', 'ok'}
+    """
+    table = client.get_table(table_ref(table_name))
+    month_type = next((field.field_type for field in table.schema if field.name == "month"), None)
+    range_partitioning = table.range_partitioning
+    partitioned = range_partitioning is not None and range_partitioning.field == "month"
+    clustered = list(table.clustering_fields or [])[:len(CLUSTERING_FIELDS)] == CLUSTERING_FIELDS
+
+    return {
+        'table': table_name,
+        'rows': table.num_rows or 0,
+        'bytes': table.num_bytes or 0,
+        'month_type': month_type,
+        'partitioned': partitioned,
+        'clustered': clustered,
+        'ok': partitioned and clustered
+    }
+
+def copy_query(table_name: str) -> str:
+    """
+    建立依 month 分區、billing_account_id 分群的副本 (重跑時覆蓋上次未完成的副本)
+    """
+    return f"""
+    CREATE OR REPLACE TABLE `{table_ref(table_name)}_partitioned`
+    PARTITION BY RANGE_BUCKET(month, GENERATE_ARRAY({MONTH_PARTITION_START}, {MONTH_PARTITION_END}, 1))
+    CLUSTER BY {', '.join(CLUSTERING_FIELDS)}
+    AS SELECT * FROM `{table_ref(table_name)}`
+    """
+
+def swap_queries(table_name: str, backup_name: str) -> list:
+    """
+    原表改名為 backup_name，副本改名為原表名稱
+    """
+    return [
+        f"ALTER TABLE `{table_ref(table_name)}` RENAME TO `{backup_name}`",
+        f"ALTER TABLE `{table_ref(table_name)}_partitioned` RENAME TO `{table_name}`",
+    ]
+
+def run_query(client, query: str):
+    query_job = client.query(query)
+    query_job.result(timeout=1800)
+    return query_job
+
+def migrate_table(client, table_name: str, backup_suffix: str) -> str:
+    """
+    建立分區 + 分群的副本，列數相同時換上
+    Returns: 原表的備份名稱
+    """
+    info = inspect_table(client, table_name)
+    if info['month_type'] not in ("INTEGER", "INT64"):
+        raise RuntimeError(f"{table_name}.month is {info['month_type']}, integer range partitioning needs INT64")
+
+    print(f"Copying {table_name} ({info['rows']:,} rows) into a partitioned, clustered table...")
+    run_query(client, copy_query(table_name))
+
+    copy_rows = client.get_table(f"{table_ref(table_name)}_partitioned").num_rows or 0
+    if copy_rows != info['rows']:
+        client.delete_table(f"{table_ref(table_name)}_partitioned", not_found_ok=True)
+        raise RuntimeError(
+            f"{table_name} changed during migration ({info['rows']:,} rows, copy has {copy_rows:,}); table not swapped"
+        )
+
+    backup_name = f"{table_name}_unpartitioned_{backup_suffix}"
+    for query in swap_queries(table_name, backup_name):
+        run_query(client, query)
+    print(f"Swapped in partitioned {table_name}; original kept as {backup_name}")
+    return backup_name
+
+def partition_bytes(client, table_name: str) -> dict:
+    """
+    各分區的資料量 (INFORMATION_SCHEMA.PARTITIONS，只讀取 metadata)
+    Returns: {partition_id: total_logical_bytes}
+    """
+    query = f"""
+    SELECT partition_id, total_rows, total_logical_bytes
+    FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.INFORMATION_SCHEMA.PARTITIONS`
+    WHERE table_name = '{table_name}'
+    """
+    df = client.query(query).result(timeout=60).to_dataframe()
+    return {
+        str(partition_id): int(size or 0)
+        for partition_id, size in zip(df['partition_id'], df['total_logical_bytes'])
+        if partition_id is not None
+    }
+
+def verify_pruning(client, month: int) -> list:
+    """
+    以 dry run 取得每個報表查詢的掃描量：不超過該月份分區的大小時，查詢只掃描一個分區
+    Returns: [{'query', 'table', 'bytes', 'partition_bytes', 'pruned'}]
+    """
+    sizes = {table_name: partition_bytes(client, table_name) for table_name in TABLES}
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+
+    results = []
+    for name, (table_name, query) in BigQueryService.report_queries(month).items():
+        scanned = client.query(query, job_config=job_config).total_bytes_processed or 0
+        month_bytes = sizes[table_name].get(str(month))
+        results.append({
+            'query': name,
+            'table': table_name,
+            'bytes': scanned,
+            'partition_bytes': month_bytes,
+            'pruned': month_bytes is not None and scanned <= month_bytes
+        })
+    return results
+
+def print_tables(infos: list):
+    print(f"  {'table':<20} {'rows':>14} {'MB':>10} {'month':>8} {'partitioned':>12} {'clustered':>10}")
+    for info in infos:
+        print(f"  {info['table']:<20} {info['rows']:>14,} {info['bytes'] / MB:>10,.1f} "
+              f"{str(info['month_type']):>8} {str(info['partitioned']):>12} {str(info['clustered']):>10}")
+
+def print_pruning(results: list, month: int):
+    print(f"\nDry run for month {month}:")
+    print(f"  {'query':<20} {'table':<20} {'scanned MB':>12} {'partition MB':>13} {'pruned':>7}")
+    for result in results:
+        partition = "-" if result['partition_bytes'] is None else f"{result['partition_bytes'] / MB:,.2f}"
+        print(f"  {result['query']:<20} {result['table']:<20} {result['bytes'] / MB:>12,.2f} "
+              f"{partition:>13} {str(result['pruned']):>7}")
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Partition billing_data / customer_profile by month and verify pruning")
+    parser.add_argument('--apply', action='store_true',
+                        help="copy tables that are not partitioned/clustered and swap them in")
+    parser.add_argument('--month', type=int, default=None, help="month (YYYYMM) to dry run (default latest)")
+    return parser.parse_args(argv)
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    bq_service = BigQueryService()
+    client = bq_service.client
+
+    infos = [inspect_table(client, table_name) for table_name in TABLES]
+    print("Tables:")
+    print_tables(infos)
+
+    pending = [info['table'] for info in infos if not info['ok']]
+    if pending and args.apply:
+        backup_suffix = datetime.now().strftime('%Y%m%d')
+        for table_name in pending:
+            migrate_table(client, table_name, backup_suffix)
+        infos = [inspect_table(client, table_name) for table_name in TABLES]
+        print("\nTables after migration:")
+        print_tables(infos)
+    elif pending:
+        print(f"\nNot partitioned on month / clustered on billing_account_id: {', '.join(pending)} "
+              f"(run with --apply to migrate)")
+
+    month = args.month or bq_service.get_latest_month()
+    if month is None:
+        print("No data found in BigQuery tables, skipping dry run")
+        return 1
+
+    results = verify_pruning(client, month)
+    print_pruning(results, month)
+
+    unpruned = [result['query'] for result in results if not result['pruned']]
+    if unpruned or not all(info['ok'] for info in infos):
+        print(f"\nReport queries scanning more than one partition: {', '.join(unpruned) or 'none'}")
+        return 1
+
+    print("\nAll report queries prune to a single month partition")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
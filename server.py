@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+常駐 HTTP 服務：BigQuery / gspread / NetSuite client 只建立一次，重複執行報表與付款狀態檢查
+    POST /reports          {"month": 202506, "force": false}      產生指定月份 (未指定時為最新月份) 的報表
+    POST /payment-status   {"year": 2025, "lookback_months": 0}   檢查並更新付款狀態
+    POST /payment-events   {"data": [...]}                        NetSuite 發票狀態變更事件 (定期批次寫回)
+    GET  /jobs/{id}        工作狀態與結果
+    GET  /health           服務狀態
+POST 請求需帶 token (/reports、/payment-status 為 SERVER_TOKEN，/payment-events 為 PUSH_SHARED_SECRET)，未設定時拒絕
+寫入報表的工作以同一個 key 依序執行 (single-writer)：同一時間只有一個工作寫入報表
+用法: SERVER_TOKEN=... python server.py [--host 127.0.0.1] [--port 8080]
+"""
+
+import argparse
+import functools
+import hmac
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+from utils.job_queue import JobQueue, QueueFull
+from utils.pipeline import PipelineStopped
+
+# 所有工作都寫入同一份報表 (Sheets 列號會因寫入而移動，Report_Index 為所有年份共用)，以同一個 key 依序執行
+# 其他 worker 只會等待這個 key，因此預設 SERVER_WORKERS=1
+REPORT_JOB_KEY = "report_sink"
+
+class WarmServices:
+    """
+    常駐的服務 instance，第一次使用時建立 (或啟動時預先建立)，之後所有工作共用
+    lease_manager: 所有工作共用的 Report_{year} / Report_Index 寫入 lease (None 時不加鎖)
+    """
+
+    def __init__(self, services: dict = None, lease_manager=None):
+        self._services = dict(services or {})
+        self.lease_manager = lease_manager
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return all(name in self._services for name in ('bq_service', 'netsuite_service', 'report_sink'))
+
+    def get(self) -> dict:
+        with self._lock:
+            if 'bq_service' not in self._services:
+                from services.bigquery_service import BigQueryService
+                bq_service = BigQueryService()
+                if not bq_service.test_connection():
+                    raise PipelineStopped("BigQuery connection failed. Please check permissions.")
+                self._services['bq_service'] = bq_service
+
+            if 'netsuite_service' not in self._services:
+                from services.netsuite_service import NetSuiteService
+                self._services['netsuite_service'] = NetSuiteService(bq_service=self._services['bq_service'])
+
+            if 'report_sink' not in self._services:
+                from services.report_sink import create_report_sink
+                self._services['report_sink'] = create_report_sink(lease_manager=self.lease_manager)
+
+            return dict(self._services)
+
+def generate_report(warm_services: WarmServices, month: int = None, force: bool = False) -> dict:
+    """
+    以常駐的服務執行 main.py 的報表 pipeline
+    """
+    import main
+    results = main.run_pipeline(
+        force=force, data_month=month, services=warm_services.get(), lease_manager=warm_services.lease_manager
+    )
+    integrated_data = results.get('integrated_data')
+    return {
+        'data_month': results.get('data_month'),
+        'written': bool(results.get('write')),
+        'rows': 0 if integrated_data is None else len(integrated_data)
+    }
+
+def refresh_payment_status(warm_services: WarmServices, year: int, lookback_months: int = 0) -> dict:
+    """
+    以常駐的服務執行 check_payment.py 的付款狀態檢查
+    """
+    import check_payment
+    services = warm_services.get()
+    all_updates = check_payment.check_and_update_payment_status(
+        year, services['report_sink'], services['netsuite_service'], lookback_months=lookback_months
+    )
+    return {'updated': {str(year): len(updates) for year, updates in all_updates.items()}}
+
+class BadRequest(Exception):
+    pass
+
+class Unauthorized(Exception):
+    pass
+
+def _int_param(body: dict, name: str, default=None, minimum: int = None, maximum: int = None):
+    value = body.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+        raise BadRequest(f"{name} must be an integer")
+    value = int(value)
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise BadRequest(f"{name} out of range: {value}")
+    return value
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "ReferralReport/1.0"
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.server.health())
+        elif self.path.startswith('/jobs/'):
+            job = self.server.jobs.get(self.path[len('/jobs/'):])
+            if job is None:
+                self._send(404, {'error': "job not found"})
+            else:
+                self._send(200, job.to_dict())
+        else:
+            self._send(404, {'error': "not found"})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+            if self.path in ('/reports', '/payment-status'):
+                self._check_server_token()
+            if self.path == '/reports':
+                params = {
+                    'month': _int_param(body, 'month', minimum=190001, maximum=299912),
+                    'force': bool(body.get('force', False))
+                }
+                job = self.server.submit("report", generate_report, params)
+            elif self.path == '/payment-events':
+                self._check_push_token()
+                self._send(202, self.server.receive_payment_events(body))
+                return
+            elif self.path == '/payment-status':
+                params = {
+                    'year': _int_param(body, 'year', datetime.now().year, minimum=1900, maximum=2999),
+                    'lookback_months': _int_param(body, 'lookback_months', 0, minimum=0, maximum=120)
+                }
+                job = self.server.submit("payment_status", refresh_payment_status, params)
+            else:
+                self._send(404, {'error': "not found"})
+                return
+        except BadRequest as e:
+            self._send(400, {'error': str(e)})
+            return
+        except Unauthorized as e:
+            self._send(401, {'error': str(e)})
+            return
+        except QueueFull as e:
+            self._send(503, {'error': str(e)})
+            return
+
+        self._send(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}", flush=True)
+
+    def _check_server_token(self):
+        scheme, _, token = (self.headers.get('Authorization') or '').partition(' ')
+        if not Config.SERVER_TOKEN:
+            raise Unauthorized("SERVER_TOKEN is not configured")
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip(), Config.SERVER_TOKEN):
+            raise Unauthorized("invalid server token")
+
+    def _check_push_token(self):
+        token = self.headers.get('X-Push-Token') or ''
+        if not Config.PUSH_SHARED_SECRET:
+            raise Unauthorized("PUSH_SHARED_SECRET is not configured")
+        if not hmac.compare_digest(token, Config.PUSH_SHARED_SECRET):
+            raise Unauthorized("invalid push token")
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise BadRequest(f"invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise BadRequest("request body must be a JSON object")
+        return body
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class ReportServer(ThreadingHTTPServer):
+    """
+    HTTP 服務本體：持有常駐的服務與工作佇列
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, warm_services: WarmServices = None,
+                 workers: int = None, max_queued: int = None):
+        super().__init__(address, RequestHandler)
+        self.warm_services = warm_services or WarmServices()
+        self.jobs = JobQueue(workers or Config.SERVER_WORKERS, max_queued or Config.SERVER_MAX_QUEUED)
+        self.started_at = time.time()
+        self._payment_events = None
+        self._flush_job = None
+        self._events_lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def submit(self, kind: str, func, params: dict):
+        return self.jobs.submit(kind, functools.partial(func, self.warm_services), params, key=REPORT_JOB_KEY)
+
+    def receive_payment_events(self, payload: dict) -> dict:
+        """
+        事件放入 buffer，累積達 PUSH_MAX_BUFFERED 筆時立即排入寫回工作
+        """
+        with self._events_lock:
+            if self._payment_events is None:
+                from services.payment_events import PaymentEventReceiver
+                services = self.warm_services.get()
+                self._payment_events = PaymentEventReceiver(
+                    services['report_sink'], services['bq_service'], lease_manager=self.warm_services.lease_manager
+                )
+
+        summary = self._payment_events.add_events(payload)
+        if summary['buffered'] >= Config.PUSH_MAX_BUFFERED:
+            self.flush_payment_events()
+        return summary
+
+    def flush_payment_events(self):
+        """
+        排入一個寫回工作 (前一個寫回工作尚未完成時不重複排入)
+        """
+        with self._events_lock:
+            receiver = self._payment_events
+            if receiver is None or not receiver.pending:
+                return None
+            if self._flush_job is not None and self._flush_job.finished_at is None:
+                return self._flush_job
+            try:
+                self._flush_job = self.jobs.submit("payment_events", receiver.flush, {}, key=REPORT_JOB_KEY)
+            except QueueFull:
+                return None
+            return self._flush_job
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(Config.PUSH_FLUSH_SECONDS):
+            self.flush_payment_events()
+
+    def health(self) -> dict:
+        return {
+            'status': "ok",
+            'clients_ready': self.warm_services.ready,
+            'workers': self.jobs.workers,
+            **self.jobs.counts(),
+            'pending_events': self._payment_events.pending if self._payment_events else 0,
+            'uptime_s': round(time.time() - self.started_at, 1)
+        }
+
+    def server_close(self):
+        self._stopped.set()
+        super().server_close()
+        self.jobs.shutdown(wait=False)
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Referral report service with warm API clients")
+    parser.add_argument('--host', default=Config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--no-warm', action='store_true', help="create clients on the first job instead of at startup")
+    args = parser.parse_args(argv)
+
+    import main as report_main
+    warm_services = WarmServices(lease_manager=report_main.create_lease_manager())
+    server = ReportServer((args.host, args.port), warm_services, workers=args.workers)
+    if not args.no_warm:
+        # 在背景建立 client，/health 不需等待
+        threading.Thread(target=server.warm_services.get, daemon=True).start()
+
+    print(f"Listening on {args.host}:{server.server_address[1]} ({args.workers} workers)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+from google.cloud import bigquery
+import pandas as pd
+from config import Config
+from services.bigquery_service import CLUSTERING_FIELDS, month_range_partitioning
+from services.report_sink import ReportSink
+from utils.telemetry import current_span, traced
+from utils.waiting_records import WaitingRecord
+
+# 報表欄位 (依 Config.OUTPUT_COLUMNS 順序) 對應到 BigQuery 報表表欄位
+REPORT_FIELDS = [
+    bigquery.SchemaField("month", "INT64", mode="REQUIRED"),
+    bigquery.SchemaField("billing_account_name", "STRING"),
+    bigquery.SchemaField("currency", "STRING"),
+    bigquery.SchemaField("spending", "FLOAT64"),
+    bigquery.SchemaField("referral_share_rate", "FLOAT64"),
+    bigquery.SchemaField("profit", "FLOAT64"),
+    bigquery.SchemaField("referral_company", "STRING"),
+    bigquery.SchemaField("payment_status", "STRING"),
+    bigquery.SchemaField("salesrep", "STRING"),
+    bigquery.SchemaField("edp_type", "STRING"),
+]
+
+# 同一個 billing_account_id 在一個月份可有多列 (customer_profile 每個 service_set 一列)，
+# row_index 為該帳號在月份內的序號，(month, billing_account_id, row_index) 唯一
+ROW_INDEX_FIELD = bigquery.SchemaField("row_index", "INT64")
+
+REPORT_SCHEMA = [
+    bigquery.SchemaField("billing_account_id", "STRING", mode="REQUIRED"),
+    ROW_INDEX_FIELD,
+    *REPORT_FIELDS,
+    bigquery.SchemaField("updated_at", "TIMESTAMP"),
+]
+
+NUMERIC_FIELDS = ("spending", "referral_share_rate", "profit")
+
+# fingerprint 以 label (fp_{month}) 保存，BigQuery 每個表格最多 64 個 label，只保留最近的月份
+FINGERPRINT_LABEL_PREFIX = "fp_"
+FINGERPRINT_LABEL_MONTHS = 24
+
+class BigQueryReportSink(ReportSink):
+    """
+    將報表寫入 BigQuery 報表表 (依 month 整數範圍分區，billing_account_id 分群)
+    每次寫入以一個 load job 載入 staging 表，再以 MERGE 依 (month, billing_account_id, row_index) upsert
+    waiting 記錄以 SQL 查詢，row_number 為 (month, billing_account_id)
+    """
+
+    def __init__(self, bq_service=None, table: str = None):
+        if bq_service is None:
+            from services.bigquery_service import BigQueryService
+            bq_service = BigQueryService()
+
+        self.client = bq_service.client
+        dataset = f"{Config.PROJECT_ID}.{Config.REPORT_DATASET_ID}"
+        table = table or Config.REPORT_TABLE
+        self.table_id = f"{dataset}.{table}"
+        self.staging_prefix = f"{dataset}.{table}_staging"
+        self._table_ready = False
+
+    def prepare_worksheet(self, year: int) -> str:
+        """
+        建立報表表 (已存在時不變動)
+        """
+        if not self._table_ready:
+            table = bigquery.Table(self.table_id, schema=REPORT_SCHEMA)
+            table.range_partitioning = month_range_partitioning()
+            table.clustering_fields = CLUSTERING_FIELDS
+            table = self.client.create_table(table, exists_ok=True)
+            # 加入 row_index 之前建立的報表表：補上欄位 (既有列為 NULL，視為 0)
+            if all(field.name != ROW_INDEX_FIELD.name for field in table.schema):
+                table.schema = [*table.schema, ROW_INDEX_FIELD]
+                self.client.update_table(table, ["schema"])
+            self._table_ready = True
+        return self.table_id
+
+    @traced("bigquery_sink.write_monthly_data")
+    def write_monthly_data(self, data: pd.DataFrame, year: int, month: int):
+        current_span().set(rows=len(data), month=month)
+        self.prepare_worksheet(year)
+
+        staging_id = f"{self.staging_prefix}_{month}"
+        self._load(self.to_report_frame(data, month), staging_id)
+
+        # 同月份不在本次資料中的列刪除 (與 Google Sheets 覆蓋整個月份相同)
+        columns = [field.name for field in REPORT_FIELDS] + ["billing_account_id", "row_index"]
+        keys = ('month', 'billing_account_id', 'row_index')
+        query = f"""
+        MERGE `{self.table_id}` T
+        USING `{staging_id}` S
+        ON T.month = {month} AND T.month = S.month AND T.billing_account_id = S.billing_account_id
+            AND IFNULL(T.row_index, 0) = S.row_index
+        WHEN MATCHED THEN
+            UPDATE SET {', '.join(f'{c} = S.{c}' for c in columns if c not in keys)},
+                updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({', '.join(columns)}, updated_at)
+            VALUES ({', '.join(f'S.{c}' for c in columns)}, CURRENT_TIMESTAMP())
+        WHEN NOT MATCHED BY SOURCE AND T.month = {month} THEN
+            DELETE
+        """
+        self._run(query)
+        self.client.delete_table(staging_id, not_found_ok=True)
+        print(f"Successfully merged {len(data)} rows into {self.table_id}")
+
+    @traced("bigquery_sink.get_waiting_records")
+    def get_waiting_records(self, year: int) -> list:
+        return self.get_waiting_records_by_year([year])[year]
+
+    @traced("bigquery_sink.get_waiting_records_by_year")
+    def get_waiting_records_by_year(self, years: list) -> dict:
+        """
+        多個年份以一次查詢讀取 (月份分區只掃描涵蓋的範圍)
+        """
+        self.prepare_worksheet(min(years))
+        query = f"""
+        SELECT month, billing_account_id, billing_account_name
+        FROM `{self.table_id}`
+        WHERE month BETWEEN {min(years)}01 AND {max(years)}12
+            AND payment_status = 'waiting'
+        ORDER BY month, billing_account_name
+        """
+        df = self._run(query).to_dataframe()
+
+        records = {year: [] for year in years}
+        for month, billing_account_id, name in zip(
+            df['month'], df['billing_account_id'], df['billing_account_name']
+        ):
+            year = int(month) // 100
+            if year in records:
+                records[year].append(WaitingRecord((int(month), billing_account_id), str(month), name))
+        return records
+
+    @traced("bigquery_sink.update_payment_status")
+    def update_payment_status(self, year: int, updates: list):
+        self.update_payment_status_by_year({year: updates})
+
+    @traced("bigquery_sink.update_payment_status_by_year")
+    def update_payment_status_by_year(self, updates_by_year: dict):
+        """
+        所有年份的更新以一個 load job + 一個 UPDATE 完成
+        """
+        years = [year for year, updates in updates_by_year.items() if updates]
+        if not years:
+            return
+
+        # 同一帳號的多列共用 row_number (month, billing_account_id)，staging 每個 row_number 只保留一列
+        updates = list({
+            update['row_number']: update for year in years for update in updates_by_year[year]
+        }.values())
+        current_span().set(rows=len(updates))
+        first_year, last_year = min(years), max(years)
+        staging_id = f"{self.staging_prefix}_status_{last_year}"
+        self._load(
+            pd.DataFrame({
+                'month': [update['row_number'][0] for update in updates],
+                'billing_account_id': [update['row_number'][1] for update in updates],
+                'payment_status': [update['new_status'] for update in updates]
+            }),
+            staging_id,
+            schema=[
+                bigquery.SchemaField("month", "INT64"),
+                bigquery.SchemaField("billing_account_id", "STRING"),
+                bigquery.SchemaField("payment_status", "STRING"),
+            ]
+        )
+
+        query = f"""
+        UPDATE `{self.table_id}` T
+        SET payment_status = S.payment_status, updated_at = CURRENT_TIMESTAMP()
+        FROM `{staging_id}` S
+        WHERE T.month BETWEEN {first_year}01 AND {last_year}12
+            AND T.month = S.month AND T.billing_account_id = S.billing_account_id
+        """
+        self._run(query)
+        self.client.delete_table(staging_id, not_found_ok=True)
+
+    def update_spreadsheet_title(self, month: int):
+        """
+        報表表沒有檔名，將報表名稱寫入表格說明
+        """
+        table = self.client.get_table(self.table_id)
+        table.description = Config.REPORT_FILE_NAME_FORMAT.format(month=month)
+        self.client.update_table(table, ["description"])
+        print(f"Report table description updated to: {table.description}")
+
+    def get_fingerprint(self, month: int) -> str:
+        """
+        fingerprint 保存在報表表的 label (fp_{month})
+        """
+        table = self.client.get_table(self.table_id)
+        return (table.labels or {}).get(f"{FINGERPRINT_LABEL_PREFIX}{month}")
+
+    def set_fingerprint(self, month: int, fingerprint: str):
+        """
+        update_table 合併 label (不會移除舊的 label)：同一次更新中將最近 FINGERPRINT_LABEL_MONTHS 個月份以外的
+        fp_ label 設為 None 刪除，label 數量不隨月份增加 (較早的月份沒有 fingerprint，重跑時照常寫入)
+        """
+        table = self.client.get_table(self.table_id)
+        existing = {
+            key for key in (table.labels or {})
+            if key.startswith(FINGERPRINT_LABEL_PREFIX) and key[len(FINGERPRINT_LABEL_PREFIX):].isdigit()
+        }
+        key = f"{FINGERPRINT_LABEL_PREFIX}{month}"
+        recent = sorted(existing | {key}, key=lambda name: int(name[len(FINGERPRINT_LABEL_PREFIX):]))
+        recent = set(recent[-FINGERPRINT_LABEL_MONTHS:])
+
+        labels = {name: None for name in existing - recent}
+        if key in recent:
+            labels[key] = fingerprint
+        table.labels = labels
+        self.client.update_table(table, ["labels"])
+
+    @staticmethod
+    def to_report_frame(data: pd.DataFrame, month: int) -> pd.DataFrame:
+        """
+        integrate_data 輸出 (index 為 billing_account_id) 轉為報表表欄位
+        數值欄位的錯誤訊息 (例如 "not found") 轉為 NULL，文字欄位保留
+        """
+        report = data.copy()
+        report.columns = [field.name for field in REPORT_FIELDS]
+        report['month'] = int(month)
+
+        for column in NUMERIC_FIELDS:
+            report[column] = pd.to_numeric(report[column], errors='coerce')
+        for field in REPORT_FIELDS:
+            if field.field_type == "STRING":
+                values = report[field.name].astype(object)
+                report[field.name] = values.where(values.notna() & (values != ''), None)
+
+        report.insert(0, 'billing_account_id', data.index.astype(str))
+        report = report.reset_index(drop=True)
+        report.insert(1, 'row_index', report.groupby('billing_account_id', sort=False).cumcount().astype('int64'))
+        return report
+
+    def _load(self, df: pd.DataFrame, table_id: str, schema: list = None):
+        """
+        以一個 load job (Parquet) 取代 staging 表內容
+        """
+        job_config = bigquery.LoadJobConfig(
+            schema=schema or [field for field in REPORT_SCHEMA if field.name != "updated_at"],
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            source_format=bigquery.SourceFormat.PARQUET
+        )
+        load_job = self.client.load_table_from_dataframe(df, table_id, job_config=job_config)
+        load_job.result(timeout=300)
+        current_span().add(bytes=load_job.output_bytes or 0)
+
+    def _run(self, query: str):
+        query_job = self.client.query(query)
+        result = query_job.result(timeout=300)
+        span = current_span()
+        span.add(bytes=query_job.total_bytes_processed or 0)
+        span.set(job_id=query_job.job_id)
+        return result
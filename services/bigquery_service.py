@@ -1,22 +1,32 @@
 from google.cloud import bigquery
-from google.oauth2 import service_account
 import pandas as pd
 from config import Config
+from services import clients
+from utils.telemetry import current_span, traced
 import time
 
+# 每月的資料表依 month 整數範圍分區 (每個月份一個分區)，以 billing_account_id 分群
+MONTH_PARTITION_START = 201901
+MONTH_PARTITION_END = 210001
+CLUSTERING_FIELDS = ["billing_account_id"]
+
+def month_range_partitioning() -> bigquery.RangePartitioning:
+    return bigquery.RangePartitioning(
+        field="month",
+        range_=bigquery.PartitionRange(start=MONTH_PARTITION_START, end=MONTH_PARTITION_END, interval=1)
+    )
+
 class BigQueryService:
+    @traced("bigquery.connect")
     def __init__(self):
-        credentials = service_account.Credentials.from_service_account_file(
-            Config.SERVICE_ACCOUNT_FILE
-        )
-        self.client = bigquery.Client(
-            credentials=credentials,
-            project=Config.PROJECT_ID
-        )
+        # credentials 與 client 由整個 process 共用，只在第一次建立
+        self.client = clients.bigquery_client()
     
-    def get_latest_month_data(self):
+    def get_latest_month_data(self, streaming: bool = False, billing_export_path: str = None):
         """
         自動取得最新月份的資料 Returns: (billing_data_df, customer_profile_df, target_month)
+        streaming: 逐頁讀取原始 billing_data 並累加聚合，記憶體只與帳號數量有關
+        billing_export_path: 串流模式改讀本地 Parquet/CSV 匯出檔
         """
         # 查詢最新的月份
         latest_month = self._get_latest_month()
@@ -34,29 +44,46 @@ class BigQueryService:
         print(f"Expected records - Billing: {billing_count:,}, Customer: {customer_count:,}")
         
         # 取得該月份的資料
-        billing_data = self.get_billing_data_optimized(latest_month)
+        billing_data = self.get_billing_data(latest_month, streaming, billing_export_path)
         customer_profile = self.get_customer_profile(latest_month)
         
         return billing_data, customer_profile, latest_month
     
+    def get_latest_month(self) -> int:
+        """
+        取得兩個資料表都有資料的最新月份
+        """
+        return self._get_latest_month()
+    
+    def get_billing_data(self, month: int, streaming: bool = False, billing_export_path: str = None,
+                         page_size: int = None) -> pd.DataFrame:
+        """
+        依讀取模式取得每個帳號的聚合 billing_data
+        page_size: 串流模式的頁大小 (未指定時使用 Config.BILLING_PAGE_SIZE)
+        """
+        if streaming:
+            return self.get_billing_data_streaming(month, billing_export_path, page_size)
+        return self.get_billing_data_optimized(month)
+    
+    @traced("bigquery.get_month_record_count")
     def _get_month_record_count(self, table_name: str, month: int) -> int:
         """
         取得指定月份的記錄數量
         """
-        query = f"""
-        SELECT COUNT(*) as count
-        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}`
-        WHERE month = {month}
-        """
+        query = self.month_count_query(table_name, month)
         
         try:
-            result = self.client.query(query).result(timeout=30)
+            query_job = self.client.query(query)
+            result = query_job.result(timeout=30)
+            self._record_job(query_job)
             for row in result:
                 return row.count
         except Exception as e:
+            current_span().fail(e)
             print(f"Error counting records: {e}")
             return 0
     
+    @traced("bigquery.get_billing_data_optimized")
     def get_billing_data_optimized(self, month: int) -> pd.DataFrame:
         """
         只查詢必要欄位，加入聚合
@@ -64,28 +91,7 @@ class BigQueryService:
         Returns: 聚合後的 billing_data 資料
         """
         # 在 BigQuery 端先聚合，處理 credits 
-        query = f"""
-        SELECT 
-            billing_account_id,
-            currency,
-            SUM(cost) as total_cost,
-            SUM(
-                CASE 
-                    WHEN credits IS NOT NULL AND ARRAY_LENGTH(credits) > 0
-                    THEN (
-                        SELECT SUM(CAST(credit.amount AS FLOAT64)) 
-                        FROM UNNEST(credits) AS credit 
-                        WHERE credit.amount IS NOT NULL
-                    )
-                    ELSE 0 
-                END
-            ) as total_credits,
-            month,
-            COUNT(*) as record_count
-        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}`
-        WHERE month = {month}
-        GROUP BY billing_account_id, currency, month
-        """
+        query = self.billing_aggregated_query(month)
         
         try:
             print(f"Querying aggregated billing_data for month {month}...")
@@ -106,6 +112,7 @@ class BigQueryService:
                 query_job.reload()
             
             result = query_job.result(timeout=180)  # 3分鐘超時
+            self._record_job(query_job)
             
             print("Converting to DataFrame...")
             df = result.to_dataframe()
@@ -121,50 +128,121 @@ class BigQueryService:
             return df
             
         except Exception as e:
+            current_span().fail(e)
             print(f"Error querying billing_data: {e}")
             return pd.DataFrame()
     
-    def _get_latest_month(self) -> int:
+    @traced("bigquery.get_billing_data_streaming")
+    def get_billing_data_streaming(self, month: int, billing_export_path: str = None,
+                                   page_size: int = None) -> pd.DataFrame:
         """
-        取得資料表中最新的月份
+        串流模式：逐頁讀取原始 billing_data，累加為每個帳號的聚合結果
+        Returns: 與 get_billing_data_optimized 相同欄位的聚合資料
         """
-        queries = [
-            f"""
-            SELECT MAX(month) as latest_month 
-            FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}`
-            """,
-            f"""
-            SELECT MAX(month) as latest_month 
-            FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.CUSTOMER_PROFILE_TABLE}`
-            """
-        ]
+        from utils.billing_export import iter_billing_export
+        from utils.data_processor import DataProcessor
         
-        latest_months = []
+        start_time = time.time()
+        page_size = page_size or Config.BILLING_PAGE_SIZE
         
-        for query in queries:
-            try:
-                job_config = bigquery.QueryJobConfig()
-                query_job = self.client.query(query, job_config=job_config)
-                result = query_job.result(timeout=30)
-                df = result.to_dataframe()
-                
-                if not df.empty and not pd.isna(df.iloc[0]['latest_month']):
-                    latest_months.append(int(df.iloc[0]['latest_month']))
-                    
-            except Exception as e:
-                print(f"Error querying latest month: {e}")
-                continue
+        if billing_export_path:
+            print(f"Streaming billing export {billing_export_path} for month {month}...")
+            chunks = iter_billing_export(billing_export_path, month, page_size)
+        else:
+            chunks = self.iter_billing_data(month, page_size)
         
-        if not latest_months:
-            return None
+        try:
+            df = DataProcessor.aggregate_billing_chunks(chunks)
+        except Exception as e:
+            current_span().fail(e)
+            print(f"Error streaming billing_data: {e}")
+            return pd.DataFrame()
         
-        return min(latest_months)
+        elapsed_time = time.time() - start_time
+        print(f"Aggregated {len(df)} billing accounts in {elapsed_time:.2f} seconds")
+        return df
     
-    def get_customer_profile(self, month: int) -> pd.DataFrame:
+    def iter_billing_data(self, month: int, page_size: int):
         """
-        取得指定月份的 customer_profile
+        逐頁讀取指定月份的原始 billing_data (不聚合)
+        Yields: 每頁一個 DataFrame
+        """
+        query = self.billing_raw_query(month)
+        
+        print(f"Querying raw billing_data for month {month} (page size {page_size:,})...")
+        job_config = bigquery.QueryJobConfig()
+        job_config.use_query_cache = True
+        
+        query_job = self.client.query(query, job_config=job_config)
+        result = query_job.result(page_size=page_size, timeout=180)
+        self._record_job(query_job)
+        
+        page_count = 0
+        for page in result.to_dataframe_iterable():
+            page_count += 1
+            current_span().add(rows=len(page))
+            yield page
+        
+        print(f"Read {page_count} pages of raw billing_data")
+    
+    def _record_job(self, query_job):
+        """
+        將查詢工作的掃描量記錄到目前的 span
         """
-        query = f"""
+        span = current_span()
+        span.add(bytes=query_job.total_bytes_processed or 0)
+        span.set(job_id=query_job.job_id, cache_hit=query_job.cache_hit)
+    
+    # 每月報表的查詢 (都以 month 篩選，migrate_tables.py 以 dry run 確認只掃描一個分區)
+    @staticmethod
+    def month_count_query(table_name: str, month: int) -> str:
+        return f"""
+        SELECT COUNT(*) as count
+        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}`
+        WHERE month = {month}
+        """
+    
+    @staticmethod
+    def billing_aggregated_query(month: int) -> str:
+        return f"""
+        SELECT 
+            billing_account_id,
+            currency,
+            SUM(cost) as total_cost,
+            SUM(
+                CASE 
+                    WHEN credits IS NOT NULL AND ARRAY_LENGTH(credits) > 0
+                    THEN (
+                        SELECT SUM(CAST(credit.amount AS FLOAT64)) 
+                        FROM UNNEST(credits) AS credit 
+                        WHERE credit.amount IS NOT NULL
+                    )
+                    ELSE 0 
+                END
+            ) as total_credits,
+            month,
+            COUNT(*) as record_count
+        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}`
+        WHERE month = {month}
+        GROUP BY billing_account_id, currency, month
+        """
+    
+    @staticmethod
+    def billing_raw_query(month: int) -> str:
+        return f"""
+        SELECT 
+            billing_account_id,
+            currency,
+            cost,
+            credits,
+            month
+        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}`
+        WHERE month = {month}
+        """
+    
+    @staticmethod
+    def customer_profile_query(month: int) -> str:
+        return f"""
         SELECT 
             customer,
             service_set,
@@ -179,6 +257,105 @@ class BigQueryService:
         FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.CUSTOMER_PROFILE_TABLE}`
         WHERE month = {month}
         """
+    
+    @staticmethod
+    def latest_partition_query(table_name: str) -> str:
+        """
+        分區 metadata 中有資料的最新月份 (整數範圍分區的 partition_id 為月份，未分區的表格回傳 NULL)
+        """
+        return f"""
+        SELECT MAX(SAFE_CAST(partition_id AS INT64)) as latest_month
+        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = '{table_name}' AND total_rows > 0
+        """
+    
+    @staticmethod
+    def latest_month_query(table_name: str) -> str:
+        return f"""
+        SELECT MAX(month) as latest_month 
+        FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}`
+        """
+    
+    @classmethod
+    def report_queries(cls, month: int) -> dict:
+        """
+        每月報表對 billing_data / customer_profile 執行的查詢
+        Returns: {查詢名稱: (表格名稱, SQL)}
+        """
+        return {
+            'billing_count': (Config.BILLING_DATA_TABLE, cls.month_count_query(Config.BILLING_DATA_TABLE, month)),
+            'customer_count': (Config.CUSTOMER_PROFILE_TABLE, cls.month_count_query(Config.CUSTOMER_PROFILE_TABLE, month)),
+            'billing_aggregated': (Config.BILLING_DATA_TABLE, cls.billing_aggregated_query(month)),
+            'billing_raw': (Config.BILLING_DATA_TABLE, cls.billing_raw_query(month)),
+            'customer_profile': (Config.CUSTOMER_PROFILE_TABLE, cls.customer_profile_query(month)),
+        }
+    
+    @traced("bigquery.get_latest_month")
+    def _get_latest_month(self) -> int:
+        """
+        取得資料表中最新的月份
+        依 month 分區的表格從分區 metadata 取得 (不掃描資料)，未分區時才掃描整個 month 欄位
+        """
+        latest_months = []
+        
+        for table_name in (Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE):
+            for query in (self.latest_partition_query(table_name), self.latest_month_query(table_name)):
+                try:
+                    job_config = bigquery.QueryJobConfig()
+                    query_job = self.client.query(query, job_config=job_config)
+                    result = query_job.result(timeout=30)
+                    self._record_job(query_job)
+                    df = result.to_dataframe()
+                    
+                    if not df.empty and not pd.isna(df.iloc[0]['latest_month']):
+                        latest_months.append(int(df.iloc[0]['latest_month']))
+                        break
+                        
+                except Exception as e:
+                    current_span().fail(e)
+                    print(f"Error querying latest month: {e}")
+                    continue
+        
+        if not latest_months:
+            return None
+        
+        return min(latest_months)
+    
+    @traced("bigquery.get_table_modified_times")
+    def get_table_modified_times(self) -> dict:
+        """
+        取得 billing_data / customer_profile 的最後修改時間 (只讀取表格 metadata，不掃描資料)
+        Returns: {table_name: modified datetime}
+        """
+        modified_times = {}
+        for table_name in (Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE):
+            table = self.client.get_table(f"{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}")
+            modified_times[table_name] = table.modified
+        return modified_times
+    
+    @traced("bigquery.get_table_stats")
+    def get_table_stats(self) -> dict:
+        """
+        取得 billing_data / customer_profile 的列數與儲存大小 (只讀取表格 metadata，不掃描資料)
+        Returns: {table_name: {'num_rows', 'num_bytes'}}
+        """
+        table_stats = {}
+        for table_name in (Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE):
+            try:
+                table = self.client.get_table(f"{Config.PROJECT_ID}.{Config.DATASET_ID}.{table_name}")
+            except Exception as e:
+                current_span().fail(e)
+                print(f"Error reading table metadata for {table_name}: {e}")
+                continue
+            table_stats[table_name] = {'num_rows': table.num_rows or 0, 'num_bytes': table.num_bytes or 0}
+        return table_stats
+    
+    @traced("bigquery.get_customer_profile")
+    def get_customer_profile(self, month: int) -> pd.DataFrame:
+        """
+        取得指定月份的 customer_profile
+        """
+        query = self.customer_profile_query(month)
         
         try:
             print(f"Querying customer_profile for month {month}...")
@@ -189,6 +366,7 @@ class BigQueryService:
             
             query_job = self.client.query(query, job_config=job_config)
             result = query_job.result(timeout=60)
+            self._record_job(query_job)
             df = result.to_dataframe()
             
             elapsed_time = time.time() - start_time
@@ -196,9 +374,11 @@ class BigQueryService:
             return df
             
         except Exception as e:
+            current_span().fail(e)
             print(f"Error querying customer_profile: {e}")
             return pd.DataFrame()
     
+    @traced("bigquery.get_billing_account_ids")
     def get_billing_account_ids(self, month: int) -> list:
         
         # 從已查詢的資料中取得 billing_account_ids
@@ -209,6 +389,7 @@ class BigQueryService:
         
         return customer_profile['billing_account_id'].unique().tolist()
     
+    @traced("bigquery.test_connection")
     def test_connection(self):
         
         # 測試 BigQuery 連線
@@ -218,10 +399,13 @@ class BigQueryService:
             FROM `{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}`
             LIMIT 1
             """
-            result = self.client.query(query).result(timeout=30)
+            query_job = self.client.query(query)
+            result = query_job.result(timeout=30)
+            self._record_job(query_job)
             for row in result:
                 print(f"BigQuery connection successful. Total rows in billing_data: {row.row_count:,}")
             return True
         except Exception as e:
+            current_span().fail(e)
             print(f"BigQuery connection failed: {e}")
             return False
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+整個 process 共用的 Google API client (credentials 只讀取一次，client 只建立一次)
+重量級套件 (google.cloud.bigquery / gspread) 在第一次取得 client 時才 import
+"""
+
+import threading
+from config import Config
+
+SHEETS_SCOPES = (
+    'https://spreadsheets.google.com/feeds',
+    'https://www.googleapis.com/auth/drive'
+)
+
+_clients = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+def _get_or_create(key, factory):
+    """
+    取得 key 對應的 client，不存在時以 factory 建立 (同一個 key 只會建立一次)
+    """
+    if key in _clients:
+        return _clients[key]
+
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+
+    with lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+def credentials(scopes: tuple = None):
+    """
+    service account credentials，scopes 為 None 時由 client 使用預設 scopes
+    """
+    def load():
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_file(Config.SERVICE_ACCOUNT_FILE)
+
+    base = _get_or_create('credentials', load)
+    if scopes is None:
+        return base
+    return _get_or_create(('credentials', tuple(scopes)), lambda: base.with_scopes(list(scopes)))
+
+def bigquery_client():
+    def create():
+        from google.cloud import bigquery
+        return bigquery.Client(credentials=credentials(), project=Config.PROJECT_ID)
+
+    return _get_or_create('bigquery', create)
+
+def gspread_client():
+    def create():
+        import gspread
+        return gspread.authorize(credentials(SHEETS_SCOPES))
+
+    return _get_or_create('gspread', create)
+
+def http_session():
+    """
+    NetSuite 等 REST API 共用的 requests.Session (keep-alive 連線池，TLS 只建立一次)
+    """
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    return _get_or_create('http_session', create)
+
+def spreadsheet(spreadsheet_id: str = None):
+    """
+    開啟的試算表 (open_by_key 只呼叫一次)
+    """
+    spreadsheet_id = spreadsheet_id or Config.SHEETS_FILE_ID
+    return _get_or_create(('spreadsheet', spreadsheet_id), lambda: gspread_client().open_by_key(spreadsheet_id))
+
+def reset():
+    """
+    清除所有 client (測試或切換 credentials 時使用)
+    """
+    with _registry_lock:
+        _clients.clear()
+        _locks.clear()
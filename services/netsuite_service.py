@@ -1,10 +1,20 @@
+import contextvars
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from requests_oauthlib import OAuth1
 from config import Config
+from services import clients
+from utils.telemetry import current_span, traced
 
 class NetSuiteService:
-    def __init__(self):
+    def __init__(self, bq_service=None, session: requests.Session = None):
+        """
+        bq_service: 已連線的 BigQueryService (未指定時在第一次依名稱查詢時建立)
+        session: 已建立連線的 requests.Session (未指定時使用 process 共用的連線池)
+        """
+        self._bq_service = bq_service
+        self.session = session or clients.http_session()
         self.oauth = OAuth1(
             Config.NETSUITE_CONSUMER_KEY,
             client_secret=Config.NETSUITE_CONSUMER_SECRET,
@@ -14,14 +24,45 @@ class NetSuiteService:
             realm=Config.NETSUITE_REALM
         )
     
-    def get_invoice_payment_status(self, month: str, billing_account_ids: list) -> dict:
+    @traced("netsuite.get_invoice_payment_status")
+    def get_invoice_payment_status(self, month: str, billing_account_ids: list,
+                                   chunk_size: int = None, max_workers: int = 1) -> dict:
         """
         查詢發票付款狀態
+        chunk_size: 每次請求的帳號數 (None 時一次查詢全部)，max_workers: 同時送出的請求數
         Returns: {billing_account_id: payment_status}
         """
         if not billing_account_ids:
             return {}
         
+        chunk_size = chunk_size or len(billing_account_ids)
+        chunks = [
+            billing_account_ids[start:start + chunk_size]
+            for start in range(0, len(billing_account_ids), chunk_size)
+        ]
+        if len(chunks) == 1:
+            return self._request_payment_status(month, billing_account_ids)
+        
+        current_span().set(requested_ids=len(billing_account_ids), chunks=len(chunks))
+        workers = min(max_workers or 1, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="netsuite") as executor:
+            # 每個 chunk 以目前的 context 執行，請求的 span 以此查詢的 span 為 parent
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._request_payment_status, month, chunk)
+                for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+        
+        payment_status = {}
+        for result in results:
+            payment_status.update(result)
+        return payment_status
+    
+    @traced("netsuite.request_payment_status")
+    def _request_payment_status(self, month: str, billing_account_ids: list) -> dict:
+        """
+        以一次 API 請求查詢 billing_account_ids 的付款狀態，失敗時全部標記為 API_ERROR
+        """
         # 準備 API 參數
         params = {
             'script': Config.NETSUITE_SCRIPT_ID,
@@ -35,7 +76,7 @@ class NetSuiteService:
         }
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 Config.NETSUITE_BASE_URL,
                 params=params,
                 headers=headers,
@@ -43,20 +84,39 @@ class NetSuiteService:
                 timeout=30
             )
             
+            current_span().set(
+                bytes=len(response.content),
+                status_code=response.status_code,
+                requested_ids=len(billing_account_ids)
+            )
+            
             if response.status_code == 200:
                 data = response.json()
                 return self._parse_payment_status(data, billing_account_ids)
             else:
                 print(f"NetSuite API Error: {response.status_code} - {response.text}")
+                current_span().fail(f"HTTP {response.status_code}")
                 return {bid: Config.ERROR_MESSAGES["API_ERROR"] for bid in billing_account_ids}
                 
         except requests.exceptions.RequestException as e:
+            current_span().fail(e)
             print(f"NetSuite API Request Error: {e}")
             return {bid: Config.ERROR_MESSAGES["API_ERROR"] for bid in billing_account_ids}
         except json.JSONDecodeError as e:
+            current_span().fail(e)
             print(f"NetSuite API JSON Parse Error: {e}")
             return {bid: Config.ERROR_MESSAGES["API_ERROR"] for bid in billing_account_ids}
     
+    @property
+    def bq_service(self):
+        """
+        查詢 customer_profile 用的 BigQueryService，同一個 instance 只建立一次
+        """
+        if self._bq_service is None:
+            from services.bigquery_service import BigQueryService
+            self._bq_service = BigQueryService()
+        return self._bq_service
+    
     def _parse_payment_status(self, api_response: dict, requested_ids: list) -> dict:
         """
         api_response: NetSuite API 回應   
@@ -90,31 +150,46 @@ class NetSuiteService:
         
         return result
     
+    @traced("netsuite.get_payment_status_by_name")
     def get_payment_status_by_name(self, month: str, billing_account_name: str) -> str:
         """
         透過 billing_account_name 查詢付款狀態 (check_payment.py) 
         Returns: 付款狀態
         """
+        statuses = self.get_payment_status_by_names(month, [billing_account_name])
+        return statuses[billing_account_name]
+    
+    @traced("netsuite.get_payment_status_by_names")
+    def get_payment_status_by_names(self, month: str, billing_account_names: list) -> dict:
+        """
+        批次查詢多個 billing_account_name 的付款狀態
+        每個月份只查詢一次 customer_profile 與一次 NetSuite API
+        Returns: {billing_account_name: 付款狀態}
+        """
+        if not billing_account_names:
+            return {}
+        
         # 查詢該月份的 customer_profile，將 billing_account_name 轉為 billing_account_id，
-        from services.bigquery_service import BigQueryService
-        bq_service = BigQueryService()
-
         month_int = int(month)
-        customer_profile = bq_service.get_customer_profile(month_int)
+        customer_profile = self.bq_service.get_customer_profile(month_int)
         
         if customer_profile.empty:
-            return Config.ERROR_MESSAGES["API_ERROR"]
-        
-        # 找到對應的 billing_account_id
-        matching_row = customer_profile[
-            customer_profile['billing_account_name'] == billing_account_name
-        ]
+            return {name: Config.ERROR_MESSAGES["API_ERROR"] for name in billing_account_names}
         
-        if matching_row.empty:
-            return Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"]
+        # 找到對應的 billing_account_id (同名時取第一筆)
+        matching_rows = customer_profile[
+            customer_profile['billing_account_name'].isin(billing_account_names)
+        ].drop_duplicates('billing_account_name')
+        id_by_name = dict(zip(matching_rows['billing_account_name'], matching_rows['billing_account_id']))
         
-        billing_account_id = matching_row.iloc[0]['billing_account_id']
+        current_span().set(rows=len(billing_account_names), matched=len(id_by_name))
         
         # 查詢付款狀態
-        payment_status = self.get_invoice_payment_status(month, [billing_account_id])
-        return payment_status.get(billing_account_id, Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"])
\ No newline at end of file
+        billing_account_ids = list(dict.fromkeys(id_by_name.values()))
+        payment_status = self.get_invoice_payment_status(month, billing_account_ids)
+        
+        return {
+            name: payment_status.get(id_by_name[name], Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"])
+            if name in id_by_name else Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"]
+            for name in billing_account_names
+        }
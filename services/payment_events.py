@@ -0,0 +1,178 @@
+import contextlib
+import threading
+import time
+from config import Config
+from utils.lease import report_lease
+from utils.telemetry import current_span, traced
+from utils.waiting_records import WaitingRecordIndex
+import check_payment
+
+class PaymentEventReceiver:
+    """
+    接收 NetSuite 發票狀態變更事件 (與 Invoice Payment Status API 相同的 data[] 格式)
+    事件先放入 buffer，同一個 billing account 的多次變更只保留最後一次，flush 時一次寫回報表
+    寫入成本與變更數量成正比，不需重新查詢所有 waiting 發票
+    customer_profile 尚無對應帳號的變更留在 buffer 中，之後的 flush 重新查詢，超過 PUSH_UNMATCHED_TTL_SECONDS 後捨棄
+    """
+
+    def __init__(self, report_sink, bq_service, lease_manager=None):
+        self.report_sink = report_sink
+        self.bq_service = bq_service
+        # 讀取 waiting 列號到寫回期間持有的 Report_{year} lease (None 時不加鎖)
+        self.lease_manager = lease_manager
+        # {(month, billing_account_id): 付款狀態}
+        self._buffer = {}
+        # {month: {billing_account_id: billing_account_name}}
+        self._names_by_month = {}
+        # 未對應到帳號的變更第一次 flush 的時間 {(month, billing_account_id): timestamp}
+        self._unmatched_since = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def add_events(self, payload: dict) -> dict:
+        """
+        加入 data[] 格式的事件
+        每個發票需有 payment_status、items 與 invoice_date (YYYY/MM/DD，報表月份為開立月份的前一個月)
+        或直接指定 month (YYYYMM)
+        Returns: {'accepted', 'rejected', 'buffered'}
+        """
+        accepted = rejected = 0
+        changes = {}
+
+        for invoice in payload.get('data') or []:
+            try:
+                month = self._report_month(invoice)
+                status = Config.PAYMENT_STATUS_MAPPING.get(invoice['payment_status'], invoice['payment_status'])
+                items = invoice['items']
+                if not isinstance(items, list):
+                    raise TypeError("items must be a list")
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+                continue
+
+            for billing_account_id in items:
+                changes[(month, str(billing_account_id))] = status
+            accepted += 1
+
+        with self._lock:
+            self._buffer.update(changes)
+            buffered = len(self._buffer)
+
+        return {'accepted': accepted, 'rejected': rejected, 'buffered': buffered}
+
+    @traced("payment_events.flush")
+    def flush(self) -> dict:
+        """
+        將 buffer 中的變更寫回報表：每個月份一次 customer_profile 查詢 (有快取)、一次批次讀取 waiting 記錄、一次批次更新
+        寫入失敗時變更放回 buffer (不覆蓋之後收到的事件)；未對應到帳號的變更放回 buffer 直到過期
+        讀取列號到寫回都在各年度的 Report_{year} lease 內 (依年份順序取得)，每月報表無法在兩者之間移動列
+        Returns: {'changes', 'updated', 'unmatched', 'expired'}
+        """
+        with self._lock:
+            changes, self._buffer = self._buffer, {}
+        if not changes:
+            return {'changes': 0, 'updated': 0, 'unmatched': 0, 'expired': 0}
+
+        try:
+            with contextlib.ExitStack() as stack:
+                for year in sorted({month // 100 for month, _ in changes}):
+                    stack.enter_context(report_lease(self.lease_manager, year))
+                all_updates, unmatched = self._build_updates(changes)
+                check_payment.apply_payment_updates(self.report_sink, all_updates)
+        except Exception:
+            with self._lock:
+                for key, status in changes.items():
+                    self._buffer.setdefault(key, status)
+            raise
+
+        retained, expired = self._retain_unmatched(changes, unmatched)
+        updated = sum(len(updates) for updates in all_updates.values())
+        current_span().set(rows=updated, changes=len(changes), unmatched=retained, expired=expired)
+        return {'changes': len(changes), 'updated': updated, 'unmatched': retained, 'expired': expired}
+
+    def _retain_unmatched(self, changes: dict, unmatched: set) -> tuple:
+        """
+        未對應到帳號的變更放回 buffer (customer_profile 可能尚未更新)，第一次 flush 後超過 PUSH_UNMATCHED_TTL_SECONDS 時捨棄
+        Returns: (retained, expired)
+        """
+        now = time.time()
+        retained = expired = 0
+        with self._lock:
+            for key in changes:
+                if key not in unmatched:
+                    self._unmatched_since.pop(key, None)
+                elif now - self._unmatched_since.setdefault(key, now) < Config.PUSH_UNMATCHED_TTL_SECONDS:
+                    self._buffer.setdefault(key, changes[key])
+                    retained += 1
+                else:
+                    del self._unmatched_since[key]
+                    expired += 1
+        if expired:
+            print(f"Dropped {expired} payment changes without a matching billing account")
+        return retained, expired
+
+    def _build_updates(self, changes: dict) -> tuple:
+        """
+        變更對應到報表中的 waiting 列
+        Returns: ({year: [{'row_number', 'new_status'}]}, customer_profile 中沒有對應帳號的變更 {(month, billing_account_id)})
+        """
+        months = sorted({month for month, _ in changes})
+        years = sorted({month // 100 for month in months})
+        records_by_year = self.report_sink.get_waiting_records_by_year(years)
+        indexes = {
+            year: WaitingRecordIndex(records, only_months=months)
+            for year, records in records_by_year.items()
+        }
+
+        all_updates = {}
+        unmatched = set()
+        refreshed = set()
+        for (month, billing_account_id), status in changes.items():
+            if not check_payment.should_update_status(status):
+                continue
+
+            name = self._account_names(month).get(billing_account_id)
+            if name is None and month not in refreshed:
+                # 快取中沒有的帳號可能是之後才加入 customer_profile，每次 flush 每個月份最多重新查詢一次
+                refreshed.add(month)
+                name = self._account_names(month, refresh=True).get(billing_account_id)
+            if name is None:
+                unmatched.add((month, billing_account_id))
+                continue
+
+            year = month // 100
+            if year not in indexes:
+                continue
+
+            all_updates.setdefault(year, []).extend(
+                {'row_number': row_number, 'new_status': status}
+                for row_number in indexes[year].rows(str(month), name)
+            )
+
+        return {year: updates for year, updates in all_updates.items() if updates}, unmatched
+
+    def _account_names(self, month: int, refresh: bool = False) -> dict:
+        """
+        該月份 customer_profile 的 billing_account_id -> billing_account_name (快取，refresh 時重新查詢)
+        """
+        if refresh or month not in self._names_by_month:
+            customer_profile = self.bq_service.get_customer_profile(month)
+            self._names_by_month[month] = dict(zip(
+                customer_profile['billing_account_id'], customer_profile['billing_account_name']
+            )) if not customer_profile.empty else {}
+        return self._names_by_month[month]
+
+    @staticmethod
+    def _report_month(invoice: dict) -> int:
+        if invoice.get('month'):
+            month = int(invoice['month'])
+        else:
+            # 發票於次月開立：2025/01/03 開立的發票對應 202412 的報表
+            year, month_number = (int(part) for part in invoice['invoice_date'].split('/')[:2])
+            month = check_payment.lookback_window(year * 100 + month_number, 2)[0]
+        if not 1 <= month % 100 <= 12:
+            raise ValueError(f"invalid month: {month}")
+        return month
@@ -0,0 +1,327 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import pandas as pd
+from config import Config
+from utils.telemetry import current_span, traced
+from utils.waiting_records import WaitingRecord
+
+REPORT_SINKS = ("sheets", "bigquery", "parquet", "csv", "xlsx")
+
+# parquet 的欄位只能有一種型別：數值欄位中的文字 (例如 "not found") 另存於 {column} (text) 欄位，讀取時合併
+TEXT_COLUMN_SUFFIX = " (text)"
+
+class ReportSink(ABC):
+    """
+    報表輸出介面：每月寫入、讀取 "waiting" 記錄、更新付款狀態
+    SheetsService 寫入 Google Sheets，BigQueryReportSink 寫入 BigQuery 報表表，FileReportSink 寫入本地檔案
+    """
+
+    @abstractmethod
+    def prepare_worksheet(self, year: int):
+        """
+        建立或確認指定年份的報表，可在取得資料前先執行
+        """
+
+    @abstractmethod
+    def write_monthly_data(self, data: pd.DataFrame, year: int, month: int):
+        """
+        寫入月份資料 (已存在的同月份資料會先移除)
+        """
+
+    @abstractmethod
+    def get_waiting_records(self, year: int) -> list:
+        """
+        Returns: [{'row_number', 'month', 'billing_account_name', 'current_status'}]
+        """
+
+    @abstractmethod
+    def update_payment_status(self, year: int, updates: list):
+        """
+        updates: [{'row_number', 'new_status'}]
+        """
+
+    def get_waiting_records_by_year(self, years: list) -> dict:
+        """
+        讀取多個年份報表的 "waiting" 記錄 (預設逐年讀取，可覆寫為一次批次讀取)
+        Returns: {year: [WaitingRecord]}
+        """
+        return {year: self.get_waiting_records(year) for year in years}
+
+    def update_payment_status_by_year(self, updates_by_year: dict):
+        """
+        updates_by_year: {year: [{'row_number', 'new_status'}]}
+        """
+        for year, updates in updates_by_year.items():
+            if updates:
+                self.update_payment_status(year, updates)
+
+    @abstractmethod
+    def update_spreadsheet_title(self, month: int):
+        """
+        更新報表名稱為該月份的名稱 (REPORT_FILE_NAME_FORMAT)
+        """
+
+    def archive_settled_months(self, year: int, keep_months: tuple = ()) -> list:
+        """
+        將已結清的月份移出該年份報表 (SHEETS_ARCHIVE_MODE)，不支援時不處理
+        Returns: 已封存的月份
+        """
+        return []
+
+    def get_fingerprint(self, month: int) -> str:
+        """
+        取得上次寫入該月份時保存的內容 fingerprint，不支援時回傳 None (每次都寫入)
+        """
+        return None
+
+    def set_fingerprint(self, month: int, fingerprint: str):
+        """
+        保存該月份的內容 fingerprint
+        """
+
+class FileReportSink(ReportSink):
+    """
+    將報表寫入本地檔案 ({output_dir}/Report_{year}.{parquet|csv|xlsx})
+    欄位與 Google Sheets 相同，row_number 對應工作表行號 (表頭為第 1 行)
+    """
+
+    FORMATS = ("parquet", "csv", "xlsx")
+
+    def __init__(self, output_dir: str = None, file_format: str = "parquet"):
+        if file_format not in self.FORMATS:
+            raise ValueError(f"Unknown report file format: {file_format} (expected one of {', '.join(self.FORMATS)})")
+
+        self.output_dir = output_dir or Config.REPORT_OUTPUT_DIR
+        self.file_format = file_format
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def report_path(self, year: int) -> str:
+        sheet_name = Config.SHEET_NAME_FORMAT.format(year=year)
+        return os.path.join(self.output_dir, f"{sheet_name}.{self.file_format}")
+
+    def prepare_worksheet(self, year: int) -> str:
+        path = self.report_path(year)
+        if not os.path.exists(path):
+            self._save(year, self._empty_report())
+        return path
+
+    @traced("file_sink.write_monthly_data")
+    def write_monthly_data(self, data: pd.DataFrame, year: int, month: int):
+        current_span().set(rows=len(data), month=month)
+
+        report = self._load(year)
+        removed = int((report['Month'] == str(month)).sum())
+        report = report[report['Month'] != str(month)]
+        if removed:
+            print(f"Removed {removed} existing rows for month {month}")
+
+        if not data.empty:
+            # 欄位依位置對應到報表表頭，Month 以文字保存 (與 Google Sheets 相同)
+            month_data = data.copy()
+            month_data.columns = Config.OUTPUT_COLUMNS
+            month_data['Month'] = str(month)
+            report = pd.concat([report, month_data], ignore_index=True)
+
+        self._save(year, report)
+        print(f"Successfully wrote {len(data)} rows to {self.report_path(year)}")
+
+    @traced("file_sink.get_waiting_records")
+    def get_waiting_records(self, year: int) -> list:
+        report = self._load(year)
+        waiting = report[report['Customer<>CM'] == "waiting"]
+
+        return [
+            WaitingRecord(row_index + 2, month, name)
+            for row_index, month, name in zip(
+                waiting.index, waiting['Month'], waiting['Billing Account Name']
+            )
+        ]
+
+    @traced("file_sink.update_payment_status")
+    def update_payment_status(self, year: int, updates: list):
+        if not updates:
+            return
+
+        current_span().set(rows=len(updates))
+        report = self._load(year)
+        status_col_idx = report.columns.get_loc("Customer<>CM")
+
+        for update in updates:
+            report.iat[update['row_number'] - 2, status_col_idx] = update['new_status']
+
+        self._save(year, report)
+
+    def update_spreadsheet_title(self, month: int):
+        """
+        檔案輸出沒有檔名可更新，將報表名稱記錄在 report_meta.json
+        """
+        new_title = Config.REPORT_FILE_NAME_FORMAT.format(month=month)
+        meta = self.read_meta()
+        meta['title'] = new_title
+        self.write_meta(meta)
+        print(f"Report title recorded: {new_title}")
+
+    def get_fingerprint(self, month: int) -> str:
+        return self.read_meta().get('fingerprints', {}).get(str(month))
+
+    def set_fingerprint(self, month: int, fingerprint: str):
+        meta = self.read_meta()
+        meta.setdefault('fingerprints', {})[str(month)] = fingerprint
+        self.write_meta(meta)
+
+    def read_meta(self) -> dict:
+        path = os.path.join(self.output_dir, "report_meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_meta(self, meta: dict):
+        with open(os.path.join(self.output_dir, "report_meta.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    @staticmethod
+    def _empty_report() -> pd.DataFrame:
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in Config.OUTPUT_COLUMNS})
+
+    def _load(self, year: int) -> pd.DataFrame:
+        """
+        讀取報表，檔案不存在時回傳只有表頭的空報表
+        """
+        path = self.report_path(year)
+        if not os.path.exists(path):
+            return self._empty_report()
+
+        if self.file_format == "parquet":
+            report = self._merge_text_columns(pd.read_parquet(path))
+        elif self.file_format == "csv":
+            report = pd.read_csv(path, dtype={'Month': str}, keep_default_na=False)
+        else:
+            report = pd.read_excel(path, dtype={'Month': str}, keep_default_na=False, engine='openpyxl')
+
+        return report.astype(object).reset_index(drop=True)
+
+    def _save(self, year: int, report: pd.DataFrame):
+        """
+        寫入暫存檔後再取代原檔，避免中斷時留下不完整的報表
+        """
+        path = self.report_path(year)
+        temp_path = f"{path}.tmp"
+        report = self._storable(report)
+
+        if self.file_format == "parquet":
+            report.to_parquet(temp_path, index=False)
+        elif self.file_format == "csv":
+            report.to_csv(temp_path, index=False)
+        else:
+            self._write_xlsx(temp_path, Config.SHEET_NAME_FORMAT.format(year=year), report)
+
+        os.replace(temp_path, path)
+
+    def _storable(self, report: pd.DataFrame) -> pd.DataFrame:
+        """
+        null 轉為空字串 (與 Google Sheets 相同)
+        數值欄位 (其餘儲存格為 "not found" 等錯誤訊息) 中的數值保留數值型別，文字保留文字；其他欄位轉為文字
+        parquet 的數值欄位以數值型別保存，文字另存於 {column} (text) 欄位
+        """
+        report = report.reset_index(drop=True)
+        placeholders = set(Config.ERROR_MESSAGES.values()) | {''}
+        columns = {}
+        for column in report.columns:
+            values = report[column].astype(object)
+            values = values.where(values.notna(), '')
+            text = values.map(lambda v: v if isinstance(v, str) else str(v)).astype(object)
+            numeric = pd.to_numeric(values, errors='coerce') if column != 'Month' else None
+            if numeric is None or not numeric.notna().any():
+                columns[column] = text
+                continue
+
+            is_number = numeric.notna()
+            if is_number.all():
+                columns[column] = numeric
+            elif not set(text[~is_number]) <= placeholders:
+                columns[column] = text
+            elif self.file_format == "parquet":
+                columns[column] = numeric
+                columns[f"{column}{TEXT_COLUMN_SUFFIX}"] = text.where(~is_number, '')
+            else:
+                columns[column] = numeric.astype(object).where(is_number, text)
+        return pd.DataFrame(columns, index=report.index)
+
+    @staticmethod
+    def _merge_text_columns(report: pd.DataFrame) -> pd.DataFrame:
+        """
+        parquet 的 {column} (text) 欄位合併回數值欄位
+        """
+        text_columns = [column for column in report.columns if column.endswith(TEXT_COLUMN_SUFFIX)]
+        for text_column in text_columns:
+            column = text_column[:-len(TEXT_COLUMN_SUFFIX)]
+            values = report[column].astype(object)
+            report[column] = values.where(values.notna(), report[text_column])
+        return report.drop(columns=text_columns)
+
+    @staticmethod
+    def _write_xlsx(path: str, sheet_name: str, report: pd.DataFrame):
+        """
+        以 openpyxl 寫入，表頭與金錢格式和 Google Sheets 相同
+        """
+        try:
+            from openpyxl import Workbook
+            from openpyxl.styles import Font, PatternFill
+        except ImportError:
+            raise ImportError("XLSX report sink requires openpyxl (pip install openpyxl)")
+
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.title = sheet_name
+        worksheet.append(list(report.columns))
+        for row in report.itertuples(index=False):
+            worksheet.append([value.item() if hasattr(value, 'item') else value for value in row])
+
+        # 表頭 - 藍色背景 #366092，白色粗體字，字體大小 11
+        header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+        for cell in worksheet[1]:
+            cell.fill = header_fill
+            cell.font = Font(bold=True, color='FFFFFF', size=11)
+
+        # 金錢格式 - D欄 (Spending $$) 和 F欄 (Profit $$)，null / not found 以淺黃色標示
+        null_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
+        null_values = {
+            Config.ERROR_MESSAGES["NULL_VALUE"],
+            Config.ERROR_MESSAGES["NOT_FOUND_BILLING"],
+            Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+        }
+        for row in worksheet.iter_rows(min_row=2):
+            for cell in row:
+                if cell.column_letter in ('D', 'F') and isinstance(cell.value, (int, float)):
+                    cell.number_format = '$#,##0.00'
+                elif cell.value in null_values:
+                    cell.fill = null_fill
+
+        workbook.save(path)
+
+def create_report_sink(sink: str = None, lease_manager=None) -> ReportSink:
+    """
+    依 REPORT_SINK 建立報表輸出 (sheets / bigquery / parquet / csv / xlsx)
+    未指定 sink 且設定了 REPORT_TARGETS 時，建立分送到所有目標的 MultiTargetSink
+    lease_manager: 寫入 Report_{year} 使用的 LeaseManager，sheets 更新 Report_Index 時也取得 lease
+    """
+    if sink is None and Config.REPORT_TARGETS:
+        from services.report_targets import MultiTargetSink, load_report_targets
+        return MultiTargetSink(load_report_targets(), lease_manager=lease_manager)
+
+    sink = sink or Config.REPORT_SINK
+    if sink not in REPORT_SINKS:
+        raise ValueError(f"Unknown report sink: {sink} (expected one of {', '.join(REPORT_SINKS)})")
+
+    if sink == "sheets":
+        from services.sheets_service import SheetsService
+        return SheetsService(lease_manager=lease_manager)
+
+    if sink == "bigquery":
+        from services.bigquery_report_sink import BigQueryReportSink
+        return BigQueryReportSink()
+
+    print(f"Report sink: {sink} files in {Config.REPORT_OUTPUT_DIR}")
+    return FileReportSink(Config.REPORT_OUTPUT_DIR, sink)
@@ -0,0 +1,196 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from config import Config
+from services.report_sink import REPORT_SINKS, FileReportSink, ReportSink
+from utils.telemetry import current_span, traced
+from utils.waiting_records import WaitingRecord
+
+class ReportTarget:
+    """
+    多目標報表的一個輸出目標 (REPORT_TARGETS 的一個項目)
+        name: 目標名稱 (唯一)
+        sink: sheets / bigquery / parquet / csv / xlsx，未指定時為 REPORT_SINK
+        spreadsheet_id: sheets 目標的試算表 ID
+        archive_spreadsheet_id: SHEETS_ARCHIVE_MODE=spreadsheet 時此目標的封存試算表 ID
+        table: bigquery 目標的報表表名稱
+        output_dir: 檔案目標的輸出目錄 (預設 {REPORT_OUTPUT_DIR}/{name})
+        filters: {報表欄位: [值, ...]}，所有欄位都符合的列才寫入此目標，空白時寫入全部資料
+    """
+
+    def __init__(self, name: str, sink: str = None, spreadsheet_id: str = None, table: str = None,
+                 output_dir: str = None, filters: dict = None, archive_spreadsheet_id: str = None):
+        self.name = name
+        self.sink = sink or Config.REPORT_SINK
+        self.spreadsheet_id = spreadsheet_id
+        self.archive_spreadsheet_id = archive_spreadsheet_id
+        self.table = table
+        self.output_dir = output_dir or os.path.join(Config.REPORT_OUTPUT_DIR, name)
+        self.filters = {
+            column: [values] if isinstance(values, str) else list(values)
+            for column, values in (filters or {}).items()
+        }
+
+        if self.sink not in REPORT_SINKS:
+            raise ValueError(f"Unknown report sink for target {name}: {self.sink}")
+        if self.sink == "sheets" and not self.spreadsheet_id:
+            raise ValueError(f"Report target {name} requires spreadsheet_id")
+        unknown = [column for column in self.filters if column not in Config.OUTPUT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown filter column for target {name}: {', '.join(unknown)}")
+
+    @classmethod
+    def from_dict(cls, item: dict) -> 'ReportTarget':
+        unknown = set(item) - {'name', 'sink', 'spreadsheet_id', 'table', 'output_dir', 'filters',
+                               'archive_spreadsheet_id'}
+        if 'name' not in item or unknown:
+            raise ValueError(f"Invalid report target: {item}")
+        return cls(**item)
+
+    def select(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        此目標的資料列 (各欄位條件以 AND 合併)
+        """
+        if not self.filters or data.empty:
+            return data
+
+        mask = np.ones(len(data), dtype=bool)
+        for column, values in self.filters.items():
+            mask &= data[column].astype(str).isin([str(value) for value in values]).to_numpy()
+        return data[mask]
+
+    def create_sink(self, lease_manager=None) -> ReportSink:
+        if self.sink == "sheets":
+            from services.sheets_service import SheetsService
+            return SheetsService(self.spreadsheet_id, self.archive_spreadsheet_id, lease_manager=lease_manager)
+
+        if self.sink == "bigquery":
+            from services.bigquery_report_sink import BigQueryReportSink
+            return BigQueryReportSink(table=self.table)
+
+        return FileReportSink(self.output_dir, self.sink)
+
+def load_report_targets(spec: str = None) -> list:
+    """
+    解析 REPORT_TARGETS：JSON 清單，或內容為 JSON 清單的檔案路徑
+    Returns: [ReportTarget]
+    """
+    spec = (spec if spec is not None else Config.REPORT_TARGETS).strip()
+    if not spec:
+        return []
+
+    if not spec.startswith('['):
+        with open(spec) as f:
+            spec = f.read()
+
+    targets = [ReportTarget.from_dict(item) for item in json.loads(spec)]
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate report target names: {', '.join(names)}")
+    return targets
+
+class MultiTargetSink(ReportSink):
+    """
+    將同一份月份資料分送到多個報表 (每個目標依 filters 篩選)
+    BigQuery / NetSuite 只查詢一次，每多一個目標只增加該目標的寫入
+    各目標的寫入與讀取同時執行 (每個目標一個 worker，最多 REPORT_TARGET_WORKERS 個)
+    waiting 記錄的 row_number 為 (目標名稱, 該目標的 row_number)，付款狀態檢查時同名帳號只查詢一次
+    """
+
+    def __init__(self, targets: list, max_workers: int = None, lease_manager=None):
+        if not targets:
+            raise ValueError("MultiTargetSink requires at least one report target")
+
+        self.targets = targets
+        self.max_workers = min(max_workers or Config.REPORT_TARGET_WORKERS, len(targets))
+        # 各目標的報表輸出 (同時建立連線)
+        self.sinks = dict(zip(
+            [target.name for target in targets],
+            self._map(lambda target: target.create_sink(lease_manager), targets)
+        ))
+        print(f"Report targets: {', '.join(f'{target.name} ({target.sink})' for target in targets)}")
+
+    def _map(self, func, items: list) -> list:
+        """
+        每個項目在 worker 上執行 func，依序回傳結果 (任一個失敗時拋出例外)
+        """
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report-target") as executor:
+            return list(executor.map(func, items))
+
+    def _each_sink(self, func) -> dict:
+        """
+        Returns: {目標名稱: func(sink)}
+        """
+        names = list(self.sinks)
+        return dict(zip(names, self._map(lambda name: func(self.sinks[name]), names)))
+
+    def prepare_worksheet(self, year: int) -> dict:
+        return self._each_sink(lambda sink: sink.prepare_worksheet(year))
+
+    @traced("multi_target.write_monthly_data")
+    def write_monthly_data(self, data: pd.DataFrame, year: int, month: int):
+        partitions = {target.name: target.select(data) for target in self.targets}
+        current_span().set(rows=sum(len(partition) for partition in partitions.values()),
+                           targets=len(partitions), month=month)
+
+        def write(target: ReportTarget):
+            self.sinks[target.name].write_monthly_data(partitions[target.name], year, month)
+            print(f"Target {target.name}: {len(partitions[target.name])} rows")
+
+        self._map(write, self.targets)
+
+    def get_waiting_records(self, year: int) -> list:
+        return self.get_waiting_records_by_year([year]).get(year, [])
+
+    def update_payment_status(self, year: int, updates: list):
+        self.update_payment_status_by_year({year: updates})
+
+    def get_waiting_records_by_year(self, years: list) -> dict:
+        records_by_target = self._each_sink(lambda sink: sink.get_waiting_records_by_year(years))
+
+        records_by_year = {year: [] for year in years}
+        for name, target_records in records_by_target.items():
+            for year, records in target_records.items():
+                records_by_year.setdefault(year, []).extend(
+                    WaitingRecord((name, record.row_number), record.month,
+                                  record.billing_account_name, record.current_status)
+                    for record in records
+                )
+        return records_by_year
+
+    def update_payment_status_by_year(self, updates_by_year: dict):
+        updates_by_target = {}
+        for year, updates in updates_by_year.items():
+            for update in updates:
+                name, row_number = update['row_number']
+                updates_by_target.setdefault(name, {}).setdefault(year, []).append(
+                    {**update, 'row_number': row_number}
+                )
+
+        self._map(
+            lambda name: self.sinks[name].update_payment_status_by_year(updates_by_target[name]),
+            list(updates_by_target)
+        )
+
+    def update_spreadsheet_title(self, month: int):
+        self._each_sink(lambda sink: sink.update_spreadsheet_title(month))
+
+    def archive_settled_months(self, year: int, keep_months: tuple = ()) -> list:
+        archived = self._each_sink(lambda sink: sink.archive_settled_months(year, keep_months))
+        return sorted({month for months in archived.values() for month in months})
+
+    def get_fingerprint(self, month: int) -> str:
+        """
+        所有目標保存相同的 fingerprint 時回傳該值，否則 (例如新增目標) 回傳 None 重新寫入
+        """
+        fingerprints = set(self._each_sink(lambda sink: sink.get_fingerprint(month)).values())
+        return fingerprints.pop() if len(fingerprints) == 1 else None
+
+    def set_fingerprint(self, month: int, fingerprint: str):
+        self._each_sink(lambda sink: sink.set_fingerprint(month, fingerprint))
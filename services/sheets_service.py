@@ -1,29 +1,56 @@
 import gspread
-from google.oauth2.service_account import Credentials
+from gspread.utils import ValueRenderOption
 import pandas as pd
+from collections import defaultdict
 from config import Config
+from services import clients
+from services.report_sink import ReportSink
+from utils.lease import LeaseManager, index_lease
+from utils.telemetry import current_span, traced
+from utils.waiting_records import WaitingRecord
 from datetime import datetime
 
-class SheetsService:
-    def __init__(self):
-        scope = [
-            'https://spreadsheets.google.com/feeds',
-            'https://www.googleapis.com/auth/drive'
-        ]
+# Report_Index 工作表欄位：月份目前所在的位置 (hot 為 Report_{year}，archive 為封存位置)
+INDEX_COLUMNS = ["Month", "Location", "Sheet", "Rows", "Updated At"]
+
+class SheetsService(ReportSink):
+    @traced("sheets.connect")
+    def __init__(self, spreadsheet_id: str = None, archive_spreadsheet_id: str = None,
+                 lease_manager: LeaseManager = None):
+        # gspread client 與試算表由整個 process 共用，只在第一次建立
+        # spreadsheet_id 未指定時為 SHEETS_FILE_ID (多目標報表時每個目標一份試算表)
+        self.gc = clients.gspread_client()
+        self.spreadsheet = clients.spreadsheet(spreadsheet_id or Config.SHEETS_FILE_ID)
+        # SHEETS_ARCHIVE_MODE=spreadsheet 時封存月份寫入的試算表
+        self.archive_spreadsheet_id = archive_spreadsheet_id or Config.ARCHIVE_SPREADSHEET_ID
         
-        credentials = Credentials.from_service_account_file(
-            Config.SERVICE_ACCOUNT_FILE, 
-            scopes=scope
-        )
+        # 已確認表頭的工作表 {year: worksheet}
+        self._prepared_worksheets = {}
+        # 各年份工作表 Customer<>CM 欄位位置 {year: column index}
+        self._status_columns = {}
+        # 封存工作表 {year: (worksheet, 位置名稱)} 與 Report_Index 工作表 (第一次使用時取得)
+        self._archive_worksheets = {}
+        self._index_worksheet = None
+        # 更新 Report_Index 時取得的 lease (與 Report_{year} 的寫入 lease 相同的 LeaseManager，None 時不加鎖)
+        self.lease_manager = lease_manager
+    
+    def prepare_worksheet(self, year: int) -> gspread.Worksheet:
+        """
+        取得或建立工作表並確認表頭，可在取得資料前先執行
+        """
+        if year not in self._prepared_worksheets:
+            worksheet = self.get_or_create_worksheet(year)
+            self._ensure_correct_headers(worksheet)
+            self._prepared_worksheets[year] = worksheet
         
-        self.gc = gspread.authorize(credentials)
-        self.spreadsheet = self.gc.open_by_key(Config.SHEETS_FILE_ID)
+        return self._prepared_worksheets[year]
     
-    def get_or_create_worksheet(self, year: int) -> gspread.Worksheet:
+    @traced("sheets.get_or_create_worksheet")
+    def get_or_create_worksheet(self, year: int, sheet_name: str = None) -> gspread.Worksheet:
         """
-        取得或建立指定年份的工作表
+        取得或建立指定年份的工作表 (sheet_name 未指定時為 Report_{year})
         """
-        sheet_name = Config.SHEET_NAME_FORMAT.format(year=year)
+        sheet_name = sheet_name or Config.SHEET_NAME_FORMAT.format(year=year)
         
         try:
             worksheet = self.spreadsheet.worksheet(sheet_name)
@@ -58,6 +85,7 @@ class SheetsService:
                 })
                 print("Header formatting applied successfully")
             except Exception as e:
+                current_span().fail(e)
                 print(f"Warning: Could not format header: {e}")
             
             try:
@@ -68,18 +96,39 @@ class SheetsService:
                 })
                 print("Default font size set to 11")
             except Exception as e:
+                current_span().fail(e)
                 print(f"Warning: Could not set default font size: {e}")
             
             return worksheet
     
+    @traced("sheets.write_monthly_data")
     def write_monthly_data(self, data: pd.DataFrame, year: int, month: int):
         """
         寫入月份資料到工作表
         """
-        worksheet = self.get_or_create_worksheet(year)
+        current_span().set(rows=len(data), month=month)
+        
+        # 取得工作表並確認表頭（確保欄位名稱正確）
+        worksheet = self.prepare_worksheet(year)
         
-        # 檢查並更新表頭（確保欄位名稱正確）
-        self._ensure_correct_headers(worksheet)
+        # 封存模式：已封存的月份先移回 hot 工作表 (重新寫入)
+        if self.archive_enabled:
+            self._restore_archived_month(year, month)
+        
+        self._write_month_rows(worksheet, data, month)
+        
+        # 寫入完成後才在 Report_Index 記錄月份位置 (寫入失敗時不指向沒有資料的 hot 工作表)
+        if self.archive_enabled:
+            self._record_months({str(month): ("hot", worksheet.title, len(data))})
+    
+    def _write_month_rows(self, worksheet, data: pd.DataFrame, month: int):
+        """
+        以 data 取代工作表中該月份的資料列
+        """
+        # reconcile 模式：只更新有差異的儲存格與新增/刪除的列 (該月份尚無資料時照常附加)
+        if Config.SHEETS_WRITE_MODE == "reconcile" and not data.empty:
+            if self._reconcile_month_data(worksheet, data, month):
+                return
         
         # 檢查是否已存在該月份資料，如果有則先刪除
         self._remove_existing_month_data(worksheet, month)
@@ -111,27 +160,7 @@ class SheetsService:
         start_row = last_row + 1
         
         # 將 DataFrame 轉換為清單格式，確保所有值都是 JSON 可序列化的
-        values = []
-        for _, row in data_clean.iterrows():
-            row_values = []
-            for col_idx, value in enumerate(row):
-                # 特殊處理 Month 欄位 (第一欄)，確保為文字格式
-                if col_idx == 0:  # Month 欄位
-                    if pd.isna(value):
-                        row_values.append('')
-                    else:
-                        # 強制轉換為字串，避免日期自動轉換
-                        row_values.append(f"'{str(value)}")  # 前綴單引號強制文字格式
-                elif pd.isna(value):
-                    row_values.append('')
-                elif isinstance(value, (int, float)):
-                    if pd.isna(value) or value != value:  # 檢查 NaN
-                        row_values.append('')
-                    else:
-                        row_values.append(value)
-                else:
-                    row_values.append(str(value))
-            values.append(row_values)
+        values = self._to_row_values(data_clean)
         
         # 批次寫入資料
         if values:
@@ -142,29 +171,23 @@ class SheetsService:
                 worksheet.update(cell_range, values)
                 print(f"Successfully wrote {len(values)} rows to Google Sheets")
                 
-                # 設定新寫入資料的字體大小為 11
-                data_range = f'A{start_row}:J{end_row}'
-                worksheet.format(data_range, {
-                    'textFormat': {
-                        'fontSize': 11
-                    }
-                })
-                
-                # 設定金錢格式 - D欄 (Spending $$) 和 F欄 (Profit $$)
-                spending_range = f'D{start_row}:D{end_row}'  
-                profit_range = f'F{start_row}:F{end_row}'                    
+                # 設定新寫入資料的字體大小為 11，以及金錢格式 - D欄 (Spending $$) 和 F欄 (Profit $$)
+                # 合併為一次 batch_format 呼叫
                 money_format = {
                     'numberFormat': {
                         'type': 'CURRENCY',
                         'pattern': '$#,##0.00'
                     }
                 }
-                
-                worksheet.format(spending_range, money_format)
-                worksheet.format(profit_range, money_format)
+                worksheet.batch_format([
+                    {'range': f'A{start_row}:J{end_row}', 'format': {'textFormat': {'fontSize': 11}}},
+                    {'range': f'D{start_row}:D{end_row}', 'format': money_format},
+                    {'range': f'F{start_row}:F{end_row}', 'format': money_format}
+                ])
                 print("Money format applied to Spending and Profit columns")
                 
             except Exception as e:
+                current_span().fail(e)
                 print(f"Error writing to Google Sheets: {e}")
                 # 如果批次寫入失敗，嘗試逐行寫入
                 self._write_row_by_row(worksheet, values, start_row)
@@ -172,6 +195,35 @@ class SheetsService:
             # 格式化 null 值的儲存格 (淺黃色背景)
             self._format_null_cells(worksheet, data_clean, start_row)
     
+    @staticmethod
+    def _to_row_values(data_clean: pd.DataFrame) -> list:
+        """
+        將 DataFrame 轉換為工作表的列資料
+        """
+        values = []
+        for _, row in data_clean.iterrows():
+            row_values = []
+            for col_idx, value in enumerate(row):
+                # 特殊處理 Month 欄位 (第一欄)，確保為文字格式
+                if col_idx == 0:  # Month 欄位
+                    if pd.isna(value):
+                        row_values.append('')
+                    else:
+                        # 強制轉換為字串，避免日期自動轉換
+                        row_values.append(f"'{str(value)}")  # 前綴單引號強制文字格式
+                elif pd.isna(value):
+                    row_values.append('')
+                elif isinstance(value, (int, float)):
+                    if pd.isna(value) or value != value:  # 檢查 NaN
+                        row_values.append('')
+                    else:
+                        row_values.append(value)
+                else:
+                    row_values.append(str(value))
+            values.append(row_values)
+        return values
+    
+    @traced("sheets.ensure_correct_headers")
     def _ensure_correct_headers(self, worksheet: gspread.Worksheet):
         """
         確保表頭格式正確（不重寫表頭內容）
@@ -211,8 +263,49 @@ class SheetsService:
             print("Header formatting applied successfully")
             
         except Exception as e:
+            current_span().fail(e)
             print(f"Warning: Could not update headers: {e}")
     
+    @traced("sheets.get_fingerprint")
+    def get_fingerprint(self, month: int) -> str:
+        """
+        讀取保存在試算表 developer metadata 的月份 fingerprint
+        """
+        metadata = self.spreadsheet.fetch_sheet_metadata({'fields': 'developerMetadata'})
+        for entry in metadata.get('developerMetadata', []):
+            if entry.get('metadataKey') == self._fingerprint_key(month):
+                return entry.get('metadataValue')
+        return None
+    
+    @traced("sheets.set_fingerprint")
+    def set_fingerprint(self, month: int, fingerprint: str):
+        """
+        以一次 batch_update 取代月份 fingerprint (先刪除舊值再建立)
+        """
+        key = self._fingerprint_key(month)
+        self.spreadsheet.batch_update({'requests': [
+            {
+                'deleteDeveloperMetadata': {
+                    'dataFilter': {'developerMetadataLookup': {'metadataKey': key}}
+                }
+            },
+            {
+                'createDeveloperMetadata': {
+                    'developerMetadata': {
+                        'metadataKey': key,
+                        'metadataValue': fingerprint,
+                        'location': {'spreadsheet': True},
+                        'visibility': 'DOCUMENT'
+                    }
+                }
+            }
+        ]})
+    
+    @staticmethod
+    def _fingerprint_key(month: int) -> str:
+        return f"referral_report_fingerprint_{month}"
+    
+    @traced("sheets.update_spreadsheet_title")
     def update_spreadsheet_title(self, month: int):
         """
         更新 Google Sheets 檔案名稱
@@ -225,8 +318,10 @@ class SheetsService:
             self.spreadsheet.update_title(new_title)
             print(f"Spreadsheet title updated to: {new_title}")
         except Exception as e:
+            current_span().fail(e)
             print(f"Warning: Could not update spreadsheet title: {e}")
     
+    @traced("sheets.write_row_by_row")
     def _write_row_by_row(self, worksheet: gspread.Worksheet, values: list, start_row: int):
         """
         逐行寫入資料（備用方法）
@@ -237,6 +332,8 @@ class SheetsService:
             start_row: 開始行號
         """
         print("Attempting row-by-row write...")
+        # 整批寫入失敗後以逐行寫入重試一次
+        current_span().add(retries=1)
         successful_rows = 0
         
         for i, row_data in enumerate(values):
@@ -246,11 +343,151 @@ class SheetsService:
                 worksheet.update(cell_range, [row_data])
                 successful_rows += 1
             except Exception as e:
+                current_span().fail(e)
                 print(f"Error writing row {i+1}: {e}")
                 continue
         
+        current_span().add(rows=successful_rows)
         print(f"Successfully wrote {successful_rows}/{len(values)} rows")
     
+    @traced("sheets.reconcile_month_data")
+    def _reconcile_month_data(self, worksheet: gspread.Worksheet, data: pd.DataFrame, month: int) -> bool:
+        """
+        以 billing account (名稱 + 同名出現順序) 比對該月份既有的列
+        只送出有差異的儲存格、新增的列 (附加在該月份最後一列之後) 與刪除的列，一次 batch_update 完成
+        Returns: 該月份已有資料並完成 reconcile 時為 True
+        """
+        all_values = worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+        
+        existing = {}
+        name_counts = defaultdict(int)
+        for row_index, row in enumerate(all_values[1:], start=1):  # 0-based 行索引，跳過標題列
+            if row and self._month_key(row[0]) == str(month):
+                name = row[1] if len(row) > 1 else ''
+                existing[(name, name_counts[name])] = (row_index, row)
+                name_counts[name] += 1
+        
+        if not existing:
+            return False
+        
+        new_rows = {}
+        name_counts = defaultdict(int)
+        for row_values in self._to_row_values(data.fillna('')):
+            row_values[0] = str(month)
+            name = row_values[1]
+            new_rows[(name, name_counts[name])] = row_values
+            name_counts[name] += 1
+        
+        requests = []
+        changed_cells = 0
+        
+        # 1. 既有的列：只更新有差異的儲存格
+        for key, row_values in new_rows.items():
+            if key not in existing:
+                continue
+            row_index, old_values = existing[key]
+            for col_idx, value in enumerate(row_values):
+                old_value = old_values[col_idx] if col_idx < len(old_values) else ''
+                if self._normalize_cell(old_value) != self._normalize_cell(value):
+                    requests.append(self._update_cells_request(worksheet.id, row_index, col_idx, [[value]]))
+                    changed_cells += 1
+        
+        # 2. 新增的列：插入在該月份最後一列之後 (沿用上一列的格式)
+        inserted = [row_values for key, row_values in new_rows.items() if key not in existing]
+        if inserted:
+            insert_at = max(row_index for row_index, _ in existing.values()) + 1
+            requests.append({
+                'insertDimension': {
+                    'range': {
+                        'sheetId': worksheet.id,
+                        'dimension': 'ROWS',
+                        'startIndex': insert_at,
+                        'endIndex': insert_at + len(inserted)
+                    },
+                    'inheritFromBefore': True
+                }
+            })
+            requests.append(self._update_cells_request(worksheet.id, insert_at, 0, inserted))
+        
+        # 3. 刪除的列：新增的列都在其後，從後往前刪除不影響其他請求的行號
+        deleted = sorted(row_index for key, (row_index, _) in existing.items() if key not in new_rows)
+        for start, end in reversed(self._row_ranges([row_index + 1 for row_index in deleted])):
+            requests.append({
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': worksheet.id,
+                        'dimension': 'ROWS',
+                        'startIndex': start - 1,
+                        'endIndex': end
+                    }
+                }
+            })
+        
+        if requests:
+            self.spreadsheet.batch_update({'requests': requests})
+        
+        current_span().set(changed_cells=changed_cells, inserted_rows=len(inserted), deleted_rows=len(deleted))
+        print(f"Reconciled month {month}: {changed_cells} cells updated, "
+              f"{len(inserted)} rows inserted, {len(deleted)} rows deleted")
+        return True
+    
+    @staticmethod
+    def _update_cells_request(sheet_id: int, row_index: int, col_index: int, rows: list) -> dict:
+        """
+        updateCells 請求 (值與格式：字體大小 11、金錢格式、null 值淺黃色背景)
+        """
+        null_values = [
+            Config.ERROR_MESSAGES["NULL_VALUE"],
+            Config.ERROR_MESSAGES["NOT_FOUND_BILLING"],
+            Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+        ]
+        
+        def cell_data(value, column: int) -> dict:
+            cell_format = {'textFormat': {'fontSize': 11}}
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                entered = {'numberValue': value}
+                if column in (3, 5):  # D欄 (Spending $$) 和 F欄 (Profit $$)
+                    cell_format['numberFormat'] = {'type': 'CURRENCY', 'pattern': '$#,##0.00'}
+            else:
+                entered = {'stringValue': str(value)}
+                if value in null_values:
+                    cell_format['backgroundColor'] = {'red': 1.0, 'green': 242/255, 'blue': 204/255}
+            return {'userEnteredValue': entered, 'userEnteredFormat': cell_format}
+        
+        return {
+            'updateCells': {
+                'start': {'sheetId': sheet_id, 'rowIndex': row_index, 'columnIndex': col_index},
+                'rows': [
+                    {'values': [cell_data(value, col_index + offset) for offset, value in enumerate(row)]}
+                    for row in rows
+                ],
+                'fields': 'userEnteredValue,userEnteredFormat'
+            }
+        }
+    
+    @staticmethod
+    def _month_key(value) -> str:
+        """
+        Month 儲存格轉為 YYYYMM 文字 (相容 '202506 / 202506 / 202506.0)
+        """
+        text = str(value).lstrip("'")
+        try:
+            return str(int(float(text)))
+        except ValueError:
+            return text
+    
+    @staticmethod
+    def _normalize_cell(value):
+        """
+        比較用的儲存格值：數值以 6 位小數比較，空值視為空字串
+        """
+        if value is None:
+            return ''
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return round(float(value), 6)
+        return str(value).lstrip("'")
+    
+    @traced("sheets.remove_existing_month_data")
     def _remove_existing_month_data(self, worksheet: gspread.Worksheet, month: int):
         """
         移除已存在的月份資料
@@ -270,10 +507,46 @@ class SheetsService:
             if row and row[0] == str(month):  # Month 欄位在第一欄
                 rows_to_delete.append(i)
         
-        # 從後往前刪除，避免行號變動
-        for row_num in reversed(rows_to_delete):
-            worksheet.delete_rows(row_num)
+        if not rows_to_delete:
+            return
+        
+        self._delete_rows(worksheet, rows_to_delete)
+        print(f"Removed {len(rows_to_delete)} existing rows for month {month}")
     
+    def _delete_rows(self, worksheet: gspread.Worksheet, row_numbers: list):
+        """
+        刪除工作表的列：連續的行合併為一個範圍，從後往前刪除避免行號變動，一次 batch_update 完成
+        """
+        requests = [
+            {
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': worksheet.id,
+                        'dimension': 'ROWS',
+                        'startIndex': start - 1,
+                        'endIndex': end
+                    }
+                }
+            }
+            for start, end in reversed(self._row_ranges(sorted(row_numbers)))
+        ]
+        self.spreadsheet.batch_update({'requests': requests})
+    
+    @staticmethod
+    def _row_ranges(row_numbers: list) -> list:
+        """
+        將排序過的行號合併為連續範圍
+        Returns: [(起始行, 結束行)]
+        """
+        ranges = []
+        for row_number in row_numbers:
+            if ranges and ranges[-1][1] == row_number - 1:
+                ranges[-1] = (ranges[-1][0], row_number)
+            else:
+                ranges.append((row_number, row_number))
+        return ranges
+    
+    @traced("sheets.format_null_cells")
     def _format_null_cells(self, worksheet: gspread.Worksheet, data: pd.DataFrame, start_row: int):
         """
         格式化包含 null 值的儲存格
@@ -295,89 +568,328 @@ class SheetsService:
             }
         }
         
-        for row_idx, (_, row) in enumerate(data.iterrows()):
-            actual_row = start_row + row_idx
+        null_values = [
+            Config.ERROR_MESSAGES["NULL_VALUE"],
+            Config.ERROR_MESSAGES["NOT_FOUND_BILLING"],
+            Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+        ]
+        null_mask = data.isna() | data.isin(null_values)
+        
+        # 每欄連續的儲存格合併為一個範圍，一次 batch_format 完成
+        formats = []
+        for col_idx, column in enumerate(data.columns):
+            row_offsets = [int(i) for i in null_mask[column].to_numpy().nonzero()[0]]
+            if not row_offsets:
+                continue
             
-            for col_idx, value in enumerate(row):
-                if (pd.isna(value) or 
-                    value in [Config.ERROR_MESSAGES["NULL_VALUE"], 
-                             Config.ERROR_MESSAGES["NOT_FOUND_BILLING"],
-                             Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]]):
-                    # 將欄位索引轉換為字母
-                    col_letter = chr(65 + col_idx)  # A, B, C...
-                    cell_range = f'{col_letter}{actual_row}'
-                    try:
-                        worksheet.format(cell_range, null_format)
-                    except Exception as e:
-                        print(f"Warning: Could not format cell {cell_range}: {e}")
+            # 將欄位索引轉換為字母
+            col_letter = chr(65 + col_idx)  # A, B, C...
+            for start, end in self._row_ranges([start_row + offset for offset in row_offsets]):
+                cell_range = f'{col_letter}{start}' if start == end else f'{col_letter}{start}:{col_letter}{end}'
+                formats.append({'range': cell_range, 'format': null_format})
+        
+        if not formats:
+            return
+        
+        try:
+            worksheet.batch_format(formats)
+        except Exception as e:
+            current_span().fail(e)
+            print(f"Warning: Could not format {len(formats)} null cell ranges: {e}")
     
+    @traced("sheets.get_waiting_records")
     def get_waiting_records(self, year: int) -> list:
         """
         取得所有狀態為 "waiting" 的記錄
         """
         try:
             worksheet = self.get_or_create_worksheet(year)
-            all_values = worksheet.get_all_values()
-            
-            if len(all_values) <= 1:  # 只有標題列
-                return []
-            
-            headers = all_values[0]
-            waiting_records = []
-            
-            # 找到 Customer<>CM 
-            try:
-                cm_col_idx = headers.index("Customer<>CM")
-                month_col_idx = headers.index("Month")
-                billing_name_col_idx = headers.index("Billing Account Name")
-            except ValueError as e:
-                print(f"Column not found: {e}")
-                return []
-            
-            # 尋找 waiting 狀態的記錄
-            for row_idx, row in enumerate(all_values[1:], start=2):
-                if (len(row) > cm_col_idx and 
-                    row[cm_col_idx] == "waiting"):
-                    
-                    waiting_records.append({
-                        'row_number': row_idx,
-                        'month': row[month_col_idx] if len(row) > month_col_idx else '',
-                        'billing_account_name': row[billing_name_col_idx] if len(row) > billing_name_col_idx else '',
-                        'current_status': row[cm_col_idx]
-                    })
-            
-            return waiting_records
-            
+            return self._parse_waiting_records(year, worksheet.get_all_values())
+        
         except gspread.WorksheetNotFound:
             return []
     
+    @traced("sheets.get_waiting_records_by_year")
+    def get_waiting_records_by_year(self, years: list) -> dict:
+        """
+        以一次 values_batch_get 讀取多個年份工作表的 "waiting" 記錄 (不存在的工作表略過)
+        Returns: {year: [WaitingRecord]}
+        """
+        records = {year: [] for year in years}
+        titles = {worksheet.title for worksheet in self.spreadsheet.worksheets()}
+        sheet_names = {year: Config.SHEET_NAME_FORMAT.format(year=year) for year in years}
+        existing = [year for year in years if sheet_names[year] in titles]
+        
+        if existing:
+            response = self.spreadsheet.values_batch_get([f"'{sheet_names[year]}'" for year in existing])
+            for year, value_range in zip(existing, response.get('valueRanges', [])):
+                records[year] = self._parse_waiting_records(year, value_range.get('values', []))
+        
+        current_span().set(sheets=len(existing), rows=sum(len(r) for r in records.values()))
+        return records
+    
+    def _parse_waiting_records(self, year: int, all_values: list) -> list:
+        """
+        從工作表內容找出 "waiting" 記錄，並記下該年份 Customer<>CM 欄位的位置
+        """
+        if len(all_values) <= 1:  # 只有標題列
+            return []
+        
+        headers = all_values[0]
+        waiting_records = []
+        
+        # 找到 Customer<>CM
+        try:
+            cm_col_idx = headers.index("Customer<>CM")
+            month_col_idx = headers.index("Month")
+            billing_name_col_idx = headers.index("Billing Account Name")
+        except ValueError as e:
+            current_span().fail(e)
+            print(f"Column not found: {e}")
+            return []
+        
+        self._status_columns[year] = cm_col_idx
+        
+        # 尋找 waiting 狀態的記錄
+        for row_idx, row in enumerate(all_values[1:], start=2):
+            if (len(row) > cm_col_idx and
+                row[cm_col_idx] == "waiting"):
+        
+                waiting_records.append(WaitingRecord(
+                    row_idx,
+                    row[month_col_idx] if len(row) > month_col_idx else '',
+                    row[billing_name_col_idx] if len(row) > billing_name_col_idx else '',
+                    row[cm_col_idx]
+                ))
+        
+        return waiting_records
+    
+    @traced("sheets.update_payment_status")
     def update_payment_status(self, year: int, updates: list):
         """
         批次更新付款狀態
         """
-        if not updates:
+        self.update_payment_status_by_year({year: updates})
+    
+    @traced("sheets.update_payment_status_by_year")
+    def update_payment_status_by_year(self, updates_by_year: dict):
+        """
+        所有年份工作表的付款狀態以一次 values_batch_update 更新
+        updates_by_year: {year: [{'row_number', 'new_status'}]}
+        """
+        updates_by_year = {year: updates for year, updates in updates_by_year.items() if updates}
+        if not updates_by_year:
             return
         
-        worksheet = self.get_or_create_worksheet(year)
-        headers = worksheet.row_values(1)
+        current_span().set(rows=sum(len(updates) for updates in updates_by_year.values()))
         
         try:
-            cm_col_idx = headers.index("Customer<>CM")
-            col_letter = chr(65 + cm_col_idx)  
-            
             # 批次更新
             batch_updates = []
-            for update in updates:
-                cell_range = f'{col_letter}{update["row_number"]}'
-                batch_updates.append({
-                    'range': cell_range,
-                    'values': [[update['new_status']]]
-                })
-            
-            if batch_updates:
-                worksheet.batch_update(batch_updates)
-                
+            for year, updates in updates_by_year.items():
+                sheet_name = Config.SHEET_NAME_FORMAT.format(year=year)
+                col_letter = chr(65 + self._status_column(year))
+                for update in updates:
+                    batch_updates.append({
+                        'range': f"'{sheet_name}'!{col_letter}{update['row_number']}",
+                        'values': [[update['new_status']]]
+                    })
+        
+            self.spreadsheet.values_batch_update({
+                'valueInputOption': 'RAW',
+                'data': batch_updates
+            })
+        
         except ValueError as e:
+            current_span().fail(e)
             print(f"Error updating payment status: {e}")
         except Exception as e:
-            print(f"Unexpected error updating payment status: {e}")
\ No newline at end of file
+            current_span().fail(e)
+            print(f"Unexpected error updating payment status: {e}")
+    
+    def _status_column(self, year: int) -> int:
+        """
+        Customer<>CM 欄位位置 (讀取 waiting 記錄時已記下則不再讀取表頭)
+        """
+        if year not in self._status_columns:
+            headers = self.get_or_create_worksheet(year).row_values(1)
+            self._status_columns[year] = headers.index("Customer<>CM")
+        return self._status_columns[year]
+    
+    @property
+    def archive_enabled(self) -> bool:
+        return Config.SHEETS_ARCHIVE_MODE != "off"
+    
+    @traced("sheets.archive_settled_months")
+    def archive_settled_months(self, year: int, keep_months: tuple = ()) -> list:
+        """
+        將已結清 (沒有 waiting 列) 的月份從 Report_{year} 移到封存位置，hot 工作表只保留未結清的月份與 keep_months
+        順序：附加到封存位置 -> 記錄 Report_Index -> 刪除 hot 列；中斷後重跑時封存位置已有的月份只刪除不重複附加
+        Returns: 已封存的月份 (YYYYMM 文字)
+        """
+        if not self.archive_enabled:
+            return []
+        
+        worksheet = self.prepare_worksheet(year)
+        all_values = worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+        if len(all_values) <= 1:
+            return []
+        
+        status_col_idx = all_values[0].index("Customer<>CM")
+        keep = {str(month) for month in keep_months}
+        
+        # 依月份分組 (月份之間的空白分隔列屬於下一個月份)
+        rows_by_month = defaultdict(list)
+        separators = defaultdict(list)
+        pending_blank = []
+        for row_number, row in enumerate(all_values[1:], start=2):
+            if not any(str(value).strip() for value in row):
+                pending_blank.append(row_number)
+                continue
+            month = self._month_key(row[0])
+            rows_by_month[month].append((row_number, row))
+            separators[month].extend(pending_blank)
+            pending_blank = []
+        
+        settled = sorted(
+            month for month, rows in rows_by_month.items()
+            if month not in keep and not any(
+                len(row) > status_col_idx and row[status_col_idx] == "waiting" for _, row in rows
+            )
+        )
+        if not settled:
+            return []
+        
+        current_span().set(months=len(settled), rows=sum(len(rows_by_month[month]) for month in settled))
+        archive_worksheet, location = self._archive_worksheet(year)
+        
+        # 依封存位置實際已有的月份去重：附加後、記錄 Report_Index 前中斷時，重跑不會重複附加
+        archived_months = {
+            self._month_key(row[0]) for row in archive_worksheet.get_all_values()[1:] if row and row[0]
+        }
+        to_append = [month for month in settled if month not in archived_months]
+        if to_append:
+            width = len(Config.OUTPUT_COLUMNS)
+            values = [
+                (list(row) + [''] * width)[:width]
+                for month in to_append for _, row in rows_by_month[month]
+            ]
+            archive_worksheet.append_rows(values, value_input_option='RAW')
+        
+        self._record_months({month: ("archive", location, len(rows_by_month[month])) for month in settled})
+        
+        to_delete = {
+            row_number for month in settled
+            for row_number in separators[month] + [number for number, _ in rows_by_month[month]]
+        }
+        # 保留的第一個月份前不留空白分隔列
+        for row_number, row in enumerate(all_values[1:], start=2):
+            if row_number in to_delete:
+                continue
+            if any(str(value).strip() for value in row):
+                break
+            to_delete.add(row_number)
+        self._delete_rows(worksheet, list(to_delete))
+        
+        print(f"Archived {len(settled)} settled months from {worksheet.title} to {location}: {', '.join(settled)}")
+        return settled
+    
+    def _archive_worksheet(self, year: int) -> tuple:
+        """
+        年份的封存工作表：worksheet 模式為同一份試算表的 Archive_{year}，spreadsheet 模式為封存試算表的 Report_{year}
+        Returns: (worksheet, Report_Index 記錄的位置名稱)
+        """
+        if year not in self._archive_worksheets:
+            if Config.SHEETS_ARCHIVE_MODE == "spreadsheet":
+                if not self.archive_spreadsheet_id:
+                    raise ValueError("SHEETS_ARCHIVE_MODE=spreadsheet requires ARCHIVE_SPREADSHEET_ID")
+                worksheet = SheetsService(self.archive_spreadsheet_id).prepare_worksheet(year)
+                location = f"{self.archive_spreadsheet_id}/{worksheet.title}"
+            else:
+                worksheet = self.get_or_create_worksheet(year, Config.ARCHIVE_SHEET_NAME_FORMAT.format(year=year))
+                self._ensure_correct_headers(worksheet)
+                location = worksheet.title
+            self._archive_worksheets[year] = (worksheet, location)
+        
+        return self._archive_worksheets[year]
+    
+    def _restore_archived_month(self, year: int, month: int):
+        """
+        重新寫入已封存的月份時，先從封存位置移除該月份 (之後寫入 hot 工作表)
+        """
+        entry = self.month_index().get(str(month))
+        if not entry or entry['location'] != "archive":
+            return
+        
+        archive_worksheet, location = self._archive_worksheet(year)
+        row_numbers = [
+            row_number for row_number, row in enumerate(archive_worksheet.get_all_values()[1:], start=2)
+            if row and self._month_key(row[0]) == str(month)
+        ]
+        # 封存位置可能在另一份試算表，逐段刪除 (從後往前)
+        for start, end in reversed(self._row_ranges(row_numbers)):
+            archive_worksheet.delete_rows(start, end)
+        print(f"Restored month {month} from {location} ({len(row_numbers)} rows)")
+    
+    def month_index(self) -> dict:
+        """
+        Report_Index 工作表記錄的月份位置 (每次重新讀取，其他 process 可能已更新)
+        Returns: {month: {'location': hot / archive, 'sheet', 'rows', 'updated_at'}}
+        """
+        return {month: entry for month, (_, entry) in self._read_month_index().items()}
+    
+    def _read_month_index(self) -> dict:
+        """
+        Returns: {month: (Report_Index 列號, entry)}
+        """
+        index = {}
+        for row_number, row in enumerate(self._get_index_worksheet().get_all_values()[1:], start=2):
+            if not row or not row[0]:
+                continue
+            row = list(row) + [''] * (len(INDEX_COLUMNS) - len(row))
+            index[self._month_key(row[0])] = (row_number, {
+                'location': row[1],
+                'sheet': row[2],
+                'rows': int(float(row[3] or 0)),
+                'updated_at': row[4]
+            })
+        return index
+    
+    @traced("sheets.record_months")
+    def _record_months(self, entries: dict):
+        """
+        更新 Report_Index：在 Report_Index lease 內重新讀取索引，只更新 entries 的月份列 (新的月份附加在最後)
+        其他 process 同時記錄的月份不被覆蓋
+        entries: {month: (location, sheet, rows)}
+        """
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        with index_lease(self.lease_manager):
+            worksheet = self._get_index_worksheet()
+            row_numbers = {month: row_number for month, (row_number, _) in self._read_month_index().items()}
+            
+            updates = []
+            new_rows = []
+            for month, (location, sheet, rows) in sorted(entries.items()):
+                values = [str(month), location, sheet, rows, updated_at]
+                row_number = row_numbers.get(str(month))
+                if row_number is None:
+                    new_rows.append(values)
+                else:
+                    updates.append({'range': f'A{row_number}:E{row_number}', 'values': [values]})
+            
+            if updates:
+                worksheet.batch_update(updates)
+            if new_rows:
+                worksheet.append_rows(new_rows)
+    
+    def _get_index_worksheet(self) -> gspread.Worksheet:
+        if self._index_worksheet is None:
+            try:
+                self._index_worksheet = self.spreadsheet.worksheet(Config.REPORT_INDEX_SHEET)
+            except gspread.WorksheetNotFound:
+                self._index_worksheet = self.spreadsheet.add_worksheet(
+                    title=Config.REPORT_INDEX_SHEET, rows=200, cols=len(INDEX_COLUMNS)
+                )
+                self._index_worksheet.insert_row(INDEX_COLUMNS, 1)
+        return self._index_worksheet
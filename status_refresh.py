@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+付款狀態常駐更新 (與每月報表 main.py 分開執行)
+waiting 發票放在優先佇列，依發票年齡與檢查次數決定下次檢查時間：新發票常檢查、舊發票少檢查
+每次喚醒只查詢到期的發票 (每個月份一次 NetSuite 批次查詢)，並以一個批次寫回報表
+用法: python status_refresh.py [--once]
+"""
+
+import argparse
+import contextlib
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING
+from config import Config
+from utils.lease import LeaseManager, report_lease
+from utils.profiling import add_profile_arguments, profiler
+from utils.refresh_scheduler import RefreshScheduler
+from utils.telemetry import telemetry, traced
+from utils.waiting_records import WaitingRecordIndex
+import check_payment
+
+if TYPE_CHECKING:
+    from services.netsuite_service import NetSuiteService
+    from services.report_sink import ReportSink
+
+def refresh_months(now: float) -> list:
+    """
+    要追蹤的月份：PAYMENT_LOOKBACK_MONTHS 個月 (0 時為今年至今)
+    """
+    end_month = int(datetime.fromtimestamp(now).strftime('%Y%m'))
+    return check_payment.lookback_window(end_month, Config.PAYMENT_LOOKBACK_MONTHS or end_month % 100)
+
+@traced("status_refresh.refresh_once")
+def refresh_once(report_sink: 'ReportSink', netsuite_service: 'NetSuiteService',
+                 scheduler: RefreshScheduler, now: float = None, lease_manager: LeaseManager = None) -> dict:
+    """
+    執行一輪：讀取 waiting 記錄並同步佇列，查詢到期的發票，將已付款的寫回報表
+    讀取列號到寫回都在各年度的 Report_{year} lease 內 (依年份順序取得)，每月報表無法在兩者之間移動列
+    Returns:
+        dict: {'waiting', 'due', 'updated', 'requests'}
+    """
+    now = time.time() if now is None else now
+    months = refresh_months(now)
+    years = sorted({month // 100 for month in months})
+
+    with contextlib.ExitStack() as stack:
+        for year in years:
+            stack.enter_context(report_lease(lease_manager, year))
+        return _refresh_round(report_sink, netsuite_service, scheduler, now, months, years)
+
+def _refresh_round(report_sink: 'ReportSink', netsuite_service: 'NetSuiteService',
+                   scheduler: RefreshScheduler, now: float, months: list, years: list) -> dict:
+    """
+    一輪的讀取、查詢與寫回 (呼叫前已取得 lease)
+    """
+    # 1. 讀取追蹤範圍內的 waiting 記錄 (各年度工作表一次批次讀取)，同步佇列
+    records_by_year = report_sink.get_waiting_records_by_year(years)
+    indexes = {
+        year: WaitingRecordIndex(records, only_months=months)
+        for year, records in records_by_year.items()
+    }
+    sheet_year = {month: year for year, index in indexes.items() for month in index.months}
+    scheduler.sync({month: indexes[year].names(month) for month, year in sheet_year.items()}, now)
+
+    # 2. 取出到期的發票，依月份分組
+    due_by_month = defaultdict(list)
+    for invoice in scheduler.pop_due(now):
+        due_by_month[invoice.month].append(invoice)
+
+    # 3. 每個月份一次批次查詢，已付款的列加入更新，其餘重新排程
+    all_updates = {}
+    for month, invoices in due_by_month.items():
+        year = sheet_year[month]
+        print(f"Checking {len(invoices)} invoices for month {month}...")
+        try:
+            statuses = netsuite_service.get_payment_status_by_names(month, [invoice.name for invoice in invoices])
+        except Exception as e:
+            print(f"Error checking month {month}: {e}")
+            statuses = {}
+
+        for invoice in invoices:
+            status = statuses.get(invoice.name, Config.ERROR_MESSAGES["API_ERROR"])
+            settled = check_payment.should_update_status(status)
+            if settled:
+                all_updates.setdefault(year, []).extend(
+                    {'row_number': row_number, 'new_status': status}
+                    for row_number in indexes[year].rows(month, invoice.name)
+                )
+            scheduler.record_check(invoice, settled, now, failed=status == Config.ERROR_MESSAGES["API_ERROR"])
+
+    # 4. 所有年度的更新一次寫回
+    if all_updates:
+        check_payment.apply_payment_updates(report_sink, all_updates)
+
+    return {
+        'waiting': len(scheduler),
+        'due': sum(len(invoices) for invoices in due_by_month.values()),
+        'updated': sum(len(updates) for updates in all_updates.values()),
+        'requests': len(due_by_month)
+    }
+
+def sleep_seconds(scheduler: RefreshScheduler, now: float) -> float:
+    """
+    到下一個到期發票的時間，最長 REFRESH_RESYNC_MINUTES (定期重新讀取報表以發現新的 waiting 列)
+    """
+    resync = Config.REFRESH_RESYNC_MINUTES * 60
+    wakeup = scheduler.next_wakeup()
+    if wakeup is None:
+        return resync
+    return min(max(wakeup - now, 0), resync)
+
+def run(once: bool = False, report_sink: 'ReportSink' = None, netsuite_service: 'NetSuiteService' = None,
+        lease_manager: LeaseManager = None):
+    """
+    常駐執行 (once 時只執行一輪)，每輪結束保存佇列狀態
+    lease_manager 未指定時依 LEASE_DIR 建立 (與 main.py 共用同一組 Report_{year} lease)
+    """
+    if lease_manager is None:
+        from main import create_lease_manager
+        lease_manager = create_lease_manager()
+    if report_sink is None:
+        from services.report_sink import create_report_sink
+        report_sink = create_report_sink(lease_manager=lease_manager)
+    if netsuite_service is None:
+        from services.netsuite_service import NetSuiteService
+        netsuite_service = NetSuiteService()
+
+    scheduler = RefreshScheduler.load(Config.REFRESH_STATE_PATH)
+    print(f"Loaded {len(scheduler)} tracked invoices")
+
+    while True:
+        telemetry.reset()
+        try:
+            summary = refresh_once(report_sink, netsuite_service, scheduler, lease_manager=lease_manager)
+            print(f"[{datetime.now():%Y-%m-%d %H:%M}] waiting: {summary['waiting']}, "
+                  f"checked: {summary['due']}, updated rows: {summary['updated']}, "
+                  f"NetSuite requests: {summary['requests']}")
+        except Exception as e:
+            print(f"Status refresh failed: {e}")
+            if once:
+                raise
+        finally:
+            if Config.REFRESH_STATE_PATH:
+                scheduler.save(Config.REFRESH_STATE_PATH)
+
+        if once:
+            return summary
+
+        delay = sleep_seconds(scheduler, time.time())
+        print(f"Next check in {delay / 60:.1f} minutes")
+        time.sleep(delay)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously refresh waiting payment status")
+    parser.add_argument('--once', action='store_true', help="run a single refresh round and exit")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler.configure(args.profile, args.profile_dir)
+
+    try:
+        run(once=args.once)
+    finally:
+        profiler.write_summary()
+        if args.once and Config.RUN_REPORT_PATH:
+            telemetry.write_report(Config.RUN_REPORT_PATH)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+測試 Google Sheets / NetSuite / BigQuery 的 API 呼叫次數上限
+呼叫次數不可隨資料列數增加 (每多一列就多一次 API 呼叫的修改會失敗)
+成本：0，以 benchmarks.fakes 取代所有外部 API
+"""
+
+import contextlib
+import io
+import pandas as pd
+from benchmarks.fakes import (
+    FakeBigQueryClient,
+    FakeEnvironment,
+    FakeNetSuiteTransport,
+    FakeSpreadsheet,
+    fake_services
+)
+from benchmarks.synthetic_data import (
+    generate_customer_profile,
+    generate_netsuite_statuses,
+    generate_report_rows
+)
+from config import Config
+from services.netsuite_service import NetSuiteService
+from services.sheets_service import SheetsService
+import check_payment
+
+SIZES = [10, 300]
+YEAR = 2025
+SHEET_NAME = Config.SHEET_NAME_FORMAT.format(year=YEAR)
+
+def _environment(account_count: int, months: list) -> FakeEnvironment:
+    """
+    建立已有 months 月份報表 (約半數為 "waiting") 的 fake 環境
+    """
+    customer_profile = pd.concat(
+        [generate_customer_profile(account_count, month, seed=month) for month in months],
+        ignore_index=True
+    )
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet(SHEET_NAME, generate_report_rows(customer_profile))
+    ids = customer_profile['billing_account_id'].unique().tolist()
+
+    return FakeEnvironment(
+        FakeBigQueryClient(pd.DataFrame(), customer_profile),
+        FakeNetSuiteTransport(generate_netsuite_statuses(ids)),
+        spreadsheet
+    )
+
+def _report_data(row_count: int, month: int) -> pd.DataFrame:
+    """
+    DataProcessor.integrate_data 格式的輸出，每 3 列有一個 null / not found 儲存格
+    """
+    rows = []
+    for i in range(row_count):
+        rows.append({
+            'Month': month,
+            'Billing Account Name': f"Account-{i}",
+            'Currency': 'USD',
+            'Spending $$$': Config.ERROR_MESSAGES["NOT_FOUND_BILLING"] if i % 3 == 0 else 100.0 + i,
+            'Referral share rate': 0.1,
+            'Profit $$$': 10.0 + i,
+            'Referral Company': 'Partner A',
+            'Customer<>CM': 'waiting',
+            'Sales': None if i % 3 == 1 else 'Alice',
+            'EDP status': ''
+        })
+    return pd.DataFrame(rows)
+
+def _calls(environment: FakeEnvironment) -> int:
+    return environment.spreadsheet.total_calls
+
+def _assert_budget(counts: dict, limit: int, label: str):
+    """
+    呼叫次數不超過 limit，且不隨資料量增加
+    """
+    for size, count in counts.items():
+        assert count <= limit, f"{label}: {count} calls for {size} rows (limit {limit})"
+    assert len(set(counts.values())) == 1, f"{label}: call count grows with rows {counts}"
+
+def test_write_monthly_data_budget():
+    """
+    測試 1: 寫入月份資料 (含覆蓋既有月份與 null 儲存格格式化)
+    """
+    counts = {}
+    for size in SIZES:
+        environment = _environment(size, [202504, 202505])
+        with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+            sheets_service = SheetsService()
+            environment.spreadsheet.reset_calls()
+            sheets_service.write_monthly_data(_report_data(size, 202505), YEAR, 202505)
+        counts[size] = _calls(environment)
+
+        rows = environment.spreadsheet.worksheet(SHEET_NAME).get_all_values()
+        assert sum(row[0] == '202505' for row in rows) == size
+        assert sum(row[0] == '202504' for row in rows) == size
+
+    _assert_budget(counts, 12, "write_monthly_data")
+
+def test_remove_existing_month_data_budget():
+    """
+    測試 2: 刪除既有月份資料 (不連續的列)
+    """
+    counts = {}
+    for size in SIZES:
+        environment = _environment(size, [202504, 202505, 202506])
+        worksheet = environment.spreadsheet.worksheet(SHEET_NAME)
+
+        # 把部分 202506 的列改為 202505，讓要刪除的列不連續
+        for row in worksheet.rows[1:]:
+            if row[0] == '202506' and row[1].endswith(('1', '3', '5')):
+                row[0] = '202505'
+        expected_rows = [row for row in worksheet.get_all_values() if row[0] != '202505']
+
+        with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+            sheets_service = SheetsService()
+            environment.spreadsheet.reset_calls()
+            sheets_service._remove_existing_month_data(worksheet, 202505)
+        counts[size] = _calls(environment)
+
+        assert worksheet.get_all_values() == expected_rows
+
+    _assert_budget(counts, 2, "_remove_existing_month_data")
+
+def test_update_payment_status_budget():
+    """
+    測試 3: 批次更新付款狀態
+    """
+    counts = {}
+    for size in SIZES:
+        environment = _environment(size, [202505])
+        updates = [{'row_number': row, 'new_status': 'Clear'} for row in range(2, size + 2)]
+
+        with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+            sheets_service = SheetsService()
+            environment.spreadsheet.reset_calls()
+            sheets_service.update_payment_status(YEAR, updates)
+        counts[size] = _calls(environment)
+
+        rows = environment.spreadsheet.worksheet(SHEET_NAME).get_all_values()
+        assert all(row[7] == 'Clear' for row in rows[1:size + 1])
+
+    _assert_budget(counts, 4, "update_payment_status")
+
+def test_check_and_update_payment_status_budget():
+    """
+    測試 4: 歷史付款狀態檢查 - 每個月份最多一次 customer_profile 查詢與一次 NetSuite 呼叫
+    """
+    months = [202503, 202504, 202505]
+    counts = {}
+    for size in SIZES:
+        environment = _environment(size, months)
+        with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+            check_payment.check_and_update_payment_status(YEAR)
+
+        counts[size] = _calls(environment)
+        assert environment.netsuite.calls <= len(months)
+        assert environment.bigquery.calls['query'] <= len(months)
+
+        rows = environment.spreadsheet.worksheet(SHEET_NAME).get_all_values()
+        statuses = {row[7] for row in rows[1:] if row[0]}
+        assert statuses <= {'waiting', 'Clear'}
+        assert any(row[7] == 'Clear' for row in rows[1:])
+
+    _assert_budget(counts, 8, "check_and_update_payment_status")
+
+def test_services_share_connections():
+    """
+    測試 5: main 與 check_payment 共用已連線的服務 - credentials、authorize、open_by_key 各一次
+    NetSuiteService 依名稱查詢時重複使用同一個 BigQueryService 與 HTTP session
+    """
+    environment = _environment(SIZES[0], [202504, 202505])
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        from services.bigquery_service import BigQueryService
+
+        bq_service = BigQueryService()
+        netsuite_service = NetSuiteService(bq_service=bq_service)
+        sheets_service = SheetsService()
+        check_payment.check_and_update_payment_status(YEAR, sheets_service, netsuite_service)
+
+        # 未注入時仍使用 process 共用的 client
+        SheetsService()
+        NetSuiteService().get_payment_status_by_names('202505', ['Account-0'])
+        assert NetSuiteService().session is netsuite_service.session
+
+    assert environment.connections == {'credentials': 1, 'bigquery': 1, 'gspread': 1}
+    assert environment.gspread_client.calls['open_by_key'] == 1
+    assert netsuite_service.bq_service is bq_service
+
+def test_lookback_crosses_year_boundary():
+    """
+    測試 6: 往回檢查的月份跨年度時，兩個工作表一次讀取、一次更新
+    """
+    months = {2024: [202411, 202412], 2025: [202501]}
+    customer_profiles = {
+        year: pd.concat([generate_customer_profile(SIZES[0], month, seed=month) for month in year_months],
+                        ignore_index=True)
+        for year, year_months in months.items()
+    }
+    spreadsheet = FakeSpreadsheet()
+    for year, customer_profile in customer_profiles.items():
+        spreadsheet.create_worksheet(Config.SHEET_NAME_FORMAT.format(year=year), generate_report_rows(customer_profile))
+    customer_profile = pd.concat(customer_profiles.values(), ignore_index=True)
+    environment = FakeEnvironment(
+        FakeBigQueryClient(pd.DataFrame(), customer_profile),
+        FakeNetSuiteTransport(generate_netsuite_statuses(customer_profile['billing_account_id'].unique().tolist())),
+        spreadsheet
+    )
+
+    november = [row for row in spreadsheet.worksheet('Report_2024').get_all_values() if row[0] == '202411']
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        sheets_service = SheetsService()
+        netsuite_service = NetSuiteService()
+        environment.spreadsheet.reset_calls()
+        updates = check_payment.collect_payment_updates(
+            sheets_service, netsuite_service, 2025, months=check_payment.lookback_window(202501, 2)
+        )
+        check_payment.apply_payment_updates(sheets_service, updates)
+
+    # 202411 不在往回 2 個月的範圍內
+    assert set(updates) == {2024, 2025}
+    assert environment.netsuite.calls == 2
+    calls = environment.spreadsheet.calls
+    assert calls['values_batch_get'] == 1
+    assert calls['values_batch_update'] == 1
+    assert environment.spreadsheet.total_calls <= 3
+
+    december = spreadsheet.worksheet('Report_2024').get_all_values()
+    assert any(row[0] == '202412' and row[7] == 'Clear' for row in december)
+    assert [row for row in december if row[0] == '202411'] == november
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+測試多 worker 回補：月份分配、Report_{year} 寫入 lease 與回補結果
+成本：0，以 benchmarks.fakes 取代所有外部 API，lease 只寫入暫存目錄
+"""
+
+import contextlib
+import io
+import threading
+import time
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, fake_services
+from benchmarks.synthetic_data import generate_billing_aggregated, generate_customer_profile, generate_netsuite_statuses
+from config import Config
+from services.sheets_service import SheetsService
+from utils.lease import LeaseManager, LeaseTimeout
+import backfill
+
+MONTHS = backfill.month_range(202409, 202504)
+
+def test_shards_cover_months_once():
+    """
+    測試 1: 每個月份只分配給一個 shard，同一輪的 shard 處理不同年份
+    """
+    assert MONTHS[:5] == [202409, 202410, 202411, 202412, 202501] and len(MONTHS) == 8
+
+    shards = [backfill.shard_months(MONTHS, index, 2) for index in range(2)]
+    assert sorted(shards[0] + shards[1]) == MONTHS
+    for first, second in zip(*shards):
+        assert first // 100 != second // 100
+
+    with pytest.raises(ValueError):
+        backfill.shard_months(MONTHS, 2, 2)
+
+def test_lease_serializes_and_expires(tmp_path):
+    """
+    測試 2: 同名 lease 一次只有一個持有者；持有者中斷後，過期的 lease 可被接手
+    """
+    first = LeaseManager(str(tmp_path), ttl=60, poll=0.01, timeout=5)
+    second = LeaseManager(str(tmp_path), ttl=60, poll=0.01, timeout=5)
+    events = []
+
+    def hold(manager, label):
+        with manager.hold("Report_2025"):
+            events.append(f"{label}+")
+            time.sleep(0.05)
+            events.append(f"{label}-")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=hold, args=(m, label)) for m, label in ((first, "a"), (second, "b"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert events in (["a+", "a-", "b+", "b-"], ["b+", "b-", "a+", "a-"])
+        assert not list(tmp_path.iterdir())
+
+        # 中斷的持有者留下未釋放的 lease
+        stale = LeaseManager(str(tmp_path), ttl=0.05, poll=0.01, timeout=5)
+        stale._acquire("Report_2024")
+        with pytest.raises(LeaseTimeout):
+            LeaseManager(str(tmp_path), poll=0.01, timeout=0.02)._acquire("Report_2024")
+        time.sleep(0.06)
+        with second.hold("Report_2024"):
+            pass
+
+def test_held_lease_is_renewed(tmp_path):
+    """
+    測試 3: 持有時間超過 ttl 的 lease 持續延長，其他人無法接手；釋放後才可取得
+    """
+    holder = LeaseManager(str(tmp_path), ttl=0.15, poll=0.01, timeout=5)
+    other = LeaseManager(str(tmp_path), ttl=0.15, poll=0.01, timeout=0.5)
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        with holder.hold("Report_2025"):
+            with pytest.raises(LeaseTimeout):
+                other._acquire("Report_2025")
+        with other.hold("Report_2025"):
+            pass
+
+    assert "taken over" not in output.getvalue()
+    assert not list(tmp_path.iterdir())
+
+def test_parallel_backfill_writes_every_month(tmp_path):
+    """
+    測試 3: 兩個 shard 同時回補兩個年度，所有月份都寫入對應的工作表且列數正確
+    """
+    account_count = 30
+    customer_profile = pd.concat(
+        [generate_customer_profile(account_count, month, seed=month) for month in MONTHS], ignore_index=True
+    )
+    billing = pd.concat(
+        [generate_billing_aggregated(account_count, month, seed=month) for month in MONTHS], ignore_index=True
+    )
+    ids = customer_profile['billing_account_id'].unique().tolist()
+    environment = FakeEnvironment(
+        FakeBigQueryClient(billing, customer_profile), FakeNetSuiteTransport(generate_netsuite_statuses(ids))
+    )
+
+    results = []
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'REPORT_TARGETS', ''), \
+            mock.patch.object(Config, 'REPORT_SINK', 'sheets'), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        shards = [
+            threading.Thread(target=lambda index=index: results.extend(
+                backfill.backfill_shard(index, 2, MONTHS, lease_dir=str(tmp_path))
+            ))
+            for index in range(2)
+        ]
+        for shard in shards:
+            shard.start()
+        for shard in shards:
+            shard.join()
+
+        sheets = SheetsService()
+        rows_by_month = {}
+        for year in (2024, 2025):
+            for row in sheets.spreadsheet.worksheet(f"Report_{year}").get_all_values()[1:]:
+                assert int(row[0]) // 100 == year
+                rows_by_month[int(row[0])] = rows_by_month.get(int(row[0]), 0) + 1
+
+    assert sorted(result['month'] for result in results) == MONTHS
+    assert all(result['status'] == "succeeded" and result['written'] for result in results), results
+    assert rows_by_month == {result['month']: result['rows'] for result in results}
+    # 回補不更新檔案名稱
+    assert environment.spreadsheet.calls['update_title'] == 0
+    assert not list(tmp_path.iterdir())
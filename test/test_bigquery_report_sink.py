@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+測試 BigQuery 報表表輸出 (BigQueryReportSink)
+成本：0，BigQuery client 以 mock 取代，只檢查 load job 與 SQL
+"""
+
+from types import SimpleNamespace
+from google.cloud import bigquery
+from unittest import mock
+import pandas as pd
+from benchmarks.synthetic_data import (
+    generate_billing_aggregated,
+    generate_customer_profile,
+    generate_payment_status
+)
+from config import Config
+from services.bigquery_report_sink import FINGERPRINT_LABEL_MONTHS, REPORT_SCHEMA, BigQueryReportSink
+from utils.data_processor import DataProcessor
+
+def _sink() -> BigQueryReportSink:
+    return BigQueryReportSink(SimpleNamespace(client=mock.MagicMock()))
+
+def _integrated_data(account_count: int = 20) -> pd.DataFrame:
+    customer_profile = generate_customer_profile(account_count)
+    billing_data = generate_billing_aggregated(account_count, offset=3)
+    payment_status = generate_payment_status(customer_profile['billing_account_id'].tolist())
+    return DataProcessor.integrate_data(billing_data, customer_profile, payment_status)
+
+def test_report_frame_types():
+    """
+    測試 1: integrate_data 輸出轉為報表表欄位 (錯誤訊息的數值為 NULL)
+    """
+    data = _integrated_data()
+    report = BigQueryReportSink.to_report_frame(data, 202506)
+
+    assert list(report.columns) == [field.name for field in REPORT_SCHEMA if field.name != 'updated_at']
+    assert report['billing_account_id'].tolist() == data.index.tolist()
+    assert (report['month'] == 202506).all()
+
+    not_found = data['Spending $$$'] == Config.ERROR_MESSAGES["NOT_FOUND_BILLING"]
+    assert not_found.any()
+    assert report.loc[not_found.to_numpy(), 'spending'].isna().all()
+    assert report['spending'].dtype == 'float64'
+
+def test_write_is_one_load_and_one_merge():
+    """
+    測試 2: 寫入月份資料 = 一個 load job + 一個 MERGE (依 month, billing_account_id, row_index)
+    """
+    sink = _sink()
+    sink.write_monthly_data(_integrated_data(200), 2025, 202506)
+
+    client = sink.client
+    assert client.load_table_from_dataframe.call_count == 1
+    assert client.query.call_count == 1
+
+    query = client.query.call_args[0][0]
+    assert f"MERGE `{sink.table_id}`" in query
+    assert "T.billing_account_id = S.billing_account_id" in query
+    assert "WHEN NOT MATCHED BY SOURCE AND T.month = 202506 THEN" in query
+
+    table = client.create_table.call_args[0][0]
+    assert table.range_partitioning.field == "month"
+    assert table.clustering_fields == ["billing_account_id"]
+
+def test_waiting_records_and_updates():
+    """
+    測試 3: waiting 記錄以 SQL 查詢，更新以一個 load job + 一個 UPDATE 完成
+    """
+    sink = _sink()
+    sink.client.query.return_value.result.return_value.to_dataframe.return_value = pd.DataFrame({
+        'month': [202504, 202505],
+        'billing_account_id': ['A-1', 'B-2'],
+        'billing_account_name': ['Account A', 'Account B']
+    })
+
+    records = sink.get_waiting_records(2025)
+    query = sink.client.query.call_args[0][0]
+    assert "month BETWEEN 202501 AND 202512" in query
+    assert "payment_status = 'waiting'" in query
+    assert [(r['row_number'], r['month'], r['billing_account_name']) for r in records] == [
+        ((202504, 'A-1'), '202504', 'Account A'),
+        ((202505, 'B-2'), '202505', 'Account B')
+    ]
+
+    sink.client.reset_mock()
+    sink.update_payment_status(2025, [{'row_number': r['row_number'], 'new_status': 'Clear'} for r in records])
+
+    assert sink.client.load_table_from_dataframe.call_count == 1
+    assert sink.client.query.call_count == 1
+    loaded = sink.client.load_table_from_dataframe.call_args[0][0]
+    assert loaded.to_dict('list') == {
+        'month': [202504, 202505],
+        'billing_account_id': ['A-1', 'B-2'],
+        'payment_status': ['Clear', 'Clear']
+    }
+    assert f"UPDATE `{sink.table_id}` T" in sink.client.query.call_args[0][0]
+
+def test_rewrite_with_duplicated_account():
+    """
+    測試 4: 同一個 billing_account_id 有多列時，每列有不同的 row_index，重跑同月份時 MERGE 的鍵仍唯一
+    加入 row_index 前建立的報表表補上欄位；同帳號多列的付款狀態更新在 staging 只保留一列
+    """
+    customer_profile = generate_customer_profile(20)
+    customer_profile = pd.concat([customer_profile, customer_profile.iloc[[3, 7]]], ignore_index=True)
+    payment_status = generate_payment_status(customer_profile['billing_account_id'].tolist())
+    data = DataProcessor.integrate_data(generate_billing_aggregated(20), customer_profile, payment_status)
+    assert data.index.duplicated().any()
+
+    sink = _sink()
+    sink.client.create_table.return_value.schema = [bigquery.SchemaField("billing_account_id", "STRING")]
+    keys = []
+    for _ in range(2):
+        sink.write_monthly_data(data, 2025, 202506)
+        loaded = sink.client.load_table_from_dataframe.call_args[0][0]
+        keys.append(list(zip(loaded['month'], loaded['billing_account_id'], loaded['row_index'])))
+
+    assert len(set(keys[0])) == len(keys[0]) == len(data)
+    assert keys[0] == keys[1]
+    assert "IFNULL(T.row_index, 0) = S.row_index" in sink.client.query.call_args[0][0]
+    assert sink.client.update_table.call_args[0][1] == ["schema"]
+    assert sink.client.update_table.call_count == 1
+
+    duplicated = data.index[data.index.duplicated()][0]
+    sink.client.reset_mock()
+    sink.update_payment_status(2025, [{'row_number': (202506, duplicated), 'new_status': 'Clear'}] * 2)
+    loaded = sink.client.load_table_from_dataframe.call_args[0][0]
+    assert loaded['billing_account_id'].tolist() == [duplicated]
+
+class _LabeledTable:
+    """
+    BigQuery 表格的 label：update_table 合併 label，值為 None 時刪除，超過 64 個時失敗
+    """
+
+    def __init__(self):
+        self.labels = {'team': 'finance'}
+
+    def get_table(self, table_id):
+        return SimpleNamespace(labels=dict(self.labels))
+
+    def update_table(self, table, fields):
+        assert fields == ["labels"]
+        for key, value in table.labels.items():
+            if value is None:
+                self.labels.pop(key, None)
+            else:
+                self.labels[key] = value
+        if len(self.labels) > 64:
+            raise ValueError("a table can have at most 64 labels")
+
+def test_fingerprint_labels_stay_bounded():
+    """
+    測試 5: 寫入超過 64 個月份的 fingerprint 時 label 數量不超過上限，只保留最近的月份，其他 label 不變
+    """
+    months = [year * 100 + month for year in range(2019, 2026) for month in range(1, 13)]
+    assert len(months) > 64
+    sink = _sink()
+    table = _LabeledTable()
+    sink.client.get_table.side_effect = table.get_table
+    sink.client.update_table.side_effect = table.update_table
+
+    for month in months:
+        sink.set_fingerprint(month, f"fp{month}")
+
+    assert len(table.labels) == FINGERPRINT_LABEL_MONTHS + 1
+    assert table.labels['team'] == 'finance'
+    assert sink.get_fingerprint(months[-1]) == f"fp{months[-1]}"
+    assert sink.get_fingerprint(months[-FINGERPRINT_LABEL_MONTHS]) == f"fp{months[-FINGERPRINT_LABEL_MONTHS]}"
+    assert sink.get_fingerprint(months[0]) is None
+
+    # 回補比保留範圍更早的月份：不加入 label
+    sink.set_fingerprint(201801, "old")
+    assert sink.get_fingerprint(201801) is None and len(table.labels) == FINGERPRINT_LABEL_MONTHS + 1
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+測試 DataProcessor 原始 billing_data 聚合
+成本：0，不呼叫任何外部 API
+"""
+
+import numpy as np
+import pandas as pd
+from utils.data_processor import DataProcessor
+
+def _raw_billing_data() -> pd.DataFrame:
+    return pd.DataFrame({
+        'billing_account_id': ['B', 'A', 'A', 'B', 'C'],
+        'cost': [10.0, 5.0, 7.5, 2.5, 1.0],
+        'currency': ['USD', 'TWD', 'TWD', 'USD', 'USD'],
+        'month': [202506] * 5,
+        'credits': [
+            [{'name': 'promo', 'amount': -1.0}, {'name': 'sud', 'amount': -0.5}],
+            [],
+            None,
+            np.array([{'name': 'promo', 'amount': -2.5}], dtype=object),
+            [{'name': 'promo', 'amount': None}]
+        ]
+    })
+
+def test_aggregate_raw_billing():
+    """
+    測試 1: 原始資料的 cost / credits 聚合結果
+    """
+    billing_agg = DataProcessor._aggregate_raw_billing(_raw_billing_data())
+
+    assert list(billing_agg.columns) == [
+        'billing_account_id', 'cost', 'currency', 'month', 'credits_amount'
+    ]
+    result = billing_agg.set_index('billing_account_id')
+    assert result.loc['A', 'cost'] == 12.5
+    assert result.loc['A', 'credits_amount'] == 0
+    assert result.loc['B', 'cost'] == 12.5
+    assert result.loc['B', 'credits_amount'] == -4.0
+    assert result.loc['C', 'credits_amount'] == 0
+    assert result.loc['B', 'currency'] == 'USD'
+
+def test_raw_billing_input_untouched():
+    """
+    測試 2: 聚合不修改呼叫端的 DataFrame
+    """
+    billing_data = _raw_billing_data()
+    columns_before = list(billing_data.columns)
+
+    DataProcessor._merge_billing_and_customer(billing_data, pd.DataFrame())
+
+    assert list(billing_data.columns) == columns_before
+
+def test_credits_fallback_for_mixed_values():
+    """
+    測試 3: 無法轉為 Arrow 的 credits (dict / list / 數值混合) 使用逐列備用方法
+    """
+    credits = pd.Series([{'amount': -1.0}, [{'amount': -2.0}], 3.0, None], dtype=object)
+
+    amounts = DataProcessor._sum_credits_per_row(credits)
+
+    assert list(amounts) == [-1.0, -2.0, 3.0, 0.0]
+
+def test_aggregate_billing_chunks_matches_single_pass():
+    """
+    測試 4: 逐頁累加的結果與一次聚合相同
+    """
+    billing_data = _raw_billing_data()
+    chunks = [billing_data.iloc[i:i + 2] for i in range(0, len(billing_data), 2)]
+
+    chunked = DataProcessor.aggregate_billing_chunks(chunks)
+    single = DataProcessor.aggregate_billing_chunks([billing_data])
+
+    pd.testing.assert_frame_equal(chunked, single)
+    assert chunked['record_count'].sum() == len(billing_data)
+    assert list(chunked['spending']) == [12.5, 8.5, 1.0]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+測試 pandas / arrow 引擎的 integrate_data 輸出完全相同
+成本：0，不呼叫任何外部 API
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic_data import (
+    generate_billing_aggregated,
+    generate_billing_raw,
+    generate_customer_profile,
+    generate_payment_status
+)
+from utils.data_processor import DataProcessor
+
+def _assert_engines_equal(billing_data, customer_profile, payment_status):
+    pandas_output = DataProcessor.integrate_data(
+        billing_data.copy(), customer_profile.copy(), payment_status, engine="pandas"
+    )
+    arrow_output = DataProcessor.integrate_data(
+        billing_data.copy(), customer_profile.copy(), payment_status, engine="arrow"
+    )
+
+    assert list(arrow_output.columns) == list(pandas_output.columns)
+    pd.testing.assert_frame_equal(arrow_output, pandas_output, check_dtype=False)
+
+    # 寫入 Sheets 時以字串呈現，確保 202506 與 202506.0 這類差異也會被發現
+    assert arrow_output.astype(str).values.tolist() == pandas_output.astype(str).values.tolist()
+
+    return arrow_output
+
+def test_engines_match_with_partial_overlap():
+    """
+    測試 1: 兩邊各有對方沒有的帳號
+    """
+    customer_profile = generate_customer_profile(200)
+    billing_data = generate_billing_aggregated(180, offset=40)
+    payment_status = generate_payment_status(customer_profile['billing_account_id'].tolist())
+
+    output = _assert_engines_equal(billing_data, customer_profile, payment_status)
+
+    assert len(output) == 220
+
+def test_engines_match_with_full_overlap():
+    """
+    測試 2: 帳號完全相同 (Month 保持整數)
+    """
+    customer_profile = generate_customer_profile(100)
+    billing_data = generate_billing_aggregated(100)
+    payment_status = generate_payment_status(customer_profile['billing_account_id'].tolist())
+
+    _assert_engines_equal(billing_data, customer_profile, payment_status)
+
+def test_engines_match_with_raw_billing():
+    """
+    測試 3: 原始 billing_data (含 credits 陣列)
+    """
+    customer_profile = generate_customer_profile(50)
+    billing_data = generate_billing_raw(60, rows_per_account=3, offset=5)
+
+    _assert_engines_equal(billing_data, customer_profile, {})
+
+@pytest.mark.parametrize("side", ["customer_only", "billing_only", "empty"])
+def test_engines_match_with_one_side_missing(side):
+    """
+    測試 4: 只有其中一邊有資料 / 兩邊都沒有資料
+    """
+    customer_profile = generate_customer_profile(30)
+    billing_data = generate_billing_aggregated(30)
+
+    if side in ("billing_only", "empty"):
+        customer_profile = pd.DataFrame()
+    if side in ("customer_only", "empty"):
+        billing_data = pd.DataFrame()
+
+    _assert_engines_equal(billing_data, customer_profile, {})
+
+def test_engines_match_with_duplicate_and_null_values():
+    """
+    測試 5: 重複的 billing_account_id 與 null 欄位
+    """
+    customer_profile = generate_customer_profile(20, missing_ratio=0.3)
+    customer_profile = pd.concat([customer_profile, customer_profile.iloc[[3, 7]]], ignore_index=True)
+    customer_profile.loc[5, 'billing_account_name'] = None
+    customer_profile.loc[6, 'referral_company'] = None
+    billing_data = generate_billing_aggregated(25, offset=2)
+    billing_data.loc[4, 'currency'] = None
+    billing_data.loc[0, 'total_cost'] = np.nan
+
+    _assert_engines_equal(billing_data, customer_profile, {'unknown-id': 'Clear'})
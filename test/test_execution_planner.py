@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+測試執行計畫：依預期列數與表格 metadata 選擇 billing 讀取模式、整合引擎與 NetSuite 分批
+成本：0，以 benchmarks.fakes 取代所有外部 API
+"""
+
+import contextlib
+import io
+import math
+from unittest import mock
+import pandas as pd
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, fake_services
+from benchmarks.synthetic_data import generate_billing_aggregated, generate_customer_profile, generate_netsuite_statuses
+from config import Config
+from services.netsuite_service import NetSuiteService
+from utils.execution_planner import MB, plan_execution
+from utils.telemetry import telemetry
+import main
+
+MONTH = 202505
+TABLE_STATS = {
+    Config.BILLING_DATA_TABLE: {'num_rows': 1_000_000, 'num_bytes': 400_000_000},
+    Config.CUSTOMER_PROFILE_TABLE: {'num_rows': 100_000, 'num_bytes': 20_000_000}
+}
+
+@contextlib.contextmanager
+def _auto_config(**overrides):
+    settings = {'BILLING_MODE': "auto", 'DATA_ENGINE': "auto", 'BILLING_EXPORT_PATH': "", **overrides}
+    with contextlib.ExitStack() as stack:
+        for name, value in settings.items():
+            stack.enter_context(mock.patch.object(Config, name, value))
+        yield
+
+def test_plan_scales_with_month_size():
+    """
+    測試 1: 小月份使用 BigQuery 聚合 + pandas；帳號數超過預算時改用 arrow；匯出檔依預算縮小頁大小
+    """
+    with _auto_config():
+        small = plan_execution((20_000, 200), TABLE_STATS, budget=256 * MB)
+        large = plan_execution((5_000_000, 400_000), TABLE_STATS, budget=256 * MB)
+
+    assert (small.billing_mode, small.engine, small.netsuite_workers) == ("aggregated", "pandas", 1)
+    assert small.fits and small.netsuite_chunk_size >= 200
+    assert (large.billing_mode, large.engine) == ("aggregated", "arrow")
+    assert large.netsuite_workers == min(Config.NETSUITE_MAX_WORKERS, Config.HTTP_POOL_SIZE)
+
+    with _auto_config(BILLING_EXPORT_PATH="exports/"):
+        roomy = plan_execution((5_000_000, 1_000), TABLE_STATS, budget=1024 * MB)
+        tight = plan_execution((5_000_000, 1_000), TABLE_STATS, budget=64 * MB)
+        tiny = plan_execution((3_000, 1_000), TABLE_STATS, budget=1024 * MB)
+
+    assert roomy.streaming and roomy.page_size == Config.BILLING_PAGE_SIZE
+    assert tight.streaming and tight.page_size < roomy.page_size and tight.fits
+    # 整個月份只有一頁
+    assert tiny.page_size == 3_000
+
+    # 明確指定的模式不被覆蓋
+    with _auto_config(BILLING_MODE="streaming", DATA_ENGINE="pandas"):
+        fixed = plan_execution((5_000_000, 400_000), TABLE_STATS, budget=64 * MB)
+    assert (fixed.billing_mode, fixed.engine, fixed.fits) == ("streaming", "pandas", False)
+
+def test_chunked_payment_status_matches_single_request():
+    """
+    測試 2: NetSuite 分批同時查詢的結果與一次查詢相同
+    """
+    ids = generate_customer_profile(53, MONTH)['billing_account_id'].tolist()
+    environment = FakeEnvironment(
+        FakeBigQueryClient(pd.DataFrame(), pd.DataFrame()), FakeNetSuiteTransport(generate_netsuite_statuses(ids[:40]))
+    )
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        service = NetSuiteService()
+        single = service.get_invoice_payment_status("202506", ids)
+        chunked = service.get_invoice_payment_status("202506", ids, chunk_size=10, max_workers=3)
+
+    assert chunked == single and len(chunked) == len(ids)
+    assert environment.netsuite.calls == 1 + math.ceil(len(ids) / 10)
+    assert chunked[ids[-1]] == Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"]
+
+def test_pipeline_follows_plan():
+    """
+    測試 3: pipeline 依執行計畫分批查詢 NetSuite 並記錄選擇的計畫
+    """
+    customer_profile = generate_customer_profile(120, MONTH, seed=1)
+    ids = customer_profile['billing_account_id'].unique().tolist()
+    environment = FakeEnvironment(
+        FakeBigQueryClient(generate_billing_aggregated(120, MONTH, seed=1), customer_profile),
+        FakeNetSuiteTransport(generate_netsuite_statuses(ids))
+    )
+
+    output = io.StringIO()
+    with _auto_config(NETSUITE_CHUNK_SIZE=50, CHECKPOINT_DIR='', REPORT_TARGETS='', REPORT_SINK='sheets'), \
+            fake_services(environment), contextlib.redirect_stdout(output):
+        telemetry.reset()
+        outputs = main.run_pipeline(data_month=MONTH, backfill=True)
+        spans = list(telemetry.spans)
+
+    plan = outputs['plan']
+    assert (plan.billing_mode, plan.engine, plan.netsuite_chunk_size) == ("aggregated", "pandas", 50)
+    assert environment.netsuite.calls == 3
+    assert environment.bigquery.calls['get_table'] >= 2
+    assert "Execution plan: billing aggregated" in output.getvalue()
+    assert len(outputs['integrated_data']) == len(outputs['payment_status']) == len(ids)
+
+    # 分批查詢的請求 span 在 payment_status stage 的 span 之下
+    parents = {span.name: span.parent for span in spans}
+    chunk_spans = [span for span in spans if span.name == "netsuite.request_payment_status"]
+    assert len(chunk_spans) == 3
+    for span in chunk_spans:
+        ancestors = [span.parent]
+        while ancestors[-1] in parents and ancestors[-1] != "stage.payment_status":
+            ancestors.append(parents[ancestors[-1]])
+        assert ancestors[0] == "netsuite.get_invoice_payment_status"
+        assert ancestors[-1] == "stage.payment_status"
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+測試月份內容 fingerprint：內容未改變時重新執行不寫入報表
+成本：0，以 benchmarks.fakes 取代所有外部 API
+"""
+
+import contextlib
+import io
+from unittest import mock
+import pandas as pd
+from benchmarks.fakes import fake_services
+from benchmarks.run_benchmarks import build_environment
+from config import Config
+from utils.fingerprint import compute_fingerprint
+import main
+
+WRITE_METHODS = ('worksheet.update', 'worksheet.batch_format', 'worksheet.insert_row', 'update_title')
+
+def _run_main(environment, argv: list = ()):
+    environment.spreadsheet.reset_calls()
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'RUN_REPORT_PATH', ''), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        main.main(list(argv))
+    return environment.spreadsheet.calls
+
+def test_fingerprint_changes_with_content():
+    """
+    測試 1: 來源表修改時間、列數、整合資料或付款狀態改變時 fingerprint 不同
+    """
+    data = pd.DataFrame({'Month': [202506, 202506], 'Spending $$$': [1.0, 'not found']},
+                        index=pd.Index(['A', 'B'], name='billing_account_id'))
+    tables = {'billing_data': '2025-06-05T00:00:00', 'customer_profile': '2025-06-05T00:00:00'}
+    status = {'A': 'waiting', 'B': 'Clear'}
+    base = compute_fingerprint(tables, (10, 2), data, status)
+
+    assert base == compute_fingerprint(dict(tables), (10, 2), data.copy(), dict(status))
+    assert base != compute_fingerprint({**tables, 'billing_data': '2025-06-06T00:00:00'}, (10, 2), data, status)
+    assert base != compute_fingerprint(tables, (11, 2), data, status)
+    assert base != compute_fingerprint(tables, (10, 2), data.assign(**{'Spending $$$': [2.0, 'not found']}), status)
+    assert base != compute_fingerprint(tables, (10, 2), data, {**status, 'A': 'Clear'})
+    assert len(base) == 32
+
+def test_rerun_skips_unchanged_month():
+    """
+    測試 2: 同月份第二次執行不寫入，--force 時重新寫入
+    """
+    environment = build_environment(50, history_months=1)
+
+    first = _run_main(environment)
+    assert first['worksheet.update'] == 1
+    rows_after_first = environment.spreadsheet.worksheet('Report_2025').get_all_values()
+
+    second = _run_main(environment)
+    assert not any(second[method] for method in WRITE_METHODS)
+    assert second['batch_update'] == 0
+    assert environment.spreadsheet.worksheet('Report_2025').get_all_values() == rows_after_first
+
+    forced = _run_main(environment, ['--force'])
+    assert forced['worksheet.update'] == 1
+    assert forced['update_title'] == 1
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+測試 billing_data / customer_profile 的分區遷移：檢查表格、建立分區副本並換上、dry run 確認只掃描一個分區
+成本：0，以 benchmarks.fakes 取代 BigQuery
+"""
+
+import contextlib
+import io
+import pandas as pd
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, fake_services
+from benchmarks.synthetic_data import generate_billing_aggregated, generate_customer_profile
+from config import Config
+from services.bigquery_service import BigQueryService
+import migrate_tables
+
+MONTHS = [202503, 202504, 202505]
+
+def _environment(partitioned: tuple = ()) -> FakeEnvironment:
+    billing = pd.concat([generate_billing_aggregated(40, month, seed=month) for month in MONTHS], ignore_index=True)
+    customer_profile = pd.concat([generate_customer_profile(40, month, seed=month) for month in MONTHS],
+                                 ignore_index=True)
+    return FakeEnvironment(FakeBigQueryClient(billing, customer_profile, partitioned=partitioned),
+                           FakeNetSuiteTransport({}))
+
+def _run(environment, argv: list) -> tuple:
+    output = io.StringIO()
+    with fake_services(environment), contextlib.redirect_stdout(output):
+        code = migrate_tables.main(argv)
+    return code, output.getvalue()
+
+def _ddl(environment) -> list:
+    return [query.strip() for query in environment.bigquery.queries if query.lstrip().startswith(('CREATE', 'ALTER'))]
+
+def test_check_reports_unpartitioned_tables():
+    """
+    測試 1: 未加 --apply 時只檢查：未分區的表格與掃描整個表格的查詢回報失敗，不修改表格
+    """
+    environment = _environment()
+    code, output = _run(environment, [])
+
+    assert code == 1
+    assert "run with --apply to migrate" in output
+    assert _ddl(environment) == []
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        results = migrate_tables.verify_pruning(environment.bigquery, MONTHS[-1])
+    assert not any(result['pruned'] for result in results if result['query'] in ('billing_raw', 'customer_profile'))
+
+def test_apply_copies_and_swaps_tables():
+    """
+    測試 2: --apply 以 CTAS 建立分區 + 分群副本並改名換上，之後每個報表查詢只掃描一個月份的分區
+    """
+    environment = _environment(partitioned=(Config.CUSTOMER_PROFILE_TABLE,))
+    code, output = _run(environment, ['--apply', '--month', str(MONTHS[-1])])
+
+    assert code == 0, output
+    assert "All report queries prune to a single month partition" in output
+
+    # 已分區的 customer_profile 不變動
+    ddl = _ddl(environment)
+    assert len(ddl) == 3
+    table = f"{Config.PROJECT_ID}.{Config.DATASET_ID}.{Config.BILLING_DATA_TABLE}"
+    assert ddl[0].startswith(f"CREATE OR REPLACE TABLE `{table}_partitioned`")
+    assert "PARTITION BY RANGE_BUCKET(month, GENERATE_ARRAY(201901, 210001, 1))" in ddl[0]
+    assert "CLUSTER BY billing_account_id" in ddl[0]
+    assert ddl[1].startswith(f"ALTER TABLE `{table}` RENAME TO `{Config.BILLING_DATA_TABLE}_unpartitioned_")
+    assert ddl[2] == f"ALTER TABLE `{table}_partitioned` RENAME TO `{Config.BILLING_DATA_TABLE}`"
+
+def test_latest_month_reads_partition_metadata():
+    """
+    測試 3: 分區表的最新月份取自分區 metadata，不掃描 month 欄位；未分區時才以 MAX(month) 查詢
+    """
+    for partitioned, scans in (((Config.BILLING_DATA_TABLE, Config.CUSTOMER_PROFILE_TABLE), 0), ((), 2)):
+        environment = _environment(partitioned)
+        with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+            assert BigQueryService().get_latest_month() == MONTHS[-1]
+        assert sum('MAX(month)' in query for query in environment.bigquery.queries) == scans
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+測試發票狀態變更事件：事件合併後只更新對應的 waiting 儲存格
+成本：0，以 benchmarks.fakes 取代所有外部 API，事件由 benchmarks.synthetic_data 產生
+"""
+
+import contextlib
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, FakeSpreadsheet, fake_services
+from benchmarks.synthetic_data import generate_customer_profile, generate_payment_events, generate_report_rows
+from config import Config
+from server import ReportServer, WarmServices
+from services.bigquery_service import BigQueryService
+from services.payment_events import PaymentEventReceiver
+from services.sheets_service import SheetsService
+from utils.lease import LeaseManager, LeaseTimeout
+
+MONTHS = [202504, 202505]
+
+def _environment(account_count: int = 40) -> FakeEnvironment:
+    customer_profile = pd.concat(
+        [generate_customer_profile(account_count, month, seed=month) for month in MONTHS], ignore_index=True
+    )
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet('Report_2025', generate_report_rows(customer_profile))
+    return FakeEnvironment(FakeBigQueryClient(pd.DataFrame(), customer_profile), FakeNetSuiteTransport({}), spreadsheet)
+
+def _waiting_names(rows: list, month: int) -> set:
+    return {row[1] for row in rows[1:] if row and row[0] == str(month) and row[7] == 'waiting'}
+
+def test_events_update_only_changed_cells():
+    """
+    測試 1: 多批事件合併為一次寫回，只有已付款的 waiting 列改為 Clear；Open 事件與未知帳號不更新 (未知帳號留在 buffer)
+    """
+    environment = _environment()
+    customer_profile = environment.bigquery.customer_profile
+    names = dict(zip(customer_profile['billing_account_id'], customer_profile['billing_account_name']))
+    events = generate_payment_events(customer_profile, change_ratio=0.3)['data']
+    before = environment.spreadsheet.worksheet('Report_2025').get_all_values()
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        receiver = PaymentEventReceiver(SheetsService(), BigQueryService())
+        environment.spreadsheet.reset_calls()
+
+        half = len(events) // 2
+        receiver.add_events({'data': events[:half]})
+        receiver.add_events({'data': events[half:] + [
+            {'invoice_date': '2025/06/03', 'payment_status': 'Open', 'items': [events[0]['items'][0]]},
+            {'month': '202505', 'payment_status': 'Paid In Full', 'items': ['UNKNOWN-ACCOUNT']},
+            {'payment_status': 'Paid In Full', 'items': ['missing date']}
+        ]})
+        summary = receiver.flush()
+
+    # 最後一次事件為準：events[0] 第一個帳號最後收到 Open，不更新
+    reopened = events[0]['items'][0]
+    paid = {(event['invoice_date'], bid) for event in events for bid in event['items']} - {('2025/05/03', reopened)}
+
+    calls = environment.spreadsheet.calls
+    assert calls['values_batch_get'] == 1
+    assert calls['values_batch_update'] == 1
+    # 未知帳號的月份重新查詢一次 customer_profile
+    assert environment.bigquery.calls['query'] == len(MONTHS) + 1
+
+    after = environment.spreadsheet.worksheet('Report_2025').get_all_values()
+    changed = [(b, a) for b, a in zip(before, after) if b != a]
+    assert len(changed) == summary['updated'] > 0
+    assert all(b[7] == 'waiting' and a[7] == 'Clear' and b[:7] == a[:7] for b, a in changed)
+
+    expected = {
+        (month, names[bid]) for date, bid in paid
+        for month in [202504 if date == '2025/05/03' else 202505]
+        if names.get(bid) in _waiting_names(before, month)
+    }
+    assert {(int(a[0]), a[1]) for _, a in changed} == expected
+    assert summary['unmatched'] == receiver.pending == 1
+
+def test_endpoint_buffers_until_flush():
+    """
+    測試 2: POST /payment-events 先放入 buffer (需 X-Push-Token，未設定 PUSH_SHARED_SECRET 時拒絕)，flush 時排入一個寫回工作
+    """
+    environment = _environment(20)
+    payload = generate_payment_events(environment.bigquery.customer_profile, change_ratio=0.5)
+
+    with mock.patch.object(Config, 'PUSH_MAX_BUFFERED', 10 ** 6), \
+            mock.patch.object(Config, 'PUSH_SHARED_SECRET', 'secret'), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        server = ReportServer(('127.0.0.1', 0), WarmServices(), workers=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/payment-events"
+
+        def post(token: str):
+            request = urllib.request.Request(url, json.dumps(payload).encode(), {'X-Push-Token': token})
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                return e.code, None
+
+        try:
+            with mock.patch.object(Config, 'PUSH_SHARED_SECRET', ''):
+                assert post('')[0] == 401
+            assert post('wrong')[0] == 401
+            status, summary = post('secret')
+            assert status == 202 and summary['accepted'] == len(payload['data'])
+            assert environment.spreadsheet.calls['values_batch_update'] == 0
+
+            job = server.flush_payment_events()
+            for _ in range(500):
+                if job.finished_at is not None:
+                    break
+                time.sleep(0.01)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    assert job.status == 'succeeded', job.error
+    assert job.result['updated'] > 0
+    assert environment.spreadsheet.calls['values_batch_update'] == 1
+
+def test_unmatched_changes_retry_until_expired():
+    """
+    測試 3: customer_profile 尚無對應帳號的變更留在 buffer，帳號加入後的 flush 重新查詢並更新；超過 TTL 後捨棄
+    """
+    environment = _environment(20)
+    customer_profile = environment.bigquery.customer_profile
+    rows = environment.spreadsheet.worksheet('Report_2025').get_all_values()
+    name = sorted(_waiting_names(rows, 202505))[0]
+    target = customer_profile[(customer_profile['month'] == 202505) &
+                              (customer_profile['billing_account_name'] == name)]['billing_account_id'].iloc[0]
+    event = {'data': [{'month': '202505', 'payment_status': 'Paid In Full', 'items': [target]}]}
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        receiver = PaymentEventReceiver(SheetsService(), BigQueryService())
+        environment.bigquery.customer_profile = customer_profile[customer_profile['billing_account_id'] != target]
+        receiver.add_events(event)
+        first = receiver.flush()
+
+        environment.bigquery.customer_profile = customer_profile
+        second = receiver.flush()
+
+        receiver.add_events({'data': [{'month': '202505', 'payment_status': 'Paid In Full', 'items': ['UNKNOWN']}]})
+        with mock.patch.object(Config, 'PUSH_UNMATCHED_TTL_SECONDS', 0):
+            expired = receiver.flush()
+
+    assert (first['updated'], first['unmatched']) == (0, 1)
+    assert (second['updated'], second['unmatched']) == (1, 0)
+    assert (expired['unmatched'], expired['expired'], receiver.pending) == (0, 1, 0)
+    assert name not in _waiting_names(environment.spreadsheet.worksheet('Report_2025').get_all_values(), 202505)
+
+def test_flush_holds_report_lease(tmp_path):
+    """
+    測試 4: flush 在 Report_{year} lease 內讀取 waiting 列並寫回，其他 process 持有 lease 時不讀取報表，變更留在 buffer
+    """
+    environment = _environment(20)
+    events = generate_payment_events(environment.bigquery.customer_profile, change_ratio=0.5)
+    lease_manager = LeaseManager(str(tmp_path), poll=0.01, timeout=0.1)
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        receiver = PaymentEventReceiver(SheetsService(), BigQueryService(), lease_manager=lease_manager)
+        receiver.add_events(events)
+        pending = receiver.pending
+        environment.spreadsheet.reset_calls()
+
+        with LeaseManager(str(tmp_path)).hold("Report_2025"):
+            with pytest.raises(LeaseTimeout):
+                receiver.flush()
+        assert environment.spreadsheet.calls['values_batch_get'] == 0
+        assert receiver.pending == pending
+
+        with mock.patch.object(LeaseManager, 'hold', wraps=lease_manager.hold) as hold:
+            summary = receiver.flush()
+
+    assert [call.args for call in hold.call_args_list] == [("Report_2025",)]
+    assert summary['updated'] > 0
+    assert not list(tmp_path.iterdir())
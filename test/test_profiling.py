@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+測試 stage profile：啟用時 stage 依序執行，每個 stage 都有自己的 profile 與記憶體峰值
+成本：0，只寫入暫存目錄
+"""
+
+import contextlib
+import io
+import time
+import tracemalloc
+from unittest import mock
+from utils.pipeline import Pipeline
+from utils.profiling import Profiler
+
+def test_profiled_stages_run_one_at_a_time(tmp_path):
+    """
+    測試 1: 彼此獨立的 stage 在 profile 時不重疊，每個 stage 都產生 cProfile dump；巢狀 stage 併入外層
+    """
+    was_tracing = tracemalloc.is_tracing()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            profiler = Profiler("cprofile", str(tmp_path))
+            pipeline = Pipeline(max_workers=4)
+            for name in ("a", "b", "c"):
+                pipeline.add_stage(name, lambda: time.sleep(0.02) or bytearray(1024 * 1024))
+
+            def nested(a):
+                with profiler.stage("inner"):
+                    return 1
+
+            pipeline.add_stage("outer", nested, ("a",))
+            with mock.patch('utils.pipeline.profiler', profiler):
+                pipeline.run()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    schedule = sorted(pipeline.schedule, key=lambda entry: entry['start'])
+    assert all(previous['end'] <= entry['start'] for previous, entry in zip(schedule, schedule[1:]))
+    assert sorted(path.name for path in tmp_path.glob("*.prof")) == ["a.prof", "b.prof", "c.prof", "outer.prof"]
+    assert len(profiler.summaries) == 4
+    assert "Warning: stage inner runs inside outer" in output.getvalue()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+測試已結清月份的封存：Report_{year} 只保留未結清的月份與本月，Report_Index 記錄月份位置
+成本：0，以 benchmarks.fakes 取代 Google Sheets
+"""
+
+import contextlib
+import io
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, FakeSpreadsheet, fake_services
+from benchmarks.synthetic_data import generate_customer_profile, generate_report_rows
+from config import Config
+from services.report_sink import create_report_sink
+from services.sheets_service import SheetsService
+from utils.lease import LeaseManager, LeaseTimeout
+
+SETTLED = [202501, 202502]
+OPEN = [202503, 202504, 202505]
+CURRENT = 202505
+
+def _environment() -> FakeEnvironment:
+    """
+    202501-202502 全部 Clear，202503-202505 約半數 waiting
+    """
+    profiles = {month: generate_customer_profile(20, month, seed=month) for month in SETTLED + OPEN}
+    settled_rows = generate_report_rows(pd.concat([profiles[m] for m in SETTLED]), waiting_ratio=0.0)
+    open_rows = generate_report_rows(pd.concat([profiles[m] for m in OPEN]), waiting_ratio=0.5)
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet("Report_2025", settled_rows + [[''] * len(Config.OUTPUT_COLUMNS)] + open_rows[1:])
+    return FakeEnvironment(FakeBigQueryClient(pd.DataFrame(), pd.DataFrame()), FakeNetSuiteTransport({}), spreadsheet)
+
+@contextlib.contextmanager
+def _archive_mode(environment, mode: str = "worksheet"):
+    with mock.patch.object(Config, 'SHEETS_ARCHIVE_MODE', mode), \
+            mock.patch.object(Config, 'ARCHIVE_SPREADSHEET_ID', 'archive-sheet'), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        yield SheetsService()
+
+def _months(rows: list) -> list:
+    return sorted({int(row[0]) for row in rows[1:] if row and row[0]})
+
+def _waiting(records: list) -> list:
+    return sorted((record.month, record.billing_account_name) for record in records)
+
+@pytest.mark.parametrize("mode", ["worksheet", "spreadsheet"])
+def test_archive_settled_months(mode):
+    """
+    測試 1: 已結清的月份移到封存位置 (內容不變)，waiting 記錄不變，重跑不重複封存
+    """
+    environment = _environment()
+    before = environment.spreadsheet.worksheet("Report_2025").get_all_values()
+
+    with _archive_mode(environment, mode) as sheets:
+        waiting_before = _waiting(sheets.get_waiting_records(2025))
+        archived = sheets.archive_settled_months(2025, keep_months=(CURRENT,))
+        waiting_after = _waiting(sheets.get_waiting_records(2025))
+        assert sheets.archive_settled_months(2025, keep_months=(CURRENT,)) == []
+        index = SheetsService().month_index()
+
+    assert archived == [str(month) for month in SETTLED]
+    assert waiting_after == waiting_before
+
+    hot = environment.spreadsheet.worksheet("Report_2025").get_all_values()
+    assert _months(hot) == OPEN
+    assert len(hot) == len(before) - sum(1 for row in before[1:] if row[0] in archived) - len(SETTLED)
+    assert hot[1][0] == "202503"
+
+    if mode == "worksheet":
+        archive = environment.spreadsheet.worksheet("Archive_2025").get_all_values()
+    else:
+        archive = environment.gspread_client.spreadsheets['archive-sheet'].worksheet("Report_2025").get_all_values()
+    assert archive[0] == Config.OUTPUT_COLUMNS
+    assert archive[1:] == [row for row in before[1:] if row[0] in archived]
+
+    assert {month: entry['location'] for month, entry in index.items()} == {"202501": "archive", "202502": "archive"}
+    assert index["202501"]['rows'] == 20
+
+@pytest.mark.parametrize("interrupted", ["_record_months", "_delete_rows"])
+def test_interrupted_archive_is_not_duplicated(interrupted):
+    """
+    測試 2: 附加到封存位置後、記錄 Report_Index 或刪除 hot 列前中斷，重跑時不重複附加
+    """
+    environment = _environment()
+
+    with _archive_mode(environment) as sheets:
+        with mock.patch.object(SheetsService, interrupted, side_effect=RuntimeError("interrupted")):
+            with pytest.raises(RuntimeError):
+                sheets.archive_settled_months(2025, keep_months=(CURRENT,))
+        SheetsService().archive_settled_months(2025, keep_months=(CURRENT,))
+
+    archive = environment.spreadsheet.worksheet("Archive_2025").get_all_values()
+    assert len(archive) == 1 + 20 * len(SETTLED)
+    assert _months(environment.spreadsheet.worksheet("Report_2025").get_all_values()) == OPEN
+
+def test_rewrite_restores_archived_month():
+    """
+    測試 3: 重新寫入已封存的月份時，該月份從封存位置移回 hot 工作表
+    """
+    environment = _environment()
+    data = pd.DataFrame([['202501', 'Account-X', 'USD', 10.0, 0.1, 1.0, 'Partner A', 'Clear', 'Alice', '']],
+                        columns=['Month', 'Billing Account Name', 'Currency', 'Spending $$$', 'Referral share rate',
+                                 'Profit $$$', 'Referral Company', 'Customer<>CM', 'Sales', 'EDP status'])
+
+    with _archive_mode(environment) as sheets:
+        sheets.archive_settled_months(2025, keep_months=(CURRENT,))
+        sheets.write_monthly_data(data, 2025, 202501)
+        index = SheetsService().month_index()
+
+    archive = environment.spreadsheet.worksheet("Archive_2025").get_all_values()
+    hot = environment.spreadsheet.worksheet("Report_2025").get_all_values()
+    assert _months(archive) == [202502]
+    assert [row[1] for row in hot if row[0] == '202501'] == ['Account-X']
+    assert index["202501"] == {**index["202501"], 'location': "hot", 'sheet': "Report_2025", 'rows': 1}
+
+
+def test_failed_write_keeps_index():
+    """
+    測試 4: 寫入 hot 工作表失敗時，Report_Index 不記錄該月份為 hot
+    """
+    environment = _environment()
+    data = pd.DataFrame([['202504', 'Account-X', 'USD', 10.0, 0.1, 1.0, 'Partner A', 'Clear', 'Alice', '']],
+                        columns=['Month', 'Billing Account Name', 'Currency', 'Spending $$$', 'Referral share rate',
+                                 'Profit $$$', 'Referral Company', 'Customer<>CM', 'Sales', 'EDP status'])
+
+    with _archive_mode(environment) as sheets:
+        with mock.patch.object(SheetsService, '_remove_existing_month_data', side_effect=RuntimeError("quota")):
+            with pytest.raises(RuntimeError):
+                sheets.write_monthly_data(data, 2025, 202504)
+        assert "202504" not in sheets.month_index()
+        sheets.write_monthly_data(data, 2025, 202504)
+        index = sheets.month_index()
+
+    assert index["202504"]['location'] == "hot"
+
+def test_index_updates_keep_other_writers(tmp_path):
+    """
+    測試 5: Report_Index 在 lease 內重新讀取後只更新變更的月份列，另一個 SheetsService 記錄的月份不被覆蓋
+    lease 使用 create_report_sink 傳入的 LeaseManager (多目標報表的每個目標也相同)
+    """
+    environment = _environment()
+    lease_manager = LeaseManager(str(tmp_path), poll=0.01, timeout=0.2)
+    targets = '[{"name": "a", "spreadsheet_id": "sheet-a"}, {"name": "b", "spreadsheet_id": "sheet-b"}]'
+
+    with _archive_mode(environment), mock.patch.object(Config, 'REPORT_TARGETS', ''):
+        sheets = create_report_sink("sheets", lease_manager=lease_manager)
+        other = create_report_sink("sheets", lease_manager=lease_manager)
+        assert sheets.lease_manager is lease_manager
+        assert sheets.month_index() == other.month_index() == {}
+        sheets.archive_settled_months(2025, keep_months=(CURRENT,))
+        other._record_months({"202503": ("hot", "Report_2025", 20)})
+        sheets._record_months({"202501": ("hot", "Report_2025", 1)})
+
+        # 其他 process 持有 Report_Index lease 時等待
+        with LeaseManager(str(tmp_path)).hold(Config.REPORT_INDEX_SHEET):
+            with pytest.raises(LeaseTimeout):
+                sheets._record_months({"202504": ("hot", "Report_2025", 20)})
+        index = SheetsService().month_index()
+
+        with mock.patch.object(Config, 'REPORT_TARGETS', targets):
+            multi = create_report_sink(lease_manager=lease_manager)
+        assert [sink.lease_manager for sink in multi.sinks.values()] == [lease_manager, lease_manager]
+
+    assert {month: entry['location'] for month, entry in index.items()} == {
+        "202501": "hot", "202502": "archive", "202503": "hot"
+    }
+    rows = environment.spreadsheet.worksheet(Config.REPORT_INDEX_SHEET).get_all_values()
+    assert [row[0] for row in rows[1:]] == ["202501", "202502", "202503"]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+測試本地檔案報表輸出 (FileReportSink)
+成本：0，只寫入暫存目錄
+"""
+
+import contextlib
+import io
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, fake_services
+from benchmarks.synthetic_data import generate_customer_profile
+from config import Config
+from services.report_sink import FileReportSink, create_report_sink
+import check_payment
+
+def _report_data(names: list, statuses: list) -> pd.DataFrame:
+    """
+    DataProcessor.integrate_data 格式的輸出
+    """
+    return pd.DataFrame({
+        'Month': [202505] * len(names),
+        'Billing Account Name': names,
+        'Currency': ['USD'] * len(names),
+        'Spending $$$': [100.0, Config.ERROR_MESSAGES["NOT_FOUND_BILLING"], 50.5][:len(names)],
+        'Referral share rate': [0.1] * len(names),
+        'Profit $$$': [10.0, 0.0, 5.05][:len(names)],
+        'Referral Company': ['Partner A'] * len(names),
+        'Customer<>CM': statuses,
+        'Sales': ['Alice', None, 'Bob'][:len(names)],
+        'EDP status': [''] * len(names)
+    })
+
+def _sink(tmp_path, file_format: str) -> FileReportSink:
+    if file_format == "xlsx":
+        pytest.importorskip("openpyxl")
+    return FileReportSink(str(tmp_path), file_format)
+
+@pytest.mark.parametrize("file_format", FileReportSink.FORMATS)
+def test_write_and_replace_month(tmp_path, file_format):
+    """
+    測試 1: 寫入月份資料，重新寫入同月份時取代舊資料
+    """
+    sink = _sink(tmp_path, file_format)
+    sink.prepare_worksheet(2025)
+
+    sink.write_monthly_data(_report_data(['A', 'B', 'C'], ['waiting', 'Clear', 'waiting']), 2025, 202505)
+    sink.write_monthly_data(_report_data(['A', 'B'], ['waiting', 'waiting']), 2025, 202505)
+
+    report = sink._load(2025)
+    assert list(report.columns) == Config.OUTPUT_COLUMNS
+    assert report['Billing Account Name'].tolist() == ['A', 'B']
+    assert report['Month'].tolist() == ['202505', '202505']
+    assert report['Spending $$'].tolist()[1] == Config.ERROR_MESSAGES["NOT_FOUND_BILLING"]
+    assert report['Sales'].tolist()[1] == ''
+
+@pytest.mark.parametrize("file_format", FileReportSink.FORMATS)
+def test_waiting_records_and_updates(tmp_path, file_format):
+    """
+    測試 2: 讀取 waiting 記錄 (行號與 Google Sheets 相同) 並更新狀態
+    """
+    sink = _sink(tmp_path, file_format)
+    sink.write_monthly_data(_report_data(['A', 'B', 'C'], ['waiting', 'Clear', 'waiting']), 2025, 202505)
+
+    waiting = sink.get_waiting_records(2025)
+    assert [(r['row_number'], r['month'], r['billing_account_name']) for r in waiting] == [
+        (2, '202505', 'A'), (4, '202505', 'C')
+    ]
+
+    sink.update_payment_status(2025, [{'row_number': 4, 'new_status': 'Clear'}])
+    assert [r['billing_account_name'] for r in sink.get_waiting_records(2025)] == ['A']
+
+def test_check_payment_with_file_sink(tmp_path):
+    """
+    測試 3: check_payment 透過 REPORT_SINK 使用本地檔案
+    """
+    customer_profile = generate_customer_profile(3, 202505)
+    customer_profile['billing_account_name'] = ['A', 'B', 'C']
+    ids = customer_profile['billing_account_id'].tolist()
+    environment = FakeEnvironment(
+        FakeBigQueryClient(pd.DataFrame(), customer_profile),
+        FakeNetSuiteTransport({ids[0]: "Paid In Full", ids[2]: "Open"})
+    )
+
+    with mock.patch.object(Config, 'REPORT_SINK', 'parquet'), \
+            mock.patch.object(Config, 'REPORT_OUTPUT_DIR', str(tmp_path)), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        sink = create_report_sink()
+        sink.write_monthly_data(_report_data(['A', 'B', 'C'], ['waiting', 'Clear', 'waiting']), 2025, 202505)
+        check_payment.check_and_update_payment_status(2025)
+
+    report = FileReportSink(str(tmp_path), 'parquet')._load(2025)
+    assert report['Customer<>CM'].tolist() == ['Clear', 'Clear', 'waiting']
+    assert environment.spreadsheet.total_calls == 0
+
+@pytest.mark.parametrize("file_format", ["parquet", "xlsx"])
+def test_numeric_cells_stay_numeric(tmp_path, file_format):
+    """
+    測試 4: 數值欄位含 "not found" 等錯誤訊息時，其餘儲存格仍以數值保存；文字欄位不轉為數值
+    """
+    sink = _sink(tmp_path, file_format)
+    data = _report_data(['A', 'B', 'C'], ['waiting', 'Clear', 'waiting'])
+    data['Billing Account Name'] = ['100', 'B', 'C']
+    sink.write_monthly_data(data, 2025, 202505)
+
+    if file_format == "parquet":
+        stored = pd.read_parquet(sink.report_path(2025))
+        assert stored['Spending $$'].dtype.kind == 'f'
+        assert stored['Spending $$ (text)'].tolist() == ['', Config.ERROR_MESSAGES["NOT_FOUND_BILLING"], '']
+    else:
+        from openpyxl import load_workbook
+        worksheet = load_workbook(sink.report_path(2025)).active
+        assert [cell.value for cell in worksheet['D'][1:]] == [100.0, Config.ERROR_MESSAGES["NOT_FOUND_BILLING"], 50.5]
+        assert worksheet['D2'].number_format == '$#,##0.00'
+
+    report = sink._load(2025)
+    assert list(report.columns) == Config.OUTPUT_COLUMNS
+    assert report['Spending $$'].tolist() == [100.0, Config.ERROR_MESSAGES["NOT_FOUND_BILLING"], 50.5]
+    assert report['Billing Account Name'].tolist() == ['100', 'B', 'C']
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+測試多目標報表：BigQuery / NetSuite 只查詢一次，資料依 filters 分送到各目標
+成本：0，以 benchmarks.fakes 取代所有外部 API，檔案目標只寫入暫存目錄
+"""
+
+import contextlib
+import io
+import json
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import fake_services
+from benchmarks.run_benchmarks import build_environment
+from config import Config
+from services.netsuite_service import NetSuiteService
+from services.report_sink import FileReportSink
+from services.report_targets import MultiTargetSink, load_report_targets
+from services.sheets_service import SheetsService
+import check_payment
+import main
+
+def _targets(tmp_path) -> list:
+    return [
+        {'name': "partner_a", 'spreadsheet_id': "sheet-partner-a", 'filters': {'Referral Company': "Partner A"}},
+        {'name': "partner_bc", 'spreadsheet_id': "sheet-partner-bc",
+         'filters': {'Referral Company': ["Partner B", "Partner C"]}},
+        {'name': "alice", 'sink': "parquet", 'output_dir': str(tmp_path / "alice"), 'filters': {'Sales': ["Alice"]}}
+    ]
+
+def _run(environment, targets: str = "", force: bool = False) -> dict:
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'REPORT_SINK', 'sheets'), \
+            mock.patch.object(Config, 'REPORT_TARGETS', targets), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        return main.run_pipeline(force=force)
+
+def test_fan_out_shares_one_snapshot(tmp_path):
+    """
+    測試 1: 三個目標與單一報表的 BigQuery / NetSuite 呼叫次數相同，各目標只寫入符合 filters 的列
+    """
+    single = build_environment(60, history_months=0)
+    results = _run(single)
+    integrated_data = results['integrated_data']
+
+    fan_out = build_environment(60, history_months=0)
+    _run(fan_out, json.dumps(_targets(tmp_path)))
+
+    assert fan_out.bigquery.calls == single.bigquery.calls
+    assert fan_out.netsuite.calls == single.netsuite.calls
+
+    sheet_name = Config.SHEET_NAME_FORMAT.format(year=results['data_month'] // 100)
+    spreadsheets = fan_out.gspread_client.spreadsheets
+    for spreadsheet_id, companies in (("sheet-partner-a", {"Partner A"}), ("sheet-partner-bc", {"Partner B", "Partner C"})):
+        rows = spreadsheets[spreadsheet_id].worksheet(sheet_name).get_all_values()[1:]
+        expected = integrated_data[integrated_data['Referral Company'].isin(companies)]
+        assert len(rows) == len(expected) > 0
+        assert {row[6] for row in rows} == companies
+
+    alice = FileReportSink(str(tmp_path / "alice"), "parquet")._load(results['data_month'] // 100)
+    assert len(alice) == (integrated_data['Sales'] == "Alice").sum() > 0
+
+    # 預設試算表沒有被寫入
+    assert fan_out.spreadsheet.total_calls == 0
+
+def test_payment_check_queries_each_name_once(tmp_path):
+    """
+    測試 2: 同一帳號出現在多個目標時只查詢一次 NetSuite，各目標的 waiting 列都更新
+    """
+    environment = build_environment(40, history_months=1)
+    targets = [
+        {'name': "all_a", 'sink': "parquet", 'output_dir': str(tmp_path / "a")},
+        {'name': "all_b", 'sink': "csv", 'output_dir': str(tmp_path / "b")}
+    ]
+    sink = MultiTargetSink(load_report_targets(json.dumps(targets)))
+    history = environment.spreadsheet.worksheet("Report_2025").get_all_values()
+    for target_sink in sink.sinks.values():
+        target_sink._save(2025, pd.DataFrame(history[1:], columns=history[0]))
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        all_updates = check_payment.check_and_update_payment_status(2025, sink, NetSuiteService())
+
+    single = build_environment(40, history_months=1)
+    with fake_services(single), contextlib.redirect_stdout(io.StringIO()):
+        single_sink = SheetsService()
+        single_updates = check_payment.check_and_update_payment_status(2025, single_sink, NetSuiteService())
+        single_waiting = len(single_sink.get_waiting_records(2025))
+
+    assert environment.netsuite.calls == single.netsuite.calls
+    assert sum(map(len, all_updates.values())) == 2 * sum(map(len, single_updates.values())) > 0
+    for target_sink in sink.sinks.values():
+        assert len(target_sink.get_waiting_records(2025)) == single_waiting
+
+def test_invalid_targets():
+    """
+    測試 3: 未知欄位、重複名稱與缺少 spreadsheet_id 的設定在啟動時失敗
+    """
+    with pytest.raises(ValueError):
+        load_report_targets(json.dumps([{'name': "x", 'sink': "csv", 'filters': {'Region': ["APAC"]}}]))
+    with pytest.raises(ValueError):
+        load_report_targets(json.dumps([{'name': "x", 'sink': "csv"}, {'name': "x", 'sink': "csv"}]))
+    with pytest.raises(ValueError):
+        load_report_targets(json.dumps([{'name': "x", 'sink': "sheets"}]))
+    assert load_report_targets("") == []
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+測試常駐 HTTP 服務：工作排入 worker pool、重複執行時共用已連線的服務
+成本：0，以 benchmarks.fakes 取代所有外部 API，服務只監聽 127.0.0.1
+"""
+
+import contextlib
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest import mock
+import pandas as pd
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, FakeSpreadsheet, fake_services
+from benchmarks.run_benchmarks import build_environment
+from benchmarks.synthetic_data import generate_billing_aggregated, generate_customer_profile, generate_report_rows
+from config import Config
+from server import ReportServer, WarmServices
+
+TOKEN = "server-token"
+
+@contextlib.contextmanager
+def _running_server(environment, token: str = TOKEN):
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'RUN_REPORT_PATH', ''), \
+            mock.patch.object(Config, 'SERVER_TOKEN', token), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        server = ReportServer(('127.0.0.1', 0), WarmServices(), workers=2, max_queued=5)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{server.server_address[1]}"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+def _request(url: str, body: dict = None, token: str = TOKEN) -> tuple:
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(url, data=data, method='GET' if body is None else 'POST',
+                                     headers={'Authorization': f"Bearer {token}"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def _wait(base_url: str, job: dict) -> dict:
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        _, job = _request(f"{base_url}/jobs/{job['id']}")
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(job)
+
+def test_jobs_reuse_warm_clients():
+    """
+    測試 1: 報表與付款狀態工作依序完成，credentials / authorize / open_by_key 只各一次
+    """
+    environment = build_environment(50, history_months=1)
+
+    with _running_server(environment) as base_url:
+        status, health = _request(f"{base_url}/health")
+        assert status == 200 and health['status'] == 'ok'
+
+        status, first = _request(f"{base_url}/reports", {})
+        assert status == 202 and first['status'] in ('queued', 'running')
+        first = _wait(base_url, first)
+
+        second = _wait(base_url, _request(f"{base_url}/reports", {'month': first['result']['data_month'], 'force': True})[1])
+        payment = _wait(base_url, _request(f"{base_url}/payment-status", {'year': 2025})[1])
+
+        _, health = _request(f"{base_url}/health")
+
+    assert first['status'] == 'succeeded', first
+    assert first['result']['written'] and first['result']['rows'] >= 50
+    assert second['status'] == 'succeeded' and second['result']['written']
+    assert payment['status'] == 'succeeded', payment
+    assert health['clients_ready'] and health['queued'] == 0 and health['running'] == 0
+
+    assert environment.connections == {'credentials': 1, 'bigquery': 1, 'gspread': 1}
+    assert environment.gspread_client.calls['open_by_key'] == 1
+
+def test_rejects_bad_requests():
+    """
+    測試 2: 參數錯誤回傳 400，未知路徑與工作回傳 404
+    """
+    environment = build_environment(10, history_months=0)
+
+    with _running_server(environment) as base_url:
+        assert _request(f"{base_url}/reports", {'month': 'June'})[0] == 400
+        assert _request(f"{base_url}/payment-status", {'year': 99999})[0] == 400
+        assert _request(f"{base_url}/jobs/report-999")[0] == 404
+        assert _request(f"{base_url}/unknown", {})[0] == 404
+
+def test_post_routes_require_token():
+    """
+    測試 3: POST /reports、/payment-status 需帶 SERVER_TOKEN，未設定 SERVER_TOKEN 時一律拒絕
+    """
+    environment = build_environment(10, history_months=0)
+
+    with _running_server(environment) as base_url:
+        assert _request(f"{base_url}/reports", {}, token='wrong')[0] == 401
+        assert _request(f"{base_url}/payment-status", {'year': 2025}, token='')[0] == 401
+        assert _request(f"{base_url}/health", token='')[0] == 200
+
+    with _running_server(environment, token='') as base_url:
+        status, body = _request(f"{base_url}/reports", {}, token='')
+        assert status == 401 and "SERVER_TOKEN" in body['error']
+
+def test_explicit_month_updates_history():
+    """
+    測試 4: 指定月份且該月份區塊不在工作表最後時，重新寫入後歷史月份的付款狀態仍寫入正確的列
+    """
+    current = generate_customer_profile(20, 202505, seed=1)
+    previous = generate_customer_profile(40, 202504, seed=2).iloc[20:].reset_index(drop=True)
+    statuses = {bid: "Open" for bid in current['billing_account_id']}
+    statuses.update({bid: "Paid In Full" for bid in previous['billing_account_id']})
+
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet("Report_2025", generate_report_rows(current, waiting_ratio=1.0) + [
+        [''] * len(Config.OUTPUT_COLUMNS)
+    ] + generate_report_rows(previous, waiting_ratio=1.0)[1:])
+    environment = FakeEnvironment(
+        FakeBigQueryClient(generate_billing_aggregated(20, 202505, seed=1), pd.concat([current, previous])),
+        FakeNetSuiteTransport(statuses), spreadsheet
+    )
+
+    with mock.patch.object(Config, 'REPORT_TARGETS', ''), mock.patch.object(Config, 'REPORT_SINK', 'sheets'), \
+            mock.patch.object(Config, 'LEASE_DIR', ''), _running_server(environment) as base_url:
+        job = _wait(base_url, _request(f"{base_url}/reports", {'month': 202505})[1])
+
+    assert job['status'] == 'succeeded', job
+    status_by_month = {}
+    for row in spreadsheet.worksheet("Report_2025").get_all_values()[1:]:
+        if row[0]:
+            status_by_month.setdefault(row[0], set()).add(row[7])
+    assert status_by_month == {'202504': {'Clear'}, '202505': {'waiting'}}
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+測試 Google Sheets reconcile 寫入模式：重新寫入月份時只送出差異
+成本：0，以 benchmarks.fakes 取代 gspread
+"""
+
+import contextlib
+import io
+from unittest import mock
+import pandas as pd
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, fake_services
+from config import Config
+from services.sheets_service import SheetsService
+
+YEAR = 2025
+SHEET_NAME = Config.SHEET_NAME_FORMAT.format(year=YEAR)
+
+def _report_data(month: int, names: list, statuses: dict = None, spending: dict = None) -> pd.DataFrame:
+    statuses = statuses or {}
+    spending = spending or {}
+    return pd.DataFrame({
+        'Month': [month] * len(names),
+        'Billing Account Name': names,
+        'Currency': ['USD'] * len(names),
+        'Spending $$$': [spending.get(name, 100.0) for name in names],
+        'Referral share rate': [0.1] * len(names),
+        'Profit $$$': [spending.get(name, 100.0) * 0.1 for name in names],
+        'Referral Company': ['Partner A'] * len(names),
+        'Customer<>CM': [statuses.get(name, 'waiting') for name in names],
+        'Sales': ['Alice'] * len(names),
+        'EDP status': [''] * len(names)
+    })
+
+def _month_rows(rows: list, month: int) -> list:
+    return [row for row in rows if row and row[0] == str(month)]
+
+def test_reconcile_sends_only_changes():
+    """
+    測試 1: 狀態/金額變更只更新對應儲存格，新增與刪除的列在同一次 batch_update 完成
+    """
+    environment = FakeEnvironment(FakeBigQueryClient(pd.DataFrame(), pd.DataFrame()), FakeNetSuiteTransport({}))
+    names = [f"Account-{i}" for i in range(200)]
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        sheets_service = SheetsService()
+        sheets_service.write_monthly_data(_report_data(202504, names), YEAR, 202504)
+        sheets_service.write_monthly_data(_report_data(202505, names), YEAR, 202505)
+        worksheet = environment.spreadsheet.worksheet(SHEET_NAME)
+        april_rows = _month_rows(worksheet.get_all_values(), 202504)
+        may_start = next(i for i, row in enumerate(worksheet.get_all_values()) if row[0] == '202505')
+
+        # Account-3 改為 Clear、Account-7 金額修正、Account-9 移除、新增 Account-new
+        new_names = [name for name in names if name != 'Account-9'] + ['Account-new']
+        data = _report_data(202505, new_names, {'Account-3': 'Clear'}, {'Account-7': 150.0})
+
+        environment.spreadsheet.reset_calls()
+        with mock.patch.object(Config, 'SHEETS_WRITE_MODE', 'reconcile'):
+            sheets_service.write_monthly_data(data, YEAR, 202505)
+
+    calls = environment.spreadsheet.calls
+    assert calls['batch_update'] == 1
+    assert calls['worksheet.update'] == 0
+    assert calls['worksheet.insert_row'] == 0
+
+    # 3 個變更的儲存格 (狀態、金額、利潤) + 新增列的資料，各一個 insertDimension / deleteDimension
+    request_types = [next(iter(request)) for request in environment.spreadsheet.batch_requests]
+    assert request_types.count('updateCells') == 4
+    assert request_types.count('insertDimension') == 1
+    assert request_types.count('deleteDimension') == 1
+
+    rows = worksheet.get_all_values()
+    may_rows = _month_rows(rows, 202505)
+    assert [row[1] for row in may_rows] == new_names
+    assert next(i for i, row in enumerate(rows) if row[0] == '202505') == may_start
+    assert _month_rows(rows, 202504) == april_rows
+
+    by_name = {row[1]: row for row in may_rows}
+    assert by_name['Account-3'][7] == 'Clear'
+    assert by_name['Account-7'][3] == '150.0'
+    assert by_name['Account-new'][7] == 'waiting'
+
+def test_reconcile_without_existing_month_appends():
+    """
+    測試 2: 該月份尚無資料時與 replace 模式相同 (附加在最後)
+    """
+    environment = FakeEnvironment(FakeBigQueryClient(pd.DataFrame(), pd.DataFrame()), FakeNetSuiteTransport({}))
+    names = ['A', 'B']
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()), \
+            mock.patch.object(Config, 'SHEETS_WRITE_MODE', 'reconcile'):
+        sheets_service = SheetsService()
+        sheets_service.write_monthly_data(_report_data(202505, names), YEAR, 202505)
+        sheets_service.write_monthly_data(_report_data(202505, names), YEAR, 202505)
+
+    rows = environment.spreadsheet.worksheet(SHEET_NAME).get_all_values()
+    assert [row[1] for row in _month_rows(rows, 202505)] == names
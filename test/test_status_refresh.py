@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+測試付款狀態常駐更新：依發票年齡排程的優先佇列與每輪的 API 呼叫
+成本：0，以 benchmarks.fakes 取代所有外部 API
+"""
+
+import contextlib
+import io
+from datetime import datetime
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, FakeSpreadsheet, fake_services
+from benchmarks.synthetic_data import generate_customer_profile, generate_netsuite_statuses, generate_report_rows
+from config import Config
+from services.netsuite_service import NetSuiteService
+from services.sheets_service import SheetsService
+from utils.lease import LeaseManager, LeaseTimeout
+from utils.refresh_scheduler import HOUR, RefreshScheduler, invoice_issued_at, next_interval
+import status_refresh
+
+NOW = datetime(2025, 6, 15, 12).timestamp()
+
+def test_interval_grows_with_age_and_checks():
+    """
+    測試 1: 新發票間隔短，舊發票與多次未付款的間隔長，且不超過上限
+    """
+    young = next_interval(invoice_issued_at('202505'), 0, NOW)
+    old = next_interval(invoice_issued_at('202412'), 0, NOW)
+
+    assert Config.REFRESH_MIN_INTERVAL_HOURS * HOUR <= young < old
+    assert next_interval(invoice_issued_at('202505'), 3, NOW) > young
+    assert next_interval(invoice_issued_at('202001'), 10, NOW) == Config.REFRESH_MAX_INTERVAL_HOURS * HOUR
+
+def test_scheduler_queue_and_state(tmp_path):
+    """
+    測試 2: 新發票立即到期，未付款的重新排程，已付款與不再 waiting 的移出；狀態可保存與讀取
+    """
+    scheduler = RefreshScheduler()
+    scheduler.sync({'202505': ['A', 'B'], '202412': ['C']}, NOW)
+
+    due = scheduler.pop_due(NOW)
+    assert [invoice.key for invoice in due] == [('202505', 'A'), ('202505', 'B'), ('202412', 'C')]
+    assert scheduler.pop_due(NOW) == []
+
+    by_name = {invoice.name: invoice for invoice in due}
+    scheduler.record_check(by_name['A'], settled=True, now=NOW)
+    scheduler.record_check(by_name['B'], settled=False, now=NOW)
+    scheduler.record_check(by_name['C'], settled=False, now=NOW)
+
+    assert set(scheduler.invoices) == {('202505', 'B'), ('202412', 'C')}
+    # 新發票先到期
+    assert scheduler.next_wakeup() == by_name['B'].next_check < by_name['C'].next_check
+
+    path = str(tmp_path / "refresh_state.json")
+    scheduler.save(path)
+    restored = RefreshScheduler.load(path)
+    assert {key: invoice.to_dict() for key, invoice in restored.invoices.items()} == \
+        {key: invoice.to_dict() for key, invoice in scheduler.invoices.items()}
+    assert restored.next_wakeup() == scheduler.next_wakeup()
+
+    # 報表中已不是 waiting 的發票移出佇列
+    restored.sync({'202412': ['C']}, NOW)
+    assert set(restored.invoices) == {('202412', 'C')}
+    assert [invoice.name for invoice in restored.pop_due(by_name['C'].next_check)] == ['C']
+
+def _environment(months: list) -> FakeEnvironment:
+    customer_profile = pd.concat(
+        [generate_customer_profile(30, month, seed=month) for month in months], ignore_index=True
+    )
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet('Report_2025', generate_report_rows(customer_profile))
+    return FakeEnvironment(
+        FakeBigQueryClient(pd.DataFrame(), customer_profile),
+        FakeNetSuiteTransport(generate_netsuite_statuses(customer_profile['billing_account_id'].unique().tolist())),
+        spreadsheet
+    )
+
+def test_refresh_rounds_only_query_due_invoices():
+    """
+    測試 3: 第一輪每個月份一次 NetSuite 查詢並一次寫回，同一時間再執行不查詢任何發票
+    """
+    months = [202504, 202505]
+    environment = _environment(months)
+    spreadsheet = environment.spreadsheet
+    scheduler = RefreshScheduler()
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()), \
+            mock.patch.object(Config, 'PAYMENT_LOOKBACK_MONTHS', 3):
+        sheets_service = SheetsService()
+        netsuite_service = NetSuiteService()
+
+        spreadsheet.reset_calls()
+        first = status_refresh.refresh_once(sheets_service, netsuite_service, scheduler, now=NOW)
+        assert environment.netsuite.calls == len(months)
+        assert spreadsheet.calls['values_batch_get'] == 1
+        assert spreadsheet.calls['values_batch_update'] == 1
+
+        second = status_refresh.refresh_once(sheets_service, netsuite_service, scheduler, now=NOW + 60)
+        assert environment.netsuite.calls == len(months)
+
+    assert first['due'] > 0 and first['updated'] > 0
+    assert first['requests'] == len(months)
+    # 每個名稱在該月份只有一列：已付款的移出佇列，其餘重新排程
+    assert first['waiting'] == first['due'] - first['updated']
+    assert second == {'waiting': first['waiting'], 'due': 0, 'updated': 0, 'requests': 0}
+    assert status_refresh.sleep_seconds(scheduler, NOW) <= Config.REFRESH_RESYNC_MINUTES * 60
+
+def test_refresh_round_holds_report_lease(tmp_path):
+    """
+    測試 4: 每輪在 Report_{year} lease 內讀取與寫回，其他 process 持有 lease 時不讀取報表也不查詢 NetSuite
+    """
+    environment = _environment([202505])
+    scheduler = RefreshScheduler()
+    lease_manager = LeaseManager(str(tmp_path), poll=0.01, timeout=0.1)
+
+    with fake_services(environment), contextlib.redirect_stdout(io.StringIO()), \
+            mock.patch.object(Config, 'PAYMENT_LOOKBACK_MONTHS', 3):
+        sheets_service = SheetsService()
+        netsuite_service = NetSuiteService()
+        environment.spreadsheet.reset_calls()
+
+        with LeaseManager(str(tmp_path)).hold("Report_2025"):
+            with pytest.raises(LeaseTimeout):
+                status_refresh.refresh_once(sheets_service, netsuite_service, scheduler, NOW, lease_manager)
+        assert environment.spreadsheet.calls['values_batch_get'] == 0
+        assert environment.netsuite.calls == 0
+
+        summary = status_refresh.refresh_once(sheets_service, netsuite_service, scheduler, NOW, lease_manager)
+
+    assert summary['updated'] > 0
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+測試 waiting 記錄與 (月份, billing_account_name) 列號索引
+成本：0，不呼叫外部 API (pipeline 以 benchmarks.fakes 取代)
+"""
+
+import contextlib
+import io
+from unittest import mock
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeBigQueryClient, FakeEnvironment, FakeNetSuiteTransport, FakeSpreadsheet, fake_services
+from benchmarks.synthetic_data import generate_billing_aggregated, generate_customer_profile, generate_report_rows
+from config import Config
+from utils.waiting_records import WaitingRecord, WaitingRecordIndex
+import check_payment
+import main
+
+def test_waiting_record_dict_access():
+    """
+    測試 1: WaitingRecord 以 __slots__ 保存，仍可用 record['month'] 讀取
+    """
+    record = WaitingRecord(5, '202505', 'Account A')
+
+    assert record['row_number'] == 5
+    assert record['month'] == record.month == '202505'
+    assert record['current_status'] == 'waiting'
+    assert not hasattr(record, '__dict__')
+    with pytest.raises(KeyError):
+        record['missing']
+
+def test_index_groups_once_and_builds_updates():
+    """
+    測試 2: 同月份同名稱的列歸在一起，略過的月份與空月份不列入；更新清單依索引產生
+    """
+    records = [
+        WaitingRecord(2, '202504', 'A'),
+        WaitingRecord(3, '202504', 'B'),
+        WaitingRecord(4, '202504', 'A'),
+        WaitingRecord(6, '202505', 'A'),
+        WaitingRecord(7, '202506', 'C'),
+        WaitingRecord(8, '', 'D')
+    ]
+    index = WaitingRecordIndex(records, skip_months=(202506,))
+
+    assert index.months == ['202504', '202505']
+    assert index.names('202504') == ['A', 'B']
+    assert index.rows('202504', 'A') == [2, 4]
+    assert index.rows('202505', 'B') == []
+    assert index.month_record_count('202504') == 3
+    assert index.record_count == 4
+
+    class FakeNetSuite:
+        def get_payment_status_by_names(self, month, names):
+            return {'A': 'Clear', 'B': 'waiting'}
+
+    updates = check_payment.process_month_records(FakeNetSuite(), '202504', index.month_rows('202504'))
+    assert updates == [
+        {'row_number': 2, 'new_status': 'Clear'},
+        {'row_number': 4, 'new_status': 'Clear'}
+    ]
+
+def test_historical_updates_follow_rewritten_rows():
+    """
+    測試 3: 本月區塊不在工作表最後時，重新寫入本月會移動歷史列；付款狀態仍寫入正確的歷史列
+    """
+    current = generate_customer_profile(20, 202505, seed=1)
+    previous = generate_customer_profile(40, 202504, seed=2).iloc[20:].reset_index(drop=True)
+    statuses = {bid: "Open" for bid in current['billing_account_id']}
+    statuses.update({bid: "Paid In Full" for bid in previous['billing_account_id']})
+
+    # 202505 區塊在 202504 區塊之前
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.create_worksheet("Report_2025", generate_report_rows(current, waiting_ratio=1.0) + [
+        [''] * len(Config.OUTPUT_COLUMNS)
+    ] + generate_report_rows(previous, waiting_ratio=1.0)[1:])
+    environment = FakeEnvironment(
+        FakeBigQueryClient(generate_billing_aggregated(20, 202505, seed=1), pd.concat([current, previous])),
+        FakeNetSuiteTransport(statuses), spreadsheet
+    )
+
+    with mock.patch.object(Config, 'CHECKPOINT_DIR', ''), \
+            mock.patch.object(Config, 'REPORT_TARGETS', ''), \
+            mock.patch.object(Config, 'REPORT_SINK', 'sheets'), \
+            mock.patch.object(Config, 'LEASE_DIR', ''), \
+            fake_services(environment), contextlib.redirect_stdout(io.StringIO()):
+        main.run_pipeline(data_month=202505)
+
+    rows = spreadsheet.worksheet("Report_2025").get_all_values()
+    status_by_month = {}
+    for row in rows[1:]:
+        if row[0]:
+            status_by_month.setdefault(row[0], set()).add(row[7])
+    assert status_by_month == {'202504': {'Clear'}, '202505': {'waiting'}}
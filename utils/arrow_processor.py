@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from config import Config
+from utils.data_processor import DataProcessor
+
+CUSTOMER_COLUMNS = [
+    'billing_account_id',
+    'billing_account_name',
+    'referral_company',
+    'referral_share_rate',
+    'salesrep',
+    'edp_type',
+    'month'
+]
+
+BILLING_COLUMNS = ['billing_account_id', 'currency', 'spending', 'month']
+
+class ArrowDataProcessor:
+    """
+    以 Arrow compute 實作的 integrate_data (多執行緒 hash join / kernel)
+    輸出與 DataProcessor (pandas 引擎) 完全相同
+    """
+
+    @staticmethod
+    def integrate_data(billing_data: pd.DataFrame, customer_profile: pd.DataFrame,
+                       payment_status: dict) -> pd.DataFrame:
+        """
+        整合所有資料來源
+        """
+        billing_agg = DataProcessor._prepare_billing_agg(billing_data)
+
+        if billing_agg.empty and customer_profile.empty:
+            return pd.DataFrame(columns=Config.OUTPUT_COLUMNS)
+
+        joined = ArrowDataProcessor._join(billing_agg, customer_profile)
+
+        return ArrowDataProcessor._format_output(
+            joined, payment_status, billing_agg, customer_profile
+        )
+
+    @staticmethod
+    def _join(billing_agg: pd.DataFrame, customer_profile: pd.DataFrame) -> pa.Table:
+        """
+        full outer join customer_profile 與 billing 聚合結果
+        排序與 pandas outer merge 相同 (依 billing_account_id 排序)
+        """
+        if customer_profile.empty:
+            # 只有 billing_data
+            billing = ArrowDataProcessor._to_table(billing_agg, BILLING_COLUMNS)
+            row_count = billing.num_rows
+            for col in CUSTOMER_COLUMNS:
+                if col not in billing.column_names:
+                    col_type = pa.float64() if col == 'referral_share_rate' else pa.string()
+                    billing = billing.append_column(col, pa.nulls(row_count, col_type))
+            return billing
+
+        customer = ArrowDataProcessor._to_table(customer_profile, CUSTOMER_COLUMNS)
+
+        if billing_agg.empty:
+            # 只有 customer_profile
+            row_count = customer.num_rows
+            customer = customer.append_column('currency', pa.nulls(row_count, pa.string()))
+            customer = customer.append_column('spending', pa.nulls(row_count, pa.float64()))
+            return customer
+
+        billing = ArrowDataProcessor._to_table(billing_agg, BILLING_COLUMNS)
+
+        # 記錄原始列順序，讓相同 key 的排序與 pandas 一致
+        customer = customer.append_column(
+            '__customer_row', pa.array(np.arange(customer.num_rows))
+        )
+        billing = billing.append_column(
+            '__billing_row', pa.array(np.arange(billing.num_rows))
+        )
+
+        joined = customer.join(
+            billing,
+            keys='billing_account_id',
+            join_type='full outer',
+            left_suffix='_customer',
+            right_suffix='_billing',
+            coalesce_keys=True
+        )
+
+        order = pc.sort_indices(joined, sort_keys=[
+            ('billing_account_id', 'ascending'),
+            ('__customer_row', 'ascending'),
+            ('__billing_row', 'ascending')
+        ])
+
+        return joined.take(order).drop_columns(['__customer_row', '__billing_row'])
+
+    @staticmethod
+    def _to_table(data: pd.DataFrame, columns: list) -> pa.Table:
+        """
+        只取需要的欄位轉為 Arrow Table，billing_account_id 統一為 large_string
+        """
+        table = pa.Table.from_pandas(
+            data[[c for c in columns if c in data.columns]],
+            preserve_index=False
+        )
+
+        key_index = table.schema.get_field_index('billing_account_id')
+        return table.set_column(
+            key_index,
+            'billing_account_id',
+            pc.cast(table['billing_account_id'], pa.large_string())
+        )
+
+    @staticmethod
+    def _format_output(joined: pa.Table, payment_status: dict,
+                       billing_agg: pd.DataFrame, customer_profile: pd.DataFrame) -> pd.DataFrame:
+        """
+        格式化最終輸出 (欄位與 DataProcessor._format_output 相同)
+        """
+        error_messages = Config.ERROR_MESSAGES
+
+        # 在 customer_profile 但不在 billing_data / 在 billing_data 但不在 customer_profile
+        customer_only = pc.is_null(joined['spending'])
+        billing_only = pc.is_null(joined['billing_account_name'])
+        has_error = pc.or_(customer_only, billing_only)
+
+        customer_only_mask = customer_only.to_numpy(zero_copy_only=False)
+        billing_only_mask = billing_only.to_numpy(zero_copy_only=False)
+
+        output = pd.DataFrame()
+
+        output['Month'] = ArrowDataProcessor._month_column(joined, billing_agg, customer_profile)
+
+        output['Billing Account Name'] = ArrowDataProcessor._fill_string(
+            joined, 'billing_account_name', billing_only,
+            error_messages["NOT_FOUND_CUSTOMER"], error_messages["NULL_VALUE"]
+        )
+
+        output['Currency'] = ArrowDataProcessor._fill_string(
+            joined, 'currency', customer_only,
+            error_messages["NOT_FOUND_BILLING"], error_messages["NULL_VALUE"]
+        )
+
+        # Spending $$$：數值，找不到 billing 的列為錯誤訊息
+        spending = joined['spending'].to_pandas()
+        if customer_only_mask.any():
+            spending = spending.astype(object)
+            spending[customer_only_mask] = error_messages["NOT_FOUND_BILLING"]
+        output['Spending $$$'] = spending
+
+        # Referral share rate：數值，找不到 customer 為錯誤訊息，null 為 not found
+        rate = joined['referral_share_rate'].to_pandas()
+        rate_missing = rate.isna().to_numpy() & ~billing_only_mask
+        if billing_only_mask.any() or rate_missing.any():
+            rate = rate.astype(object)
+            rate[billing_only_mask] = error_messages["NOT_FOUND_CUSTOMER"]
+            rate[rate_missing] = error_messages["NULL_VALUE"]
+        output['Referral share rate'] = rate
+
+        # Profit $$$ = Spending $$$ × Referral share rate，任一邊為錯誤訊息時為 0
+        profit = pc.if_else(
+            has_error,
+            0.0,
+            pc.multiply(
+                pc.cast(joined['spending'], pa.float64()),
+                pc.cast(joined['referral_share_rate'], pa.float64())
+            )
+        )
+        output['Profit $$$'] = profit.to_pandas()
+
+        output['Referral Company'] = ArrowDataProcessor._fill_string(
+            joined, 'referral_company', billing_only,
+            error_messages["NOT_FOUND_CUSTOMER"], error_messages["NULL_VALUE"]
+        )
+
+        output['Customer<>CM'] = ArrowDataProcessor._payment_status_column(
+            joined['billing_account_id'], payment_status
+        )
+
+        output['Sales'] = ArrowDataProcessor._fill_string(
+            joined, 'salesrep', billing_only,
+            error_messages["NOT_FOUND_CUSTOMER"], error_messages["NULL_VALUE"]
+        )
+
+        # EDP status (null 值為空白)
+        output['EDP status'] = ArrowDataProcessor._fill_string(
+            joined, 'edp_type', billing_only,
+            error_messages["NOT_FOUND_CUSTOMER"], ''
+        )
+
+        # 以 billing_account_id 為 index (與 DataProcessor._format_output 相同)
+        output.index = pd.Index(
+            joined['billing_account_id'].to_numpy(zero_copy_only=False), name='billing_account_id'
+        )
+
+        return output
+
+    @staticmethod
+    def _month_column(joined: pa.Table, billing_agg: pd.DataFrame,
+                      customer_profile: pd.DataFrame) -> pd.Series:
+        """
+        Month：使用 customer 的 month，如果沒有則用 billing 的
+        dtype 與 pandas merge 後 fillna 的結果一致
+        """
+        if 'month_customer' not in joined.column_names:
+            source = customer_profile if not customer_profile.empty else billing_agg
+            return ArrowDataProcessor._to_pandas(joined['month'], source['month'].dtype)
+
+        month_customer = ArrowDataProcessor._to_pandas(
+            joined['month_customer'], customer_profile['month'].dtype
+        )
+        month_billing = ArrowDataProcessor._to_pandas(
+            joined['month_billing'], billing_agg['month'].dtype
+        )
+        return month_customer.fillna(month_billing)
+
+    @staticmethod
+    def _to_pandas(column: pa.ChunkedArray, source_dtype) -> pd.Series:
+        """
+        轉回 pandas，來源為 nullable extension dtype (例如 Int64) 時保留原本 dtype
+        """
+        series = column.to_pandas()
+        if isinstance(source_dtype, pd.api.extensions.ExtensionDtype):
+            series = series.astype(source_dtype)
+        return series
+
+    @staticmethod
+    def _fill_string(joined: pa.Table, column: str, error_mask: pa.ChunkedArray,
+                     error_message: str, null_value: str) -> pd.Series:
+        """
+        error_mask 的列填入錯誤訊息，其他 null 值填入 null_value
+        """
+        values = joined[column]
+        if pa.types.is_null(values.type):
+            values = pc.cast(values, pa.string())
+
+        filled = pc.if_else(
+            error_mask,
+            pa.scalar(error_message, type=values.type),
+            pc.fill_null(values, pa.scalar(null_value, type=values.type))
+        )
+        return filled.to_pandas()
+
+    @staticmethod
+    def _payment_status_column(billing_account_ids: pa.ChunkedArray, payment_status: dict) -> pd.Series:
+        """
+        以 billing_account_id 對應付款狀態，找不到為 Invoice Not Found
+        """
+        not_found = Config.ERROR_MESSAGES["INVOICE_NOT_FOUND"]
+
+        if not payment_status:
+            return pd.Series([not_found] * len(billing_account_ids))
+
+        keys = pa.array(list(payment_status.keys()), type=billing_account_ids.type)
+        values = pa.array([str(v) for v in payment_status.values()], type=pa.large_string())
+
+        indices = pc.index_in(billing_account_ids, value_set=keys)
+        statuses = pc.fill_null(pc.take(values, indices), not_found)
+        return statuses.to_pandas()
@@ -0,0 +1,81 @@
+import glob
+import json
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+
+BILLING_EXPORT_COLUMNS = ['billing_account_id', 'currency', 'cost', 'credits', 'month']
+
+def iter_billing_export(path: str, month: int = None, chunk_size: int = 50000):
+    """
+    逐批讀取本地 billing_data 匯出檔 (Parquet / CSV)
+    path: 單一檔案或目錄 (讀取目錄下所有 .parquet / .csv)
+    month: 只保留指定月份的資料
+    Yields: 每批一個 DataFrame
+    """
+    for file_path in _list_export_files(path):
+        if file_path.endswith('.parquet'):
+            chunks = _iter_parquet(file_path, chunk_size)
+        else:
+            chunks = _iter_csv(file_path, chunk_size)
+
+        for chunk in chunks:
+            if month is not None and 'month' in chunk.columns:
+                chunk = chunk[chunk['month'] == month]
+            if not chunk.empty:
+                yield chunk
+
+def _list_export_files(path: str) -> list:
+    """
+    列出匯出檔案
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            glob.glob(os.path.join(path, '*.parquet')) +
+            glob.glob(os.path.join(path, '*.csv'))
+        )
+        if not files:
+            raise FileNotFoundError(f"No .parquet or .csv files in {path}")
+        return files
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Billing export not found: {path}")
+
+    return [path]
+
+def _iter_parquet(file_path: str, chunk_size: int):
+    """
+    以 record batch 逐批讀取 Parquet，只讀取需要的欄位
+    """
+    parquet_file = pq.ParquetFile(file_path)
+    columns = [c for c in BILLING_EXPORT_COLUMNS if c in parquet_file.schema_arrow.names]
+
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+def _iter_csv(file_path: str, chunk_size: int):
+    """
+    逐批讀取 CSV，credits 欄位為 JSON 字串
+    """
+    reader = pd.read_csv(
+        file_path,
+        usecols=lambda c: c in BILLING_EXPORT_COLUMNS,
+        chunksize=chunk_size
+    )
+
+    for chunk in reader:
+        if 'credits' in chunk.columns:
+            chunk['credits'] = chunk['credits'].map(_parse_credits)
+        yield chunk
+
+def _parse_credits(value):
+    """
+    解析 CSV 中的 credits JSON 字串
+    """
+    if not isinstance(value, str) or not value:
+        return None
+
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return None
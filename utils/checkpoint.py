@@ -0,0 +1,87 @@
+import os
+import pickle
+import threading
+
+class CheckpointStore:
+    """
+    依資料月份保存 pipeline stage 的輸出，失敗重跑時可略過已完成的 stage
+    base_uri: 本地路徑或 gs://bucket/path (透過 pyarrow.fs 存取)
+    """
+
+    def __init__(self, base_uri: str, resume: bool = False):
+        self.base_uri = base_uri
+        self.resume = resume
+        self.data_month = None
+        self._lock = threading.Lock()
+
+        # pyarrow 只在啟用 checkpoint 時才 import
+        from pyarrow import fs
+        self._fs = fs
+        if '://' in base_uri:
+            self.filesystem, self.base_path = fs.FileSystem.from_uri(base_uri)
+        else:
+            self.filesystem = fs.LocalFileSystem()
+            self.base_path = os.path.abspath(base_uri)
+
+    @property
+    def is_bound(self) -> bool:
+        return self.data_month is not None
+
+    def bind(self, data_month: int):
+        """
+        指定資料月份，非 resume 模式時清除該月份舊的 checkpoint
+        """
+        with self._lock:
+            self.data_month = data_month
+            self.filesystem.create_dir(self._month_path(), recursive=True)
+
+            if not self.resume:
+                self.filesystem.delete_dir_contents(self._month_path(), missing_dir_ok=True)
+            else:
+                completed = self.completed_stages()
+                print(f"Resuming month {data_month} from {self.base_uri} "
+                      f"(completed: {', '.join(completed) or 'none'})")
+
+    def has(self, stage: str) -> bool:
+        """
+        該 stage 是否已完成
+        """
+        info = self.filesystem.get_file_info(self._stage_path(stage))
+        return info.type == self._fs.FileType.File
+
+    def load(self, stage: str):
+        """
+        讀取 stage 輸出
+        """
+        with self.filesystem.open_input_stream(self._stage_path(stage)) as f:
+            return pickle.loads(f.read())
+
+    def save(self, stage: str, value):
+        """
+        保存 stage 輸出 (先寫入暫存檔再搬移，避免留下不完整的檔案)
+        """
+        path = self._stage_path(stage)
+        temp_path = f"{path}.tmp"
+
+        with self.filesystem.open_output_stream(temp_path) as f:
+            f.write(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self.filesystem.move(temp_path, path)
+
+    def completed_stages(self) -> list:
+        """
+        列出該月份已完成的 stage
+        """
+        selector = self._fs.FileSelector(self._month_path(), allow_not_found=True)
+        return sorted(
+            os.path.basename(info.path)[:-len('.pkl')]
+            for info in self.filesystem.get_file_info(selector)
+            if info.path.endswith('.pkl')
+        )
+
+    def _month_path(self) -> str:
+        return f"{self.base_path}/{self.data_month}"
+
+    def _stage_path(self, stage: str) -> str:
+        if not self.is_bound:
+            raise RuntimeError("Checkpoint store is not bound to a data month")
+        return f"{self._month_path()}/{stage}.pkl"
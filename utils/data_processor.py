@@ -1,13 +1,32 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from config import Config
+from utils.telemetry import traced
 
 class DataProcessor:
     @staticmethod
+    @traced("data_processor.integrate_data")
     def integrate_data(billing_data: pd.DataFrame, customer_profile: pd.DataFrame, 
-                      payment_status: dict) -> pd.DataFrame:
+                      payment_status: dict, engine: str = None) -> pd.DataFrame:
         """
         整合所有資料來源
+        engine: pandas / arrow / auto，未指定時使用 Config.DATA_ENGINE
         """
+        engine = engine or Config.DATA_ENGINE
+        
+        if engine == "auto":
+            from utils.execution_planner import choose_engine
+            engine = choose_engine(max(len(billing_data), len(customer_profile)))
+        
+        if engine == "arrow":
+            from utils.arrow_processor import ArrowDataProcessor
+            return ArrowDataProcessor.integrate_data(billing_data, customer_profile, payment_status)
+        
+        if engine != "pandas":
+            raise ValueError(f"Unknown data engine: {engine}")
+        
         # 合併 billing_data 和 customer_profile
         merged_data = DataProcessor._merge_billing_and_customer(
             billing_data, customer_profile
@@ -22,61 +41,59 @@ class DataProcessor:
         return output_data
     
     @staticmethod
+    @traced("data_processor.aggregate_billing_chunks")
+    def aggregate_billing_chunks(billing_chunks) -> pd.DataFrame:
+        """
+        將逐頁讀取的原始 billing_data 累加為每個帳號的聚合結果
+        每頁聚合後即與累計結果合併，記憶體只與帳號數量有關
+        Returns: 與 BigQueryService.get_billing_data_optimized 相同欄位
+        """
+        running = None
+        
+        for chunk in billing_chunks:
+            if chunk.empty:
+                continue
+            
+            chunk_agg = DataProcessor._aggregate_raw_billing(chunk)
+            chunk_agg['record_count'] = chunk.groupby('billing_account_id').size().reindex(
+                chunk_agg['billing_account_id']
+            ).to_numpy()
+            
+            if running is None:
+                running = chunk_agg
+            else:
+                running = pd.concat([running, chunk_agg], ignore_index=True).groupby(
+                    'billing_account_id'
+                ).agg(
+                    cost=('cost', 'sum'),
+                    currency=('currency', 'first'),
+                    month=('month', 'first'),
+                    credits_amount=('credits_amount', 'sum'),
+                    record_count=('record_count', 'sum')
+                ).reset_index()
+        
+        if running is None:
+            return pd.DataFrame()
+        
+        billing_agg = running.rename(columns={
+            'cost': 'total_cost',
+            'credits_amount': 'total_credits'
+        })[['billing_account_id', 'currency', 'total_cost', 'total_credits', 'month', 'record_count']]
+        
+        billing_agg['total_cost'] = billing_agg['total_cost'].fillna(0)
+        billing_agg['total_credits'] = billing_agg['total_credits'].fillna(0)
+        billing_agg['spending'] = billing_agg['total_cost'] + billing_agg['total_credits']
+        
+        return billing_agg
+    
+    @staticmethod
+    @traced("data_processor.merge_billing_and_customer")
     def _merge_billing_and_customer(billing_data: pd.DataFrame, 
                                    customer_profile: pd.DataFrame) -> pd.DataFrame:
         """
         合併 billing_data 和 customer_profile
         """
-        # 檢查 billing_data 是否為聚合後的資料
-        if not billing_data.empty:
-            if 'total_cost' in billing_data.columns:
-                # 已經是聚合後的資料，直接使用，若為原始資料，進行聚合處理
-                billing_agg = billing_data.copy()
-                # 重新命名欄位
-                billing_agg = billing_agg.rename(columns={
-                    'total_cost': 'cost',
-                    'total_credits': 'credits_amount'
-                })
-            else:
-                def extract_credits_amount(credits_data):
-                    """提取 credits 的 amount 值"""
-                    if pd.isna(credits_data) or credits_data is None:
-                        return 0
-                    
-                    # 如果是字典格式
-                    if isinstance(credits_data, dict):
-                        return credits_data.get('amount', 0)
-                    
-                    # 如果是清單格式
-                    if isinstance(credits_data, list):
-                        total = 0
-                        for credit in credits_data:
-                            if isinstance(credit, dict):
-                                total += credit.get('amount', 0)
-                        return total
-                    
-                    # 如果是數值
-                    try:
-                        return float(credits_data)
-                    except (ValueError, TypeError):
-                        return 0
-                
-                # 聚合 billing_data ( billing_account_id )
-                billing_agg = billing_data.groupby('billing_account_id').agg({
-                    'cost': 'sum',
-                    'currency': 'first', 
-                    'month': 'first'
-                }).reset_index()
-                
-                # 處理 credits 欄位
-                billing_data['credits_amount'] = billing_data['credits'].apply(extract_credits_amount)
-                credits_sum = billing_data.groupby('billing_account_id')['credits_amount'].sum()
-                billing_agg['credits_amount'] = billing_agg['billing_account_id'].map(credits_sum).fillna(0)
-            
-            # 計算 Spending $$ = cost + credits.amount
-            billing_agg['spending'] = billing_agg['cost'] + billing_agg['credits_amount']
-        else:
-            billing_agg = pd.DataFrame()
+        billing_agg = DataProcessor._prepare_billing_agg(billing_data)
         
         # 執行合併
         if not billing_agg.empty and not customer_profile.empty:
@@ -108,6 +125,142 @@ class DataProcessor:
         
         return merged
     
+    @staticmethod
+    def _prepare_billing_agg(billing_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        取得每個帳號的 billing 聚合結果，並計算 spending
+        """
+        # 檢查 billing_data 是否為聚合後的資料
+        if not billing_data.empty:
+            if 'total_cost' in billing_data.columns:
+                # 已經是聚合後的資料，直接使用，若為原始資料，進行聚合處理
+                billing_agg = billing_data.copy()
+                # 重新命名欄位
+                billing_agg = billing_agg.rename(columns={
+                    'total_cost': 'cost',
+                    'total_credits': 'credits_amount'
+                })
+            else:
+                # 原始資料：向量化聚合，不修改傳入的 DataFrame
+                billing_agg = DataProcessor._aggregate_raw_billing(billing_data)
+            
+            # 計算 Spending $$ = cost + credits.amount
+            billing_agg['spending'] = billing_agg['cost'] + billing_agg['credits_amount']
+        else:
+            billing_agg = pd.DataFrame()
+        
+        return billing_agg
+    
+    @staticmethod
+    def _aggregate_raw_billing(billing_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        聚合原始 billing_data (每筆 usage 一列)
+        credits 以 Arrow list kernel 攤平後加總，cost / credits 在同一次 groupby 完成
+        Returns: billing_account_id, cost, currency, month, credits_amount
+        """
+        if 'credits' in billing_data.columns:
+            credits_amount = DataProcessor._sum_credits_per_row(billing_data['credits'])
+        else:
+            credits_amount = np.zeros(len(billing_data))
+        
+        # 只取需要的欄位建立新的 DataFrame，避免修改呼叫端資料
+        usage = pd.DataFrame({
+            'billing_account_id': billing_data['billing_account_id'].to_numpy(),
+            'cost': billing_data['cost'].to_numpy(),
+            'currency': billing_data['currency'].to_numpy(),
+            'month': billing_data['month'].to_numpy(),
+            'credits_amount': credits_amount
+        })
+        
+        return usage.groupby('billing_account_id').agg(
+            cost=('cost', 'sum'),
+            currency=('currency', 'first'),
+            month=('month', 'first'),
+            credits_amount=('credits_amount', 'sum')
+        ).reset_index()
+    
+    @staticmethod
+    def _sum_credits_per_row(credits: pd.Series) -> np.ndarray:
+        """
+        計算每一列 credits 的 amount 總和
+        credits 為 list<struct<amount, ...>> (BigQuery REPEATED RECORD)
+        無法轉為 Arrow 型別時退回逐列處理
+        """
+        try:
+            credits_array = pa.array(credits, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return credits.map(DataProcessor._extract_credits_amount).to_numpy(dtype=float)
+        
+        row_count = len(credits_array)
+        credits_type = credits_array.type
+        
+        if pa.types.is_list(credits_type) or pa.types.is_large_list(credits_type):
+            value_type = credits_type.value_type
+            if not (pa.types.is_struct(value_type) and value_type.get_field_index('amount') >= 0):
+                return np.zeros(row_count)
+            
+            # explode：攤平 credits，並記錄每個 credit 所屬的列
+            flat_credits = pc.list_flatten(credits_array)
+            parent_rows = pc.list_parent_indices(credits_array)
+            amounts = DataProcessor._amount_to_float(pc.struct_field(flat_credits, 'amount'))
+            
+            # groupby 列號加總
+            return np.bincount(
+                parent_rows.to_numpy(zero_copy_only=False),
+                weights=amounts,
+                minlength=row_count
+            )
+        
+        if pa.types.is_struct(credits_type):
+            if credits_type.get_field_index('amount') < 0:
+                return np.zeros(row_count)
+            return DataProcessor._amount_to_float(pc.struct_field(credits_array, 'amount'))
+        
+        if pa.types.is_null(credits_type):
+            return np.zeros(row_count)
+        
+        try:
+            return DataProcessor._amount_to_float(credits_array)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return credits.map(DataProcessor._extract_credits_amount).to_numpy(dtype=float)
+    
+    @staticmethod
+    def _amount_to_float(amounts: pa.Array) -> np.ndarray:
+        """
+        將 amount 轉為 float，null 視為 0
+        """
+        amounts = pc.fill_null(pc.cast(amounts, pa.float64()), 0.0)
+        return amounts.to_numpy(zero_copy_only=False)
+    
+    @staticmethod
+    def _extract_credits_amount(credits_data) -> float:
+        """
+        提取單列 credits 的 amount 值 (非 Arrow 相容資料的備用方法)
+        """
+        if credits_data is None:
+            return 0
+        
+        # 如果是字典格式
+        if isinstance(credits_data, dict):
+            return credits_data.get('amount', 0) or 0
+        
+        # 如果是清單格式
+        if isinstance(credits_data, (list, tuple, np.ndarray)):
+            total = 0
+            for credit in credits_data:
+                if isinstance(credit, dict):
+                    total += credit.get('amount', 0) or 0
+            return total
+        
+        if pd.isna(credits_data):
+            return 0
+        
+        # 如果是數值
+        try:
+            return float(credits_data)
+        except (ValueError, TypeError):
+            return 0
+    
     @staticmethod
     def _handle_data_inconsistency(merged_data: pd.DataFrame) -> pd.DataFrame:
         """
@@ -118,20 +271,40 @@ class DataProcessor:
         
         # 在 customer_profile 但不在 billing_data
         mask_customer_only = merged_data['spending'].isna()
-        merged_data.loc[mask_customer_only, 'spending'] = Config.ERROR_MESSAGES["NOT_FOUND_BILLING"]
-        merged_data.loc[mask_customer_only, 'currency'] = Config.ERROR_MESSAGES["NOT_FOUND_BILLING"]
+        for col in ['spending', 'currency']:
+            DataProcessor._fill_error_message(
+                merged_data, mask_customer_only, col, Config.ERROR_MESSAGES["NOT_FOUND_BILLING"]
+            )
         
         # 在 billing_data 但不在 customer_profile  
         mask_billing_only = merged_data['billing_account_name'].isna()
         for col in ['billing_account_name', 'referral_company', 'salesrep', 'edp_type']:
-            merged_data.loc[mask_billing_only, col] = Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+            DataProcessor._fill_error_message(
+                merged_data, mask_billing_only, col, Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+            )
         
         # 如果在 billing_data 但不在 customer_profile，應該顯示錯誤訊息
-        merged_data.loc[mask_billing_only, 'referral_share_rate'] = Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+        DataProcessor._fill_error_message(
+            merged_data, mask_billing_only, 'referral_share_rate', Config.ERROR_MESSAGES["NOT_FOUND_CUSTOMER"]
+        )
         
         return merged_data
     
     @staticmethod
+    def _fill_error_message(merged_data: pd.DataFrame, mask: pd.Series, column: str, message: str):
+        """
+        將 mask 選到的儲存格填入錯誤訊息
+        數值欄位先轉為 object，避免新版 pandas 拒絕寫入字串
+        """
+        if not mask.any():
+            return
+        
+        if merged_data[column].dtype != object:
+            merged_data[column] = merged_data[column].astype(object)
+        merged_data.loc[mask, column] = message
+    
+    @staticmethod
+    @traced("data_processor.add_payment_status")
     def _add_payment_status(merged_data: pd.DataFrame, payment_status: dict) -> pd.DataFrame:
         """
         加入付款狀態資訊
@@ -147,6 +320,7 @@ class DataProcessor:
         return merged_data
     
     @staticmethod
+    @traced("data_processor.format_output")
     def _format_output(merged_data: pd.DataFrame) -> pd.DataFrame:
         """
         格式化最終輸出
@@ -210,6 +384,9 @@ class DataProcessor:
         # EDP status (null 值為空白)
         output['EDP status'] = merged_data['edp_type'].fillna('')
         
+        # 以 billing_account_id 為 index (不寫入工作表，供 BigQuery 報表表 upsert 使用)
+        output.index = pd.Index(merged_data['billing_account_id'].to_numpy(), name='billing_account_id')
+        
         return output
     
     @staticmethod
@@ -0,0 +1,163 @@
+import math
+from config import Config
+
+# 取得容器記憶體上限 (Cloud Run 以 cgroup 限制記憶體，v2 / v1)
+CGROUP_MEMORY_FILES = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+# 無法偵測時使用的上限 (Cloud Run 預設 512 MiB)
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+MB = 1024 * 1024
+
+# 表格 metadata 無法取得時，每列的 BigQuery 儲存大小
+DEFAULT_ROW_BYTES = 200
+# DataFrame (object 字串欄位、credits 陣列) 相對於 BigQuery 儲存大小的膨脹倍數
+PANDAS_EXPANSION = 4.0
+# BigQuery 聚合後每個帳號的 billing 列 (id、currency、4 個數值欄位) 在 DataFrame 中的大小
+AGGREGATED_ROW_BYTES = 250
+# 整合時同時存在的資料副本數 (merge、付款狀態、輸出格式)：pandas 每一步複製，arrow 以欄位運算
+INTEGRATION_COPIES = {"pandas": 3.0, "arrow": 1.5}
+# 串流模式每頁最多使用的記憶體比例，與最小頁大小
+PAGE_BUDGET_SHARE = 0.25
+MIN_PAGE_SIZE = 1000
+# NetSuite 請求的 billing_account_ids 參數每個帳號的長度 (XXXXXX-XXXXXX-XXXXXX 加上 URL 編碼的逗號)
+ENCODED_ID_BYTES = 23
+MIN_NETSUITE_CHUNK = 50
+
+def detect_memory_limit() -> int:
+    """
+    可用的記憶體上限 (bytes)：MEMORY_LIMIT_MB 指定時使用該值，否則讀取 cgroup 限制
+    """
+    if Config.MEMORY_LIMIT_MB > 0:
+        return Config.MEMORY_LIMIT_MB * MB
+
+    for path in CGROUP_MEMORY_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # 未限制時為 max (v2) 或接近 2^63 的數值 (v1)
+        if value.isdigit() and int(value) < 1 << 50:
+            return int(value)
+
+    return DEFAULT_MEMORY_LIMIT_MB * MB
+
+def memory_budget() -> int:
+    """
+    資料可使用的記憶體 (bytes)，其餘保留給 interpreter、套件與 API 回應
+    """
+    return int(detect_memory_limit() * Config.MEMORY_BUDGET_RATIO)
+
+def row_bytes(table_stats: dict, table_name: str) -> float:
+    """
+    表格每列的平均儲存大小 (bytes)，取自表格 metadata
+    """
+    stats = (table_stats or {}).get(table_name) or {}
+    if stats.get('num_rows') and stats.get('num_bytes'):
+        return stats['num_bytes'] / stats['num_rows']
+    return DEFAULT_ROW_BYTES
+
+def estimate_integration_bytes(engine: str, account_count: int, customer_row_bytes: float = DEFAULT_ROW_BYTES) -> int:
+    """
+    整合 account_count 個帳號時的記憶體用量估計 (bytes)
+    """
+    input_bytes = account_count * (AGGREGATED_ROW_BYTES + customer_row_bytes * PANDAS_EXPANSION)
+    return int(input_bytes * INTEGRATION_COPIES[engine])
+
+def choose_engine(account_count: int, customer_row_bytes: float = DEFAULT_ROW_BYTES, budget: int = None) -> str:
+    """
+    DATA_ENGINE=auto 時的運算引擎：pandas 的估計用量在預算內時使用 pandas，否則使用 arrow
+    """
+    if Config.DATA_ENGINE != "auto":
+        return Config.DATA_ENGINE
+    budget = memory_budget() if budget is None else budget
+    if estimate_integration_bytes("pandas", account_count, customer_row_bytes) <= budget:
+        return "pandas"
+    return "arrow"
+
+class ExecutionPlan:
+    """
+    一個月份的執行方式：billing_data 讀取模式與頁大小、整合引擎、NetSuite 分批大小與同時請求數
+    """
+
+    def __init__(self, billing_mode: str, page_size: int, engine: str, netsuite_chunk_size: int,
+                 netsuite_workers: int, estimated_bytes: int, budget_bytes: int, reasons: list = None):
+        self.billing_mode = billing_mode
+        self.page_size = page_size
+        self.engine = engine
+        self.netsuite_chunk_size = netsuite_chunk_size
+        self.netsuite_workers = netsuite_workers
+        self.estimated_bytes = estimated_bytes
+        self.budget_bytes = budget_bytes
+        self.reasons = reasons or []
+
+    @property
+    def streaming(self) -> bool:
+        return self.billing_mode == "streaming"
+
+    @property
+    def fits(self) -> bool:
+        return self.estimated_bytes <= self.budget_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            'billing_mode': self.billing_mode,
+            'page_size': self.page_size,
+            'engine': self.engine,
+            'netsuite_chunk_size': self.netsuite_chunk_size,
+            'netsuite_workers': self.netsuite_workers,
+            'estimated_mb': round(self.estimated_bytes / MB, 1),
+            'budget_mb': round(self.budget_bytes / MB, 1),
+            'reasons': self.reasons
+        }
+
+    def describe(self) -> str:
+        billing = f"streaming (page size {self.page_size:,})" if self.streaming else "aggregated (BigQuery pushdown)"
+        return (
+            f"billing {billing}, engine {self.engine}, "
+            f"NetSuite {self.netsuite_chunk_size:,} ids x {self.netsuite_workers} worker(s), "
+            f"estimated {self.estimated_bytes / MB:,.1f} MB of {self.budget_bytes / MB:,.1f} MB budget"
+        )
+
+def plan_execution(record_counts: tuple, table_stats: dict = None, budget: int = None) -> ExecutionPlan:
+    """
+    依該月份的預期列數 (billing_data, customer_profile) 與表格 metadata 選擇執行方式
+    BILLING_MODE / DATA_ENGINE 明確指定時使用指定的值，auto 時依記憶體預算選擇
+    """
+    billing_count, customer_count = (count or 0 for count in record_counts)
+    budget = memory_budget() if budget is None else budget
+    billing_row_bytes = row_bytes(table_stats, Config.BILLING_DATA_TABLE)
+    customer_row_bytes = row_bytes(table_stats, Config.CUSTOMER_PROFILE_TABLE)
+    reasons = []
+
+    # billing_data：BigQuery 端聚合後的列數只與帳號數有關；本地匯出檔無法在 BigQuery 聚合，只能逐頁讀取
+    billing_mode = Config.BILLING_MODE
+    if billing_mode == "auto":
+        billing_mode = "streaming" if Config.BILLING_EXPORT_PATH else "aggregated"
+        reasons.append("billing export file is streamed" if Config.BILLING_EXPORT_PATH
+                       else "billing aggregated in BigQuery")
+
+    # 頁大小：每頁的原始列不超過預算的 PAGE_BUDGET_SHARE，最大為 BILLING_PAGE_SIZE
+    page_bytes = billing_row_bytes * PANDAS_EXPANSION
+    page_size = int(max(MIN_PAGE_SIZE, min(Config.BILLING_PAGE_SIZE, budget * PAGE_BUDGET_SHARE // page_bytes)))
+    if billing_count:
+        page_size = min(page_size, max(billing_count, MIN_PAGE_SIZE))
+
+    # 整合引擎：帳號數 (聚合後的 billing 列數) 以 customer_profile 列數估計
+    engine = choose_engine(customer_count, customer_row_bytes, budget)
+    if Config.DATA_ENGINE == "auto":
+        reasons.append(f"{engine} engine for {customer_count:,} accounts")
+
+    estimated = estimate_integration_bytes(engine, customer_count, customer_row_bytes)
+    if billing_mode == "streaming":
+        estimated += int(page_size * page_bytes)
+
+    # NetSuite：請求的 URL 長度不超過 NETSUITE_MAX_QUERY_BYTES，分批同時送出
+    chunk_size = Config.NETSUITE_CHUNK_SIZE or max(MIN_NETSUITE_CHUNK, Config.NETSUITE_MAX_QUERY_BYTES // ENCODED_ID_BYTES)
+    chunks = max(1, math.ceil(customer_count / chunk_size))
+    workers = max(1, min(Config.NETSUITE_MAX_WORKERS, Config.HTTP_POOL_SIZE, chunks))
+
+    plan = ExecutionPlan(billing_mode, page_size, engine, chunk_size, workers, estimated, budget, reasons)
+    if not plan.fits:
+        plan.reasons.append("estimate exceeds memory budget")
+    return plan
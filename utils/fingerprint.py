@@ -0,0 +1,35 @@
+import hashlib
+import json
+import pandas as pd
+
+FINGERPRINT_VERSION = 1
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """
+    DataFrame 內容 (含 index 與欄位名稱) 的 hash
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode())
+    if not df.empty:
+        # 混合型別的欄位 (數值與錯誤訊息) 以文字計算
+        normalized = df.apply(lambda s: s.astype(str) if s.dtype == object else s)
+        digest.update(pd.util.hash_pandas_object(normalized, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def compute_fingerprint(table_modified: dict, record_counts, integrated_data: pd.DataFrame,
+                        payment_status: dict) -> str:
+    """
+    月份報表的內容 fingerprint：來源表最後修改時間、列數、整合資料與 NetSuite 付款狀態
+    任一項改變時 fingerprint 就不同
+    Returns: 32 字元 hex (可存入 BigQuery label 或 Sheets developer metadata)
+    """
+    content = {
+        'version': FINGERPRINT_VERSION,
+        'tables': {table: str(modified) for table, modified in sorted(table_modified.items())},
+        'record_counts': [int(count) for count in record_counts],
+        'integrated_data': frame_digest(integrated_data),
+        'payment_status': hashlib.sha256(
+            json.dumps(sorted(payment_status.items())).encode()
+        ).hexdigest()
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:32]
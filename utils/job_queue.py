@@ -0,0 +1,122 @@
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.pipeline import PipelineStopped
+from utils.telemetry import telemetry
+
+class QueueFull(Exception):
+    """
+    等待中的工作已達上限
+    """
+
+class Job:
+    """
+    排入 JobQueue 的一個工作
+    key: 相同 key 的工作依序執行 (例如同一個月份的報表)，不同 key 可同時執行
+    """
+
+    def __init__(self, job_id: str, kind: str, params: dict, key: str):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration_ms': round((self.finished_at - self.started_at) * 1000, 1)
+            if self.finished_at and self.started_at else None
+        }
+
+class JobQueue:
+    """
+    以固定大小的 thread pool 執行工作，等待中的工作超過 max_queued 時拒絕新工作
+    保留最近 history 個工作的結果供查詢
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 20, history: int = 100):
+        self.max_queued = max_queued
+        self.history = history
+        self.jobs = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._workers = workers
+        self._ids = itertools.count(1)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func, params: dict, key: str = None) -> Job:
+        """
+        排入工作，func(**params) 的回傳值為工作結果 (需可轉為 JSON)
+        """
+        with self._lock:
+            if self.counts()['queued'] >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} jobs already queued")
+
+            job = Job(f"{kind}-{next(self._ids)}", kind, params, key or kind)
+            self.jobs[job.id] = job
+            self._key_locks.setdefault(job.key, threading.Lock())
+            self._trim()
+
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    def counts(self) -> dict:
+        counts = {'queued': 0, 'running': 0}
+        for job in list(self.jobs.values()):
+            if job.status in counts:
+                counts[job.status] += 1
+        return counts
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, func):
+        with self._key_locks[job.key]:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = func(**job.params)
+                job.status = "succeeded"
+            except PipelineStopped as e:
+                job.status = "stopped"
+                job.error = str(e)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+
+        # 沒有執行中的工作時清除已收集的 span，避免常駐執行時持續累積
+        with self._lock:
+            if not self.counts()['running']:
+                telemetry.reset()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(len(self.jobs) - self.history, 0)]:
+            del self.jobs[job_id]
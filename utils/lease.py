@@ -0,0 +1,265 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from config import Config
+
+class LeaseTimeout(Exception):
+    """
+    等待 lease 超過時間上限
+    """
+
+class LocalLeaseBackend:
+    """
+    本地目錄的 lease：以 O_CREAT | O_EXCL 建立檔案，同一台機器上的 process 互斥
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.base_dir, f"{name}.lease")
+
+    def try_acquire(self, name: str, holder: dict):
+        """
+        Returns: 釋放時使用的 token，已被其他人持有時回傳 None
+        """
+        try:
+            fd = os.open(self._path(name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            json.dump(holder, f)
+        return holder['id']
+
+    def read(self, name: str):
+        """
+        Returns: (holder, token)，不存在時回傳 (None, None)
+        """
+        try:
+            with open(self._path(name)) as f:
+                holder = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        except ValueError:
+            # 建立後尚未寫入內容，視為剛取得
+            return {'expires_at': time.time() + Config.LEASE_TTL_SECONDS}, None
+        return holder, holder.get('id')
+
+    def renew(self, name: str, token, holder: dict):
+        """
+        以新的 expires_at 改寫仍由 token 持有的 lease (寫入暫存檔後 os.replace)
+        Returns: 之後使用的 token，已被其他人接手時回傳 None
+        """
+        _, current = self.read(name)
+        if current != token:
+            return None
+        temp_path = f"{self._path(name)}.{token}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(holder, f)
+        os.replace(temp_path, self._path(name))
+        return token
+
+    def release(self, name: str, token) -> bool:
+        holder, current = self.read(name)
+        if holder is None or current != token:
+            return False
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+class GCSLeaseBackend:
+    """
+    GCS 的 lease：以 ifGenerationMatch=0 上傳物件 (物件已存在時回傳 412)，Cloud Run task 之間互斥
+    釋放與接手過期 lease 時以 ifGenerationMatch={generation} 刪除，不會刪到其他人剛取得的 lease
+    """
+
+    API = "https://storage.googleapis.com/storage/v1/b"
+    UPLOAD_API = "https://storage.googleapis.com/upload/storage/v1/b"
+    SCOPES = ('https://www.googleapis.com/auth/devstorage.read_write',)
+
+    def __init__(self, base_uri: str):
+        bucket, _, prefix = base_uri[len("gs://"):].partition('/')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            from google.auth.transport.requests import AuthorizedSession
+            from services import clients
+            self._session = AuthorizedSession(clients.credentials(self.SCOPES))
+        return self._session
+
+    def _object(self, name: str) -> str:
+        return f"{self.prefix}/{name}.lease" if self.prefix else f"{name}.lease"
+
+    def try_acquire(self, name: str, holder: dict):
+        response = self.session.post(
+            f"{self.UPLOAD_API}/{self.bucket}/o",
+            params={'uploadType': 'media', 'name': self._object(name), 'ifGenerationMatch': '0'},
+            data=json.dumps(holder),
+            headers={'Content-Type': 'application/json'},
+            timeout=30
+        )
+        if response.status_code == 412:
+            return None
+        response.raise_for_status()
+        return response.json()['generation']
+
+    def read(self, name: str):
+        from urllib.parse import quote
+        response = self.session.get(
+            f"{self.API}/{self.bucket}/o/{quote(self._object(name), safe='')}",
+            params={'alt': 'media'}, timeout=30
+        )
+        if response.status_code == 404:
+            return None, None
+        response.raise_for_status()
+        return response.json(), response.headers.get('x-goog-generation')
+
+    def renew(self, name: str, token, holder: dict):
+        """
+        以 ifGenerationMatch={generation} 覆寫 lease 物件，已被其他人接手時回傳 412
+        Returns: 新的 generation，已被其他人接手時回傳 None
+        """
+        response = self.session.post(
+            f"{self.UPLOAD_API}/{self.bucket}/o",
+            params={'uploadType': 'media', 'name': self._object(name), 'ifGenerationMatch': str(token)},
+            data=json.dumps(holder),
+            headers={'Content-Type': 'application/json'},
+            timeout=30
+        )
+        if response.status_code in (404, 412):
+            return None
+        response.raise_for_status()
+        return response.json()['generation']
+
+    def release(self, name: str, token) -> bool:
+        from urllib.parse import quote
+        response = self.session.delete(
+            f"{self.API}/{self.bucket}/o/{quote(self._object(name), safe='')}",
+            params={'ifGenerationMatch': str(token)}, timeout=30
+        )
+        if response.status_code in (404, 412):
+            return False
+        response.raise_for_status()
+        return True
+
+def create_backend(base_uri: str):
+    """
+    gs://bucket/path 使用 GCS，其他為本地目錄
+    """
+    if base_uri.startswith("gs://"):
+        return GCSLeaseBackend(base_uri)
+    return LocalLeaseBackend(base_uri)
+
+class LeaseManager:
+    """
+    具名的互斥 lease (例如每個 Report_{year} 一個)，供多個 process / Cloud Run task 依序寫入同一份報表
+    lease 有期限 (LEASE_TTL_SECONDS)，持有期間每 ttl / 3 秒延長一次；持有者中斷後不再延長，過期的 lease 可被接手
+    同一個 process 內的 thread 先以 threading.Lock 排隊，再取得跨 process 的 lease
+    """
+
+    def __init__(self, base_uri: str, ttl: float = None, poll: float = None, timeout: float = None):
+        self.base_uri = base_uri
+        self.backend = create_backend(base_uri)
+        self.ttl = ttl or Config.LEASE_TTL_SECONDS
+        self.poll = poll or Config.LEASE_POLL_SECONDS
+        self.timeout = timeout or Config.LEASE_TIMEOUT_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, name: str):
+        """
+        取得 lease 後執行 block，結束時釋放
+        """
+        with self._locks_lock:
+            local_lock = self._locks.setdefault(name, threading.Lock())
+
+        with local_lock:
+            token, holder = self._acquire(name)
+            state = {'token': token, 'holder': holder}
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(name, state, stop), daemon=True)
+            heartbeat.start()
+            try:
+                yield
+            finally:
+                stop.set()
+                heartbeat.join()
+                if state['token'] is None or not self.backend.release(name, state['token']):
+                    print(f"Warning: lease {name} was taken over before release")
+
+    def _heartbeat(self, name: str, state: dict, stop: threading.Event):
+        """
+        持有 lease 期間延長 expires_at，執行時間超過 ttl 的 block 不會被其他人接手
+        """
+        while not stop.wait(self.ttl / 3):
+            holder = {**state['holder'], 'expires_at': time.time() + self.ttl}
+            try:
+                token = self.backend.renew(name, state['token'], holder)
+            except Exception as e:
+                # 暫時性錯誤：下一次再延長 (lease 仍在原本的期限內)
+                print(f"Warning: could not renew lease {name}: {e}")
+                continue
+            if token is None:
+                print(f"Warning: lease {name} was taken over while held")
+                state['token'] = None
+                return
+            state['token'], state['holder'] = token, holder
+
+    def _acquire(self, name: str):
+        """
+        Returns: (token, holder)
+        """
+        deadline = time.time() + self.timeout
+        waited = False
+
+        while True:
+            now = time.time()
+            holder = {'id': uuid.uuid4().hex, 'owner': self.owner, 'acquired_at': now, 'expires_at': now + self.ttl}
+            token = self.backend.try_acquire(name, holder)
+            if token is not None:
+                if waited:
+                    print(f"Acquired lease {name} after {now - deadline + self.timeout:.1f}s")
+                return token, holder
+
+            current, current_token = self.backend.read(name)
+            if current is not None and current_token is not None and current.get('expires_at', 0) < now:
+                print(f"Lease {name} held by {current.get('owner')} expired, taking over")
+                self.backend.release(name, current_token)
+                continue
+
+            if now >= deadline:
+                raise LeaseTimeout(f"Timed out waiting for lease {name} (held by {(current or {}).get('owner')})")
+
+            if not waited:
+                print(f"Waiting for lease {name} (held by {(current or {}).get('owner')})...")
+                waited = True
+            time.sleep(self.poll)
+
+def report_lease(lease_manager: LeaseManager, year: int):
+    """
+    Report_{year} 的寫入 lease，lease_manager 為 None 時不加鎖
+    """
+    if lease_manager is None:
+        return nullcontext()
+    return lease_manager.hold(Config.SHEET_NAME_FORMAT.format(year=year))
+
+def index_lease(lease_manager: LeaseManager):
+    """
+    Report_Index 的寫入 lease (所有年份共用一個)，lease_manager 為 None 時不加鎖
+    """
+    if lease_manager is None:
+        return nullcontext()
+    return lease_manager.hold(Config.REPORT_INDEX_SHEET)
@@ -0,0 +1,172 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils.profiling import profiler
+from utils.telemetry import telemetry
+
+class PipelineStopped(Exception):
+    """
+    stage 判斷不需繼續執行 (例如查無資料)，停止整個 pipeline 但不視為失敗
+    """
+
+class Stage:
+    """
+    pipeline 中的一個步驟
+    func 以 inputs 中各 stage 的輸出作為 keyword 參數呼叫
+    checkpoint: 輸出是否保存到 checkpoint store (resume 時直接讀取)
+    """
+
+    def __init__(self, name: str, func, inputs: tuple = (), checkpoint: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.checkpoint = checkpoint
+
+class Pipeline:
+    """
+    依相依關係執行 stage，彼此獨立的 stage 在 thread pool 中同時執行
+    checkpoint_store: 綁定資料月份後，checkpoint stage 的輸出會被保存
+    """
+
+    def __init__(self, max_workers: int = 4, checkpoint_store=None):
+        self.max_workers = max_workers
+        self.checkpoint_store = checkpoint_store
+        self.stages = {}
+        self.results = {}
+        self.schedule = []
+        self._start_time = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, func, inputs: tuple = (), checkpoint: bool = False):
+        """
+        新增 stage，inputs 必須是已加入的 stage
+        """
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+
+        for dependency in inputs:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+
+        self.stages[name] = Stage(name, func, inputs, checkpoint)
+
+    def run(self) -> dict:
+        """
+        執行所有 stage
+        Returns: {stage_name: output}
+        """
+        self._start_time = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+
+        # profile 時 stage 依序執行，每個 stage 的記憶體峰值與 profile 不混入同時執行的 stage
+        max_workers = 1 if profiler.enabled else self.max_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                while pending or running:
+                    # 送出所有相依 stage 已完成的 stage
+                    for name in list(pending):
+                        stage = pending[name]
+                        if all(dependency in self.results for dependency in stage.inputs):
+                            del pending[name]
+                            # 以目前的 context 執行，stage 的 span 以 run 的 span 為 parent
+                            context = contextvars.copy_context()
+                            running[executor.submit(context.run, self._run_stage, stage)] = name
+
+                    if not running:
+                        raise RuntimeError(f"Unresolvable stages: {', '.join(pending)}")
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        self.results[name] = future.result()
+            except BaseException:
+                # 發生錯誤時不再送出新的 stage，等待執行中的 stage 結束
+                for future in running:
+                    future.cancel()
+                raise
+            finally:
+                self.print_schedule()
+
+        return self.results
+
+    def _run_stage(self, stage: Stage):
+        """
+        執行單一 stage 並記錄時間
+        """
+        kwargs = {dependency: self.results[dependency] for dependency in stage.inputs}
+        started = time.perf_counter() - self._start_time
+        status = "ok"
+
+        store = self.checkpoint_store
+        use_checkpoint = stage.checkpoint and store is not None and store.is_bound
+
+        try:
+            with telemetry.span(f"stage.{stage.name}") as span, profiler.stage(stage.name):
+                if use_checkpoint and store.resume and store.has(stage.name):
+                    status = "resumed"
+                    span.set(resumed=True)
+                    return store.load(stage.name)
+
+                result = stage.func(**kwargs)
+                if use_checkpoint:
+                    store.save(stage.name, result)
+                return result
+        except PipelineStopped:
+            status = "stopped"
+            raise
+        except Exception:
+            status = "failed"
+            raise
+        finally:
+            finished = time.perf_counter() - self._start_time
+            with self._lock:
+                self.schedule.append({
+                    'stage': stage.name,
+                    'start': started,
+                    'end': finished,
+                    'duration': finished - started,
+                    'status': status,
+                    'thread': threading.current_thread().name
+                })
+
+    def critical_path(self) -> tuple:
+        """
+        以實際執行時間計算 critical path
+        Returns: (總秒數, [stage 名稱])
+        """
+        durations = {entry['stage']: entry['duration'] for entry in self.schedule}
+        longest = {}
+
+        def path_to(name):
+            if name not in longest:
+                best = (0.0, [])
+                for dependency in self.stages[name].inputs:
+                    if dependency in durations:
+                        candidate = path_to(dependency)
+                        if candidate[0] > best[0]:
+                            best = candidate
+                longest[name] = (best[0] + durations[name], best[1] + [name])
+            return longest[name]
+
+        paths = [path_to(name) for name in durations]
+        return max(paths, key=lambda p: p[0]) if paths else (0.0, [])
+
+    def print_schedule(self):
+        """
+        輸出每個 stage 的執行時間表
+        """
+        if not self.schedule:
+            return
+
+        wall_time = max(entry['end'] for entry in self.schedule)
+        critical_time, critical_stages = self.critical_path()
+
+        print("\nPipeline schedule:")
+        print(f"  {'stage':<20} {'start':>8} {'end':>8} {'duration':>9}  {'status':<8} thread")
+        for entry in sorted(self.schedule, key=lambda e: e['start']):
+            print(f"  {entry['stage']:<20} {entry['start']:>7.2f}s {entry['end']:>7.2f}s "
+                  f"{entry['duration']:>8.2f}s  {entry['status']:<8} {entry['thread']}")
+        print(f"  Wall time: {wall_time:.2f}s, critical path: {critical_time:.2f}s "
+              f"({' -> '.join(critical_stages)})")
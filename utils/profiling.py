@@ -0,0 +1,231 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from config import Config
+
+PROFILE_MODES = ("off", "cprofile", "sample")
+
+class _StackSampler:
+    """
+    以固定間隔取樣單一 thread 的 call stack (不需額外套件的 sampling profiler)
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top_functions(self, limit: int) -> list:
+        """
+        Returns: [(函式, self 取樣數, 累計取樣數)]
+        """
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+
+        return [
+            (name, self_counts[name], total_counts[name])
+            for name, _ in self_counts.most_common(limit)
+        ]
+
+class Profiler:
+    """
+    依 stage 產生 profile (cProfile 或取樣) 與 tracemalloc 記憶體峰值
+    tracemalloc 的峰值與 cProfile 都是整個 process 共用，啟用時 stage 依序執行 (一次只 profile 一個 stage)
+    mode: off / cprofile / sample
+    """
+
+    def __init__(self, mode: str = "off", output_dir: str = "profiles", top_n: int = 15):
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.summaries = []
+        self._lock = threading.Lock()
+        # 執行中的 stage (同一時間只有一個)，巢狀的 stage 併入外層 stage
+        self._stage_lock = threading.RLock()
+        self._active_stage = None
+        self.mode = "off"
+        self.configure(mode)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def configure(self, mode: str = None, output_dir: str = None):
+        """
+        設定模式 (CLI 參數優先於環境變數)
+        """
+        if output_dir:
+            self.output_dir = output_dir
+
+        if mode is None:
+            return
+
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode} (expected one of {', '.join(PROFILE_MODES)})")
+
+        self.mode = mode
+        if self.enabled:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(1)
+            print(f"Profiling enabled ({mode}), output: {self.output_dir}")
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        對一個 stage 做 profile，結束時輸出 dump 與摘要
+        其他 thread 的 stage 等待目前的 stage 結束，記憶體峰值與 profile 只包含這個 stage
+        """
+        if not self.enabled:
+            yield
+            return
+
+        with self._stage_lock:
+            if self._active_stage is not None:
+                print(f"Warning: stage {name} runs inside {self._active_stage}, profiled as part of it")
+                yield
+                return
+
+            self._active_stage = name
+            try:
+                with self._profile_stage(name):
+                    yield
+            finally:
+                self._active_stage = None
+
+    @contextmanager
+    def _profile_stage(self, name: str):
+        profile = None
+        sampler = None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # 其他 profiler 已在執行 (例如外部工具)，只記錄記憶體
+                print(f"Warning: cProfile unavailable for stage {name} ({e}), recording memory only")
+                profile = None
+        else:
+            sampler = _StackSampler(threading.get_ident(), Config.PROFILE_SAMPLE_INTERVAL)
+            sampler.start()
+
+        memory_start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+            if sampler is not None:
+                sampler.stop()
+
+            _, memory_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            self._write_stage(name, elapsed, memory_start, memory_peak, profile, sampler, snapshot)
+
+    def _write_stage(self, name: str, elapsed: float, memory_start: int, memory_peak: int,
+                     profile, sampler, snapshot):
+        """
+        輸出 stage 的 profile dump、記憶體配置與前幾名函式摘要
+        """
+        safe_name = name.replace('/', '_').replace('.', '_')
+        lines = [
+            f"== {name}: {elapsed:.3f}s, memory peak {memory_peak / 1024 / 1024:.1f} MiB "
+            f"(+{max(memory_peak - memory_start, 0) / 1024 / 1024:.1f} MiB)"
+        ]
+
+        if profile is not None:
+            profile.dump_stats(os.path.join(self.output_dir, f"{safe_name}.prof"))
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            lines.extend(
+                line for line in stream.getvalue().splitlines()
+                if line.strip() and not line.startswith('   Ordered by')
+            )
+
+        if sampler is not None:
+            with open(os.path.join(self.output_dir, f"{safe_name}.stacks.txt"), 'w') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            lines.append(f"   {sampler.samples} samples, top functions (self / total):")
+            for function, self_count, total_count in sampler.top_functions(self.top_n):
+                lines.append(f"   {self_count:>6} {total_count:>6}  {function}")
+
+        lines.append("   top allocations:")
+        for stat in snapshot.statistics('lineno')[:5]:
+            lines.append(f"   {stat.size / 1024:>10.1f} KiB  {stat.traceback[0]}")
+
+        summary = '\n'.join(lines)
+        with open(os.path.join(self.output_dir, f"{safe_name}.txt"), 'w') as f:
+            f.write(summary + '\n')
+
+        with self._lock:
+            self.summaries.append(summary)
+
+    def write_summary(self):
+        """
+        輸出所有 stage 的摘要 (概覽只保留每個 stage 前幾行)
+        """
+        if not self.enabled or not self.summaries:
+            return
+
+        with self._lock:
+            summaries = list(self.summaries)
+
+        with open(os.path.join(self.output_dir, "summary.txt"), 'w') as f:
+            f.write('\n\n'.join(summaries) + '\n')
+
+        print("\nProfile summary:")
+        for summary in summaries:
+            print('\n'.join(summary.splitlines()[:self.top_n // 2 + 4]))
+        print(f"Profile dumps written to {self.output_dir}")
+
+profiler = Profiler(Config.PROFILE_MODE, Config.PROFILE_DIR)
+
+def add_profile_arguments(parser):
+    """
+    加入 --profile / --profile-dir CLI 參數 (未指定時使用 PROFILE / PROFILE_DIR 環境變數)
+    """
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=None,
+                        help="profile each stage with cProfile or a stack sampler, plus tracemalloc")
+    parser.add_argument('--profile-dir', default=None, help="directory for profile dumps")
@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import json
+import os
+from datetime import datetime
+from config import Config
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+def invoice_issued_at(month: str) -> float:
+    """
+    月份 (YYYYMM) 的發票開立時間 (次月 1 日，timestamp)
+    """
+    year, month_number = divmod(int(float(month)), 100)
+    year, month_number = (year + 1, 1) if month_number == 12 else (year, month_number + 1)
+    return datetime(year, month_number, 1).timestamp()
+
+def next_interval(issued_at: float, checks: int, now: float) -> float:
+    """
+    下次檢查的間隔 (秒)：發票越舊、已檢查且未付款的次數越多，間隔越長
+    基準為 REFRESH_MIN_INTERVAL_HOURS，發票每舊一個月多一倍，每次未付款再加倍，最長 REFRESH_MAX_INTERVAL_HOURS
+    """
+    age_months = max(now - issued_at, 0) / (30 * DAY)
+    interval = Config.REFRESH_MIN_INTERVAL_HOURS * HOUR * (1 + age_months) * 2 ** min(checks, 10)
+    return min(interval, Config.REFRESH_MAX_INTERVAL_HOURS * HOUR)
+
+class InvoiceState:
+    """
+    一筆 waiting 發票 (月份 + billing_account_name) 的檢查紀錄
+    """
+    __slots__ = ('month', 'name', 'issued_at', 'next_check', 'last_checked', 'checks')
+
+    def __init__(self, month: str, name: str, next_check: float, last_checked: float = None, checks: int = 0):
+        self.month = month
+        self.name = name
+        self.issued_at = invoice_issued_at(month)
+        self.next_check = next_check
+        self.last_checked = last_checked
+        self.checks = checks
+
+    @property
+    def key(self) -> tuple:
+        return (self.month, self.name)
+
+    def to_dict(self) -> dict:
+        return {
+            'month': self.month,
+            'name': self.name,
+            'next_check': self.next_check,
+            'last_checked': self.last_checked,
+            'checks': self.checks
+        }
+
+class RefreshScheduler:
+    """
+    waiting 發票的優先佇列 (heapq，依下次檢查時間排序)
+    新發現的發票立即檢查；檢查後仍未付款的依 next_interval 重新排程，已付款的移出佇列
+    """
+
+    def __init__(self):
+        self.invoices = {}
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.invoices)
+
+    def sync(self, waiting: dict, now: float):
+        """
+        以報表目前的 waiting 記錄更新佇列
+            waiting: {month: [billing_account_name, ...]}
+        報表中已不是 waiting 的發票 (人工更新或已付款) 移出佇列
+        """
+        current = {(month, name) for month, names in waiting.items() for name in names}
+
+        for key in list(self.invoices):
+            if key not in current:
+                del self.invoices[key]
+
+        for month, names in waiting.items():
+            for name in names:
+                if (month, name) not in self.invoices:
+                    self._push(InvoiceState(month, name, next_check=now))
+
+    def pop_due(self, now: float) -> list:
+        """
+        取出所有已到檢查時間的發票
+        Returns: [InvoiceState]，依檢查時間排序
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_check, _, key = heapq.heappop(self._heap)
+            invoice = self.invoices.get(key)
+            # 重新排程或已移除的舊項目直接略過
+            if invoice is not None and invoice.next_check == next_check:
+                due.append(invoice)
+        return due
+
+    def record_check(self, invoice: InvoiceState, settled: bool, now: float, failed: bool = False):
+        """
+        記錄檢查結果：已付款時移出佇列，否則依年齡與檢查次數重新排程
+        failed: API 錯誤，不增加檢查次數，以最短間隔重試
+        """
+        if settled:
+            self.invoices.pop(invoice.key, None)
+            return
+
+        if not failed:
+            invoice.checks += 1
+        invoice.last_checked = now
+        checks = 0 if failed else invoice.checks
+        invoice.next_check = now + next_interval(now if failed else invoice.issued_at, checks, now)
+        self._push(invoice)
+
+    def next_wakeup(self) -> float:
+        """
+        最早的下次檢查時間，佇列為空時回傳 None
+        """
+        while self._heap:
+            next_check, _, key = self._heap[0]
+            invoice = self.invoices.get(key)
+            if invoice is not None and invoice.next_check == next_check:
+                return next_check
+            heapq.heappop(self._heap)
+        return None
+
+    def save(self, path: str):
+        """
+        保存佇列狀態 (先寫入暫存檔再搬移)
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'invoices': [invoice.to_dict() for invoice in self.invoices.values()]}, f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RefreshScheduler':
+        """
+        讀取保存的佇列狀態，檔案不存在時回傳空的佇列
+        """
+        scheduler = cls()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for item in json.load(f).get('invoices', []):
+                    scheduler._push(InvoiceState(**item))
+        return scheduler
+
+    def _push(self, invoice: InvoiceState):
+        self.invoices[invoice.key] = invoice
+        # 同一時間的項目依加入順序排列
+        heapq.heappush(self._heap, (invoice.next_check, next(self._sequence), invoice.key))
@@ -0,0 +1,222 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """
+    一次外部呼叫或處理步驟的紀錄
+    """
+
+    __slots__ = ('name', 'parent', 'attributes', 'start_time', 'duration',
+                 'rows', 'bytes', 'retries', 'status', 'error', 'thread')
+
+    def __init__(self, name: str, parent: str = None, attributes: dict = None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.rows = None
+        self.bytes = None
+        self.retries = 0
+        self.status = "ok"
+        self.error = None
+        self.thread = threading.current_thread().name
+
+    def set(self, rows: int = None, bytes: int = None, **attributes):
+        """
+        設定列數 / 位元組數或其他屬性
+        """
+        if rows is not None:
+            self.rows = int(rows)
+        if bytes is not None:
+            self.bytes = int(bytes)
+        self.attributes.update(attributes)
+
+    def add(self, rows: int = 0, bytes: int = 0, retries: int = 0):
+        """
+        累加列數 / 位元組數 / 重試次數 (分頁讀取或逐筆重試時使用)
+        """
+        if rows:
+            self.rows = (self.rows or 0) + int(rows)
+        if bytes:
+            self.bytes = (self.bytes or 0) + int(bytes)
+        self.retries += retries
+
+    def fail(self, error):
+        """
+        標記為失敗 (例外被呼叫端處理而未往外拋出時使用)
+        """
+        self.status = "error"
+        self.error = str(error)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start': datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+            'duration_ms': round(self.duration * 1000, 2) if self.duration is not None else None,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'status': self.status,
+            'error': self.error,
+            'thread': self.thread,
+            'attributes': self.attributes
+        }
+
+class _NoopSpan(Span):
+    """
+    不在任何 span 中時使用，所有設定都會被忽略
+    """
+
+    def set(self, rows: int = None, bytes: int = None, **attributes):
+        pass
+
+    def add(self, rows: int = 0, bytes: int = 0, retries: int = 0):
+        pass
+
+    def fail(self, error):
+        pass
+
+_NOOP_SPAN = _NoopSpan("noop")
+
+class Telemetry:
+    """
+    收集整個 run 的 span，結束時輸出 JSON 報告
+    每個 span 結束時輸出一行 Cloud Logging 可解析的 JSON log
+    """
+
+    def __init__(self, log_spans: bool = True):
+        self.run_id = os.environ.get("CLOUD_RUN_EXECUTION") or uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.log_spans = log_spans
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        記錄一個 span，例外會標記為 error 並往外拋出
+        """
+        parent = _current_span.get()
+        span = Span(name, parent.name if parent else None, attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+
+        try:
+            yield span
+        except Exception as e:
+            span.fail(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+            if self.log_spans:
+                self._log_span(span)
+
+    def reset(self):
+        """
+        清除已收集的 span (常駐執行時每一輪重新開始)
+        """
+        with self._lock:
+            self.spans = []
+
+    def _log_span(self, span: Span):
+        entry = span.to_dict()
+        log_event(
+            f"span {span.name} {span.status} in {entry['duration_ms']} ms",
+            severity="ERROR" if span.status == "error" else "INFO",
+            run_id=self.run_id,
+            span=entry
+        )
+
+    def summary(self) -> list:
+        """
+        依 span 名稱彙總次數、時間、列數與位元組數
+        """
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+
+        for span in spans:
+            total = totals.setdefault(span.name, {
+                'name': span.name, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'rows': 0, 'bytes': 0, 'retries': 0, 'errors': 0
+            })
+            duration_ms = (span.duration or 0) * 1000
+            total['count'] += 1
+            total['total_ms'] = round(total['total_ms'] + duration_ms, 2)
+            total['max_ms'] = round(max(total['max_ms'], duration_ms), 2)
+            total['rows'] += span.rows or 0
+            total['bytes'] += span.bytes or 0
+            total['retries'] += span.retries
+            total['errors'] += span.status == "error"
+
+        return sorted(totals.values(), key=lambda t: t['total_ms'], reverse=True)
+
+    def report(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+
+        return {
+            'run_id': self.run_id,
+            'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'wall_seconds': round(time.time() - self.started_at, 3),
+            'summary': self.summary(),
+            'spans': spans
+        }
+
+    def write_report(self, path: str):
+        """
+        輸出 JSON 報告
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        print(f"Run report written to {path}")
+
+telemetry = Telemetry(log_spans=os.environ.get("TELEMETRY_LOG", "1") == "1")
+
+def current_span() -> Span:
+    """
+    取得目前的 span (不在 span 中時回傳不做事的 span)
+    """
+    return _current_span.get() or _NOOP_SPAN
+
+def traced(name: str):
+    """
+    decorator：將函式呼叫記錄為 span，回傳值有長度時自動記錄為 rows
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with telemetry.span(name) as span:
+                result = func(*args, **kwargs)
+                if span.rows is None and hasattr(result, '__len__') and not isinstance(result, str):
+                    span.rows = len(result)
+                return result
+        return wrapper
+    return decorator
+
+def log_event(message: str, severity: str = "INFO", **fields):
+    """
+    輸出一行 Cloud Logging 結構化 log (JSON)
+    """
+    entry = {'severity': severity, 'message': message, 'component': 'referral-auto'}
+    entry.update(fields)
+    print(json.dumps(entry, default=str), flush=True)
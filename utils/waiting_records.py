@@ -0,0 +1,80 @@
+class WaitingRecord:
+    """
+    報表中付款狀態為 "waiting" 的一列
+    row_number: 報表列號 (BigQuery 報表表為 (month, billing_account_id))
+    """
+    __slots__ = ('row_number', 'month', 'billing_account_name', 'current_status')
+
+    def __init__(self, row_number, month: str, billing_account_name: str, current_status: str = "waiting"):
+        self.row_number = row_number
+        self.month = month
+        self.billing_account_name = billing_account_name
+        self.current_status = current_status
+
+    def __getitem__(self, key: str):
+        # 相容原本的 dict 形式 (record['month'])
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, WaitingRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return (f"WaitingRecord(row_number={self.row_number!r}, month={self.month!r}, "
+                f"billing_account_name={self.billing_account_name!r})")
+
+class WaitingRecordIndex:
+    """
+    waiting 記錄依 (month, billing_account_name) 分組的列號索引，只掃描記錄一次
+    """
+
+    def __init__(self, records, skip_months: tuple = (), only_months: list = None):
+        """
+        skip_months: 不列入的月份
+        only_months: 只列入這些月份 (None 時不限)
+        """
+        skip_months = {str(month) for month in skip_months}
+        only_months = None if only_months is None else {str(month) for month in only_months}
+        # {month: {billing_account_name: [row_number, ...]}}，保留記錄出現的順序
+        self._rows = {}
+        self.record_count = 0
+
+        for record in records:
+            month = record['month']
+            if not month or month in skip_months or (only_months is not None and month not in only_months):
+                continue
+            names = self._rows.get(month)
+            if names is None:
+                names = self._rows[month] = {}
+            rows = names.get(record['billing_account_name'])
+            if rows is None:
+                names[record['billing_account_name']] = [record['row_number']]
+            else:
+                rows.append(record['row_number'])
+            self.record_count += 1
+
+    @property
+    def months(self) -> list:
+        return list(self._rows)
+
+    def names(self, month: str) -> list:
+        return list(self._rows.get(month, ()))
+
+    def rows(self, month: str, billing_account_name: str) -> list:
+        return self._rows.get(month, {}).get(billing_account_name, [])
+
+    def month_rows(self, month: str) -> dict:
+        """
+        Returns: {billing_account_name: [row_number, ...]}
+        """
+        return self._rows.get(month, {})
+
+    def month_record_count(self, month: str) -> int:
+        return sum(len(rows) for rows in self.month_rows(month).values())
+
+    def __len__(self) -> int:
+        return len(self._rows)